@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# Benchmark Classify.assignPlacement on a large number of synthetic placement
+# groups drawn from the taxonomy of a reference package.
+
+import os
+import sys
+import time
+import random
+import argparse
+import logging
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+
+from graftm.classify import Classify
+
+DEFAULT_TAXONOMY = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..',
+                                'test', 'data', '61_otus.gpkg', '61_otus.refpkg',
+                                '61_otus_taxonomy.csv')
+
+def synthetic_jplace(tax_ids, num_groups, num_distinct, max_placements, seed):
+    '''Return a parsed jplace with num_groups placement groups, made up of
+    num_distinct distinct sets of placements, as after clustering reads'''
+    rng = random.Random(seed)
+    distinct = []
+    for _ in range(num_distinct):
+        lwrs = [rng.random() for _ in range(rng.randint(1, max_placements))]
+        total = sum(lwrs)
+        distinct.append([[rng.choice(tax_ids), lwr/total] for lwr in lwrs])
+    placements = [{'p': rng.choice(distinct), 'nm': [['read%i_0' % i, 1]]}
+                  for i in range(num_groups)]
+    return {'fields': ['classification', 'like_weight_ratio'],
+            'placements': placements}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark classification of placement groups')
+    parser.add_argument('--taxonomy', help='refpkg taxonomy CSV file', default=DEFAULT_TAXONOMY)
+    parser.add_argument('--groups', type=int, help='number of placement groups', default=1000000)
+    parser.add_argument('--distinct', type=int, help='number of distinct placement sets among the groups', default=10000)
+    parser.add_argument('--max_placements', type=int, help='maximum placements per group', default=4)
+    parser.add_argument('--cutoff', type=float, help='placements cutoff', default=0.75)
+    parser.add_argument('--resolve_placements', action='store_true', default=False)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR, format='%(levelname)s: %(message)s')
+
+    classify = Classify(args.taxonomy)
+    jplace = synthetic_jplace(list(classify.taxonomy.keys()), args.groups,
+                              args.distinct, args.max_placements, args.seed)
+    start = time.time()
+    classify.assignPlacement(jplace, args.cutoff, args.resolve_placements)
+    elapsed = time.time() - start
+    print("Classified %i placement groups in %.2f seconds (%.0f groups/second)" % (
+        args.groups, elapsed, args.groups/elapsed))
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# Benchmark graftM graft end to end on synthetic metagenomes (see
+# synthetic_metagenome.py), reporting the wall time, reads per second and
+# peak memory of each pipeline stage from the profile.json graft writes,
+# and the time spent in each external program. Results are compared against
+# baselines stored in a JSON file, which are recorded with
+# --update_baselines, and the exit status is 1 if any stage is slower or
+# uses more memory than its baseline by more than --tolerance.
+
+import os
+import sys
+import json
+import argparse
+import logging
+import tempfile
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+
+import synthetic_metagenome
+from graftm.profiler import Profiler
+
+path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'test', 'data')
+path_to_script = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'bin', 'graftM')
+
+DEFAULT_GRAFTM_PACKAGES = [os.path.join(path_to_data, 'mcrA.gpkg'),
+                           os.path.join(path_to_data, '61_otus.gpkg')]
+DEFAULT_BASELINES = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'graft_baselines.json')
+
+TOTAL = 'total'
+
+def benchmark_name(graftm_package, num_reads, sequence_format, layout, compress):
+    return '%s:%i:%s:%s%s' % (os.path.basename(graftm_package.rstrip('/')), num_reads,
+                              sequence_format, layout, ':gz' if compress else '')
+
+def run_graft(graftm_package, paths, layout, output_directory, threads, extra_arguments):
+    '''Run graftM graft, returning the profile it wrote, with an extra
+    "total" stage for the whole graftM process'''
+    if layout == synthetic_metagenome.PAIRED_LAYOUT:
+        inputs = '--forward %s --reverse %s' % tuple(paths)
+    elif layout == synthetic_metagenome.INTERLEAVED_LAYOUT:
+        inputs = '--interleaved %s' % paths[0]
+    else:
+        inputs = '--forward %s' % paths[0]
+    profiler = Profiler()
+    profiler.run("%s graft --graftm_package %s %s --output_directory %s --threads %i "
+                 "--force --verbosity 2 %s" % (
+                     path_to_script, graftm_package, inputs, output_directory, threads,
+                     extra_arguments))
+    with open(os.path.join(output_directory, 'profile.json')) as f:
+        profile = json.load(f)
+    graftm_process = profiler.commands[0]
+    profile['stages'].append({'stage': TOTAL,
+                              'sample': None,
+                              'wall_seconds': graftm_process['wall_seconds'],
+                              'peak_rss_kb': graftm_process['peak_rss_kb']})
+    return profile
+
+def summarise_profile(profile, num_reads):
+    '''Return a dict of stage name to wall_seconds, reads_per_second and
+    peak_rss_kb, summed (or for memory, maximised) over samples, and a dict
+    of external program to total wall time'''
+    stages = {}
+    for stage in profile['stages']:
+        summary = stages.setdefault(stage['stage'], {'wall_seconds': 0, 'peak_rss_kb': 0})
+        summary['wall_seconds'] += stage['wall_seconds']
+        summary['peak_rss_kb'] = max(summary['peak_rss_kb'], stage['peak_rss_kb'])
+    for summary in stages.values():
+        summary['reads_per_second'] = num_reads / summary['wall_seconds'] \
+            if summary['wall_seconds'] > 0 else None
+
+    programs = {}
+    for command in profile['commands']:
+        program = os.path.basename(command['command'].split()[0])
+        programs[program] = programs.get(program, 0) + command['wall_seconds']
+    return stages, programs
+
+def compare(stages, baseline, tolerance):
+    '''Return a list of descriptions of the ways stages is worse than the
+    baseline'''
+    regressions = []
+    for name, summary in stages.items():
+        if name not in baseline: continue
+        expected = baseline[name]
+        if summary['reads_per_second'] and expected.get('reads_per_second') and \
+                summary['reads_per_second'] < expected['reads_per_second'] * (1 - tolerance):
+            regressions.append("%s: %.0f reads/s, baseline %.0f reads/s" % (
+                name, summary['reads_per_second'], expected['reads_per_second']))
+        if summary['peak_rss_kb'] > expected['peak_rss_kb'] * (1 + tolerance):
+            regressions.append("%s: peak RSS %i kB, baseline %i kB" % (
+                name, summary['peak_rss_kb'], expected['peak_rss_kb']))
+    return regressions
+
+def print_summary(name, stages, programs):
+    print(name)
+    print("\tstage\twall_seconds\treads_per_second\tpeak_rss_kb")
+    for stage, summary in stages.items():
+        print("\t%s\t%.2f\t%s\t%i" % (stage, summary['wall_seconds'],
+                                     '%.0f' % summary['reads_per_second'] if summary['reads_per_second'] else 'n/a',
+                                     summary['peak_rss_kb']))
+    print("\tprogram\twall_seconds")
+    for program, seconds in sorted(programs.items(), key=lambda x: -x[1]):
+        print("\t%s\t%.2f" % (program, seconds))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark graftM graft on synthetic metagenomes')
+    parser.add_argument('--graftm_packages', nargs='+', default=DEFAULT_GRAFTM_PACKAGES)
+    parser.add_argument('--num_reads', type=int, nargs='+', default=[1000000],
+                        help='number of reads (or read pairs) in each synthetic metagenome')
+    parser.add_argument('--formats', nargs='+', default=[synthetic_metagenome.FASTA_FORMAT],
+                        choices=[synthetic_metagenome.FASTA_FORMAT, synthetic_metagenome.FASTQ_FORMAT])
+    parser.add_argument('--layouts', nargs='+', default=[synthetic_metagenome.SINGLE_LAYOUT],
+                        choices=[synthetic_metagenome.SINGLE_LAYOUT,
+                                 synthetic_metagenome.PAIRED_LAYOUT,
+                                 synthetic_metagenome.INTERLEAVED_LAYOUT])
+    parser.add_argument('--gzip', action='store_true', help='gzip the synthetic metagenomes')
+    parser.add_argument('--spike_fraction', type=float, default=0.01)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--graft_arguments', default='', help='extra arguments for graftM graft')
+    parser.add_argument('--baselines', default=DEFAULT_BASELINES, help='JSON file of baselines')
+    parser.add_argument('--update_baselines', action='store_true',
+                        help='record the results as the new baselines')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='fraction by which a stage may be slower or use more memory than its baseline')
+    parser.add_argument('--work_directory', help='directory for the synthetic metagenomes and graft outputs (default: a temporary directory)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+    else:
+        baselines = {}
+
+    regressions = []
+    with tempfile.TemporaryDirectory(dir=args.work_directory) as work_directory:
+        for graftm_package in args.graftm_packages:
+            sequences = synthetic_metagenome.spike_sequences(graftm_package)
+            for num_reads in args.num_reads:
+                for sequence_format in args.formats:
+                    for layout in args.layouts:
+                        name = benchmark_name(graftm_package, num_reads, sequence_format,
+                                              layout, args.gzip)
+                        prefix = os.path.join(work_directory, name.replace(':', '_'))
+                        paths = synthetic_metagenome.generate(
+                            sequences, prefix, num_reads, spike_fraction=args.spike_fraction,
+                            sequence_format=sequence_format, layout=layout, compress=args.gzip)
+                        profile = run_graft(graftm_package, paths, layout, prefix + '_graftm',
+                                            args.threads, args.graft_arguments)
+                        for path in paths: os.remove(path)
+
+                        stages, programs = summarise_profile(profile, num_reads)
+                        print_summary(name, stages, programs)
+                        if args.update_baselines:
+                            baselines[name] = stages
+                        elif name in baselines:
+                            for regression in compare(stages, baselines[name], args.tolerance):
+                                regressions.append("%s %s" % (name, regression))
+                        else:
+                            logging.warning("No baseline for %s" % name)
+
+    if args.update_baselines:
+        with open(args.baselines, 'w') as f:
+            json.dump(baselines, f, indent=1, sort_keys=True)
+        logging.info("Wrote baselines to %s" % args.baselines)
+    for regression in regressions:
+        print("REGRESSION: %s" % regression)
+    sys.exit(1 if regressions else 0)
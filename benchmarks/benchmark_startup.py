@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# Benchmark the start up time of bin/graftM, i.e. of invocations which do
+# little work, such as --version and the --help of each subcommand. Reports
+# the median wall time over a number of repeats and the heavy modules each
+# invocation imports, exiting with status 1 if any invocation is slower than
+# --max_seconds.
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+import statistics
+
+path_to_script = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'bin', 'graftM')
+
+DEFAULT_INVOCATIONS = ['--version'] + ['%s --help' % s for s in (
+    'graft', 'create', 'update', 'tree', 'archive', 'expand_search', 'merge')]
+
+# Third party modules whose import is slow
+HEAVY_MODULES = ['Bio', 'biom', 'dendropy', 'h5py', 'numpy', 'scipy']
+
+def median_seconds(arguments, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.time()
+        subprocess.run([sys.executable, path_to_script] + arguments.split(),
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.time() - start)
+    return statistics.median(times)
+
+def heavy_imports(arguments):
+    '''Return the heavy modules imported by the invocation'''
+    process = subprocess.run([sys.executable, '-X', 'importtime', path_to_script] + arguments.split(),
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+    imported = set()
+    for line in process.stderr.decode().splitlines():
+        if line.startswith('import time:'):
+            imported.add(line.split('|')[-1].strip().split('.')[0])
+    return [m for m in HEAVY_MODULES if m in imported]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark graftM start up time')
+    parser.add_argument('--invocations', nargs='+', default=DEFAULT_INVOCATIONS,
+                        help='arguments to graftM, each quoted as one string')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--max_seconds', type=float, default=0.5,
+                        help='maximum acceptable median start up time')
+    args = parser.parse_args()
+
+    too_slow = []
+    print("invocation\tmedian_seconds\theavy_imports")
+    for arguments in args.invocations:
+        seconds = median_seconds(arguments, args.repeats)
+        print("%s\t%.3f\t%s" % (arguments, seconds, ','.join(heavy_imports(arguments)) or '-'))
+        if seconds > args.max_seconds:
+            too_slow.append(arguments)
+    for arguments in too_slow:
+        print("REGRESSION: graftM %s took longer than %.2f seconds" % (arguments, args.max_seconds))
+    sys.exit(1 if too_slow else 0)
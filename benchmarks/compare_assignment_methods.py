@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# Run graftM graft with two taxonomic assignment methods on the same input
+# and report how often their read taxonomies agree at each rank. By default
+# the nearest_reference method is compared with pplacer on the GraftM
+# packages bundled with the tests.
+
+import os
+import sys
+import argparse
+import logging
+import tempfile
+import extern
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+
+from graftm.run import Run
+from graftm.graftm_output_paths import GraftMFiles
+from graftm.unpack_sequences import UnpackRawReads
+
+path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'test', 'data')
+path_to_script = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'bin', 'graftM')
+
+DEFAULT_DATASETS = [
+    (os.path.join(path_to_data, '61_otus.gpkg'),
+     os.path.join(path_to_data, '16S_inputs', '16S_1.1.fa')),
+    (os.path.join(path_to_data, 'mcrA.gpkg'),
+     os.path.join(path_to_data, 'mcrA.gpkg', 'mcrA_1.1.fna'))]
+
+def read_taxonomies(output_directory, sequence_file):
+    base = UnpackRawReads(sequence_file).basename()
+    path = GraftMFiles(base, output_directory, False).read_tax_output_path(base)
+    taxonomies = {}
+    with open(path) as f:
+        for line in f:
+            read, taxonomy = line.rstrip('\n').split('\t')
+            taxonomies[read] = taxonomy.split('; ')
+    return taxonomies
+
+def assign(graftm_package, sequence_file, assignment_method, output_directory, threads):
+    extern.run("%s graft --graftm_package %s --forward %s --output_directory %s "
+               "--assignment_method %s --threads %i --force --verbosity 2" % (
+                   path_to_script, graftm_package, sequence_file,
+                   output_directory, assignment_method, threads))
+    return read_taxonomies(output_directory, sequence_file)
+
+def agreement(reference, other):
+    '''Return a list, one entry per rank below Root, of (number of reads
+    assigned to that rank in the reference, number of those where other
+    agrees)'''
+    max_depth = max([len(t) for t in reference.values()] + [1])
+    counts = []
+    for depth in range(2, max_depth+1):
+        assigned = [read for read, t in reference.items() if len(t) >= depth]
+        agreeing = [read for read in assigned if other.get(read, [])[:depth] == reference[read][:depth]]
+        counts.append((len(assigned), len(agreeing)))
+    return counts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare taxonomic assignment methods')
+    parser.add_argument('--graftm_package', help='GraftM package (default: packages bundled with the tests)')
+    parser.add_argument('--forward', help='sequences to assign (required with --graftm_package)')
+    parser.add_argument('--reference_method', default=Run.PPLACER_TAXONOMIC_ASSIGNMENT)
+    parser.add_argument('--method', default=Run.NEAREST_REFERENCE_TAXONOMIC_ASSIGNMENT)
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+    datasets = [(args.graftm_package, args.forward)] if args.graftm_package else DEFAULT_DATASETS
+    for graftm_package, sequence_file in datasets:
+        with tempfile.TemporaryDirectory() as reference_dir:
+            with tempfile.TemporaryDirectory() as other_dir:
+                reference = assign(graftm_package, sequence_file, args.reference_method,
+                                   reference_dir, args.threads)
+                other = assign(graftm_package, sequence_file, args.method,
+                               other_dir, args.threads)
+        print("%s (%s): %i reads, %s vs %s" % (
+            os.path.basename(graftm_package), os.path.basename(sequence_file),
+            len(reference), args.method, args.reference_method))
+        for rank, (num_assigned, num_agreeing) in enumerate(agreement(reference, other)):
+            print("\trank %i\t%i/%i agree (%.1f%%)" % (
+                rank+1, num_agreeing, num_assigned,
+                100.0*num_agreeing/num_assigned if num_assigned else 0))
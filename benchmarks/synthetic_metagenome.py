@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# Generate synthetic metagenomes for benchmarking graftM graft: reads drawn
+# from uniformly random background sequence, spiked with fragments of the
+# sequences in a GraftM package. Protein packages are back-translated with
+# random synonymous codons. Spiked reads have the name of their source
+# sequence in their description, e.g. ">spike12 source=637699780".
+
+import os
+import sys
+import gzip
+import random
+import argparse
+import logging
+
+import numpy as np
+from Bio.Data import CodonTable
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+
+from graftm.graftm_package import GraftMPackage
+from graftm.sequence_io import SequenceIO
+
+FASTA_FORMAT = 'fasta'
+FASTQ_FORMAT = 'fastq'
+
+SINGLE_LAYOUT = 'single'
+PAIRED_LAYOUT = 'paired'
+INTERLEAVED_LAYOUT = 'interleaved'
+
+NUCLEOTIDES = np.frombuffer(b'ACGT', dtype=np.uint8)
+COMPLEMENT = bytes.maketrans(b'ACGTN', b'TGCAN')
+
+# Number of reads generated with numpy at once
+BATCH_SIZE = 100000
+
+def spike_sequences(graftm_package_path):
+    '''Return a list of (name, nucleotide sequence) to spike into the
+    background, from the unaligned sequences of the GraftM package, or from
+    its reference alignment if it has none'''
+    gpkg = GraftMPackage.acquire(graftm_package_path)
+    path = gpkg.unaligned_sequence_database_path()
+    if path is None:
+        path = gpkg.alignment_fasta_path()
+    sequences = []
+    for seq in SequenceIO().read_fasta_file(path):
+        sequence = seq.seq.replace('-', '').replace('.', '').upper()
+        if len(sequence) > 0:
+            sequences.append((seq.name, sequence))
+    if len(sequences) == 0:
+        raise Exception("No sequences found in %s" % path)
+    total = sum([len(s) for _, s in sequences])
+    nucleotides = sum([sum([s.count(c) for c in 'ACGTUN']) for _, s in sequences])
+    if nucleotides < 0.9 * total:
+        logging.info("Back-translating protein sequences from %s" % path)
+        rng = random.Random(0)
+        codons = {}
+        for codon, aa in CodonTable.standard_dna_table.forward_table.items():
+            codons.setdefault(aa, []).append(codon)
+        sequences = [(name, ''.join([rng.choice(codons.get(aa, ['NNN'])) for aa in s]))
+                     for name, s in sequences]
+    else:
+        # Ambiguity codes become N
+        ambiguous = str.maketrans('U' + 'RYSWKMBDHV', 'T' + 'N'*10)
+        sequences = [(name, s.translate(ambiguous)) for name, s in sequences]
+    logging.info("Read %i sequences to spike in from %s" % (len(sequences), path))
+    return sequences
+
+def reverse_complement(sequence):
+    return sequence.translate(COMPLEMENT)[::-1]
+
+class SyntheticMetagenome:
+    def __init__(self, sequences, read_length, insert_size, spike_fraction, seed):
+        '''
+        Parameters
+        ----------
+        sequences: list of (str, str)
+            name and nucleotide sequence of each sequence to spike in
+        read_length: int
+            length of each read
+        insert_size: int
+            length of the fragment each read pair is taken from
+        spike_fraction: float
+            expected fraction of reads (or pairs) taken from sequences
+        seed: int
+            seed for the random number generator
+        '''
+        self._sequences = [(name, s.encode()) for name, s in sequences]
+        self._read_length = read_length
+        self._insert_size = insert_size
+        self._spike_fraction = spike_fraction
+        self._rng = np.random.default_rng(seed)
+
+    def _background(self, num, length):
+        return NUCLEOTIDES[self._rng.integers(0, 4, (num, length))]
+
+    def _spike_fragment(self, length):
+        '''Return (source name, fragment) of a random stretch of a random
+        spike sequence on a random strand, padded with background if the
+        sequence is shorter than the fragment'''
+        name, sequence = self._sequences[self._rng.integers(len(self._sequences))]
+        if len(sequence) > length:
+            start = self._rng.integers(len(sequence) - length + 1)
+            fragment = sequence[start:start+length]
+        else:
+            padding = self._background(1, length - len(sequence))[0].tobytes()
+            split = self._rng.integers(len(padding)+1)
+            fragment = padding[:split] + sequence + padding[split:]
+        if self._rng.random() < 0.5:
+            fragment = reverse_complement(fragment)
+        return name, fragment
+
+    def pairs(self, num_reads, paired):
+        '''Yield batches of (names, forward reads, reverse reads), where the
+        reverse reads are None unless paired. Reads are bytes.'''
+        length = self._insert_size if paired else self._read_length
+        index = 0
+        while index < num_reads:
+            num = min(BATCH_SIZE, num_reads - index)
+            fragments = [row.tobytes() for row in self._background(num, length)]
+            names = [b'read%i' % i for i in range(index, index+num)]
+            for i in np.flatnonzero(self._rng.random(num) < self._spike_fraction):
+                source, fragments[i] = self._spike_fragment(length)
+                names[i] = b'spike%i source=%s' % (index+i, source.encode())
+            if paired:
+                forward = [f[:self._read_length] for f in fragments]
+                reverse = [reverse_complement(f[-self._read_length:]) for f in fragments]
+            else:
+                forward = fragments
+                reverse = None
+            yield names, forward, reverse
+            index += num
+
+def _open(path, compress):
+    if compress:
+        # Favour speed, since generating production scale inputs is slow
+        return gzip.open(path, 'wb', compresslevel=1)
+    return open(path, 'wb')
+
+def _record(name, read, sequence_format):
+    if sequence_format == FASTA_FORMAT:
+        return b'>%s\n%s\n' % (name, read)
+    return b'@%s\n%s\n+\n%s\n' % (name, read, b'I' * len(read))
+
+def _records(names, reads, sequence_format):
+    return b''.join([_record(n, r, sequence_format) for n, r in zip(names, reads)])
+
+def output_paths(prefix, sequence_format, layout, compress):
+    '''Return the list of files (one, or two if paired) generate() writes'''
+    extension = '.fa' if sequence_format == FASTA_FORMAT else '.fq'
+    if compress: extension += '.gz'
+    if layout == PAIRED_LAYOUT:
+        return [prefix + '.1' + extension, prefix + '.2' + extension]
+    return [prefix + extension]
+
+def generate(sequences, prefix, num_reads, read_length=150, insert_size=300,
+             spike_fraction=0.01, sequence_format=FASTA_FORMAT,
+             layout=SINGLE_LAYOUT, compress=False, seed=42):
+    '''Write a synthetic metagenome of num_reads reads (or read pairs),
+    returning the paths written to'''
+    paths = output_paths(prefix, sequence_format, layout, compress)
+    metagenome = SyntheticMetagenome(sequences, read_length, insert_size,
+                                     spike_fraction, seed)
+    files = [_open(path, compress) for path in paths]
+    try:
+        for names, forward, reverse in metagenome.pairs(num_reads, layout != SINGLE_LAYOUT):
+            if layout == SINGLE_LAYOUT:
+                files[0].write(_records(names, forward, sequence_format))
+            elif layout == PAIRED_LAYOUT:
+                files[0].write(_records(names, forward, sequence_format))
+                files[1].write(_records(names, reverse, sequence_format))
+            else:
+                # Mates are named alike and written one after the other
+                files[0].write(b''.join([
+                    _record(n, f, sequence_format) + _record(n, r, sequence_format)
+                    for n, f, r in zip(names, forward, reverse)]))
+    finally:
+        for f in files: f.close()
+    logging.info("Wrote %i reads to %s" % (num_reads, ', '.join(paths)))
+    return paths
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic metagenome for benchmarking')
+    parser.add_argument('--graftm_package', required=True, help='GraftM package whose sequences are spiked in')
+    parser.add_argument('--output_prefix', required=True, help='prefix of the output file(s)')
+    parser.add_argument('--num_reads', type=int, default=1000000, help='number of reads, or read pairs')
+    parser.add_argument('--read_length', type=int, default=150)
+    parser.add_argument('--insert_size', type=int, default=300, help='fragment length of paired reads')
+    parser.add_argument('--spike_fraction', type=float, default=0.01,
+                        help='expected fraction of reads from the GraftM package sequences')
+    parser.add_argument('--format', choices=[FASTA_FORMAT, FASTQ_FORMAT], default=FASTA_FORMAT)
+    parser.add_argument('--layout', choices=[SINGLE_LAYOUT, PAIRED_LAYOUT, INTERLEAVED_LAYOUT],
+                        default=SINGLE_LAYOUT)
+    parser.add_argument('--gzip', action='store_true', help='gzip the output')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+    generate(spike_sequences(args.graftm_package), args.output_prefix, args.num_reads,
+             args.read_length, args.insert_size, args.spike_fraction, args.format,
+             args.layout, args.gzip, args.seed)
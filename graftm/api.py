@@ -0,0 +1,138 @@
+import os
+import sys
+import shutil
+import logging
+import argparse
+import tempfile
+
+from graftm.graft_options import add_graft_arguments
+from graftm.graft_result import GraftResult
+
+class GraftException(Exception): pass
+
+# Options determined by the arguments of graft() itself
+_INPUT_OPTIONS = ('forward', 'reverse', 'interleaved', 'graftm_package', 'output_directory')
+
+# graft stops after writing these outputs, so there is nothing to return
+_UNSUPPORTED_OPTIONS = ('search_only', 'search_and_align_only')
+
+def _as_list(paths):
+    if paths is None:
+        return None
+    if isinstance(paths, str):
+        return [paths]
+    return list(paths)
+
+def _euk_hmm_file():
+    '''Return the path of the 18S HMM used by euk_check, whether graftM is run
+    from a source checkout or installed'''
+    for share in (os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'share'),
+                  os.path.join(sys.prefix, 'share')):
+        path = os.path.join(share, '18S.hmm')
+        if os.path.exists(path):
+            return path
+    raise GraftException("Could not find 18S.hmm, which is required by euk_check")
+
+def graft_arguments(**options):
+    '''Return an argparse.Namespace of graft options as if parsed from the
+    command line, with the given options (named as the command line option
+    without leading dashes) overriding the defaults'''
+    parser = argparse.ArgumentParser()
+    add_graft_arguments(parser)
+    args = parser.parse_args([])
+    known_options = set([action.dest for action in parser._actions])
+    for option, value in options.items():
+        if option not in known_options:
+            raise GraftException("Unknown graft option: %s" % option)
+        setattr(args, option, value)
+    args.subparser_name = 'graft'
+    return args
+
+def graft(reads, graftm_package, reverse=None, interleaved=False,
+          output_directory=None, scratch_directory=None, **options):
+    '''Run graft within this Python process, returning its results.
+
+    Parameters
+    ----------
+    reads: str or list of str
+        path(s) to the forward reads, one per sample, or to interleaved reads
+        if interleaved is True
+    graftm_package: str
+        path to the GraftM package
+    reverse: str or list of str
+        path(s) to the reverse reads of each sample, if paired
+    interleaved: bool
+        reads are interleaved pairs
+    output_directory: str
+        if specified, write the outputs of graftM graft to this directory.
+        Otherwise, no outputs are written, and intermediate files needed by
+        the external programs graft runs are written to a temporary directory
+        which is removed before returning.
+    scratch_directory: str
+        directory to write transient files to, as per the tmpdir option
+        (which takes precedence if specified), and to create the temporary
+        directory in when output_directory is not specified. Default: the
+        system temporary directory.
+    **options:
+        other graft options, named as their command line option without the
+        leading dashes, e.g. threads=10, assignment_method='diamond'
+
+    Returns
+    -------
+    GraftResult
+    '''
+    from graftm.run import Run
+
+    for option in _INPUT_OPTIONS:
+        if option in options:
+            raise GraftException("The %s option is specified by the arguments of graft()" % option)
+    for option in _UNSUPPORTED_OPTIONS:
+        if options.get(option):
+            raise GraftException("The %s option is not supported when running graft from Python" % option)
+    if scratch_directory is not None and 'tmpdir' not in options:
+        options['tmpdir'] = scratch_directory
+    if options.get('euk_check') and 'euk_hmm_file' not in options:
+        options['euk_hmm_file'] = _euk_hmm_file()
+
+    reads = _as_list(reads)
+    args = graft_arguments(graftm_package=graftm_package,
+                           reverse=_as_list(reverse),
+                           **options)
+    if interleaved:
+        args.forward = None
+        args.interleaved = reads
+    else:
+        args.forward = reads
+
+    temporary_directory = None
+    if output_directory is None:
+        temporary_directory = tempfile.mkdtemp(prefix='graftm', dir=scratch_directory)
+        args.output_directory = os.path.join(temporary_directory, 'graft')
+    else:
+        args.output_directory = output_directory
+
+    run = None
+    try:
+        run = Run(args)
+        if output_directory is None:
+            return run.graft_pipeline()
+        else:
+            return run.graft()
+    except SystemExit as e:
+        if e.code not in (0, None):
+            raise GraftException("graft failed with exit status %s" % e.code)
+        # graft stops early when no reads are found
+        logging.info("No reads found in any sample")
+        samples = [Run._sample_name(pair, bool(interleaved), args.input_format)
+                   for pair in run.sequence_pair_list]
+        return GraftResult(samples,
+                           {sample: {} for sample in samples},
+                           {sample: 0 for sample in samples},
+                           {}, {})
+    finally:
+        if run is not None:
+            if hasattr(run, 'profiler'):
+                run.profiler.uninstall()
+            run._remove_scratch()
+        if temporary_directory is not None:
+            shutil.rmtree(temporary_directory, ignore_errors=True)
@@ -0,0 +1,127 @@
+import os
+import json
+import pickle
+import hashlib
+import logging
+import tempfile
+import threading
+
+class Checkpointer:
+    '''Records the completion of each stage of the graft pipeline for each
+    sample, so that a run which was interrupted can be resumed without
+    repeating completed work.
+
+    A manifest in the output directory maps each sample to its completed
+    stages. Each entry holds a fingerprint of the stage's inputs and of the
+    run parameters, the path to a pickle of the stage's result, and the
+    output files the stage produced. A stage is only skipped when its
+    fingerprint matches and all of its outputs still exist.
+
+    Stages of different samples (or of the forward and reverse reads of a
+    sample) may be saved from different threads at once.
+    '''
+
+    MANIFEST_FILE_NAME = 'checkpoints.json'
+
+    SEARCH_STAGE = 'search'
+    ALIGNMENT_STAGE = 'alignment'
+
+    # Options which do not change the results of a run
+    _IGNORED_PARAMETERS = ('threads', 'verbosity', 'log', 'force', 'resume',
+                           'output_directory', 'max_samples_for_krona')
+
+    def __init__(self, output_directory, parameters):
+        '''
+        Parameters
+        ----------
+        output_directory: str
+            graft output directory, where the manifest is kept
+        parameters: dict
+            parameters of the run (e.g. vars(args)). Stages completed with
+            different parameters are not re-used.
+        '''
+        self._output_directory = output_directory
+        self._lock = threading.Lock()
+        self._manifest_path = os.path.join(output_directory, self.MANIFEST_FILE_NAME)
+        self._parameters_fingerprint = self._hash(json.dumps(
+            {k: v for k, v in parameters.items() if k not in self._IGNORED_PARAMETERS},
+            sort_keys=True, default=str))
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path) as f:
+                self._manifest = json.load(f)
+            logging.info("Resuming from checkpoints in %s" % self._manifest_path)
+        else:
+            self._manifest = {}
+
+    @staticmethod
+    def _hash(string):
+        return hashlib.sha1(string.encode()).hexdigest()
+
+    def fingerprint(self, stage, input_paths, upstream_fingerprint=None):
+        '''Return a fingerprint of a stage run on the given input files,
+        based on their paths, sizes and modification times, the run
+        parameters and the fingerprint of the stage before it.'''
+        inputs = []
+        for path in input_paths:
+            stat = os.stat(path)
+            inputs.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+        return self._hash(json.dumps([stage, self._parameters_fingerprint,
+                                      upstream_fingerprint, inputs]))
+
+    def _pickle_path(self, sample, stage):
+        return os.path.join(self._output_directory, sample + '.' + stage + '.checkpoint')
+
+    def load(self, sample, stage, fingerprint):
+        '''Return the result saved for the stage of the sample, or None if
+        the stage has not been completed with this fingerprint or its
+        outputs are missing'''
+        with self._lock:
+            entry = self._manifest.get(sample, {}).get(stage)
+        if entry is None or entry['fingerprint'] != fingerprint:
+            return None
+        for path in entry['outputs'] + [self._pickle_path(sample, stage)]:
+            if not os.path.exists(path):
+                logging.debug("Not resuming %s stage of %s as %s is missing" % (stage, sample, path))
+                return None
+        with open(self._pickle_path(sample, stage), 'rb') as f:
+            result = pickle.load(f)
+        logging.info("Skipping completed %s stage of %s" % (stage, sample))
+        return result
+
+    def save(self, sample, stage, fingerprint, result, output_paths):
+        '''Record the stage of the sample as completed.
+
+        Parameters
+        ----------
+        sample: str
+            name of the sample (or sample direction)
+        stage: str
+            name of the stage
+        fingerprint: str
+            as returned by fingerprint()
+        result: object
+            picklable result of the stage, returned by load() on resume
+        output_paths: list of str
+            files generated by the stage, which must exist for it to be
+            skipped
+        '''
+        with self._lock:
+            with open(self._pickle_path(sample, stage), 'wb') as f:
+                pickle.dump(result, f)
+            self._manifest.setdefault(sample, {})[stage] = {
+                'fingerprint': fingerprint,
+                'outputs': [p for p in output_paths if p is not None]}
+            # Write then rename, so an interruption cannot leave a partial
+            # manifest. The temporary name is unique to this call, so that it
+            # cannot be replaced by another process resuming the same output.
+            fd, tmp_path = tempfile.mkstemp(prefix=self.MANIFEST_FILE_NAME,
+                                            suffix='.tmp',
+                                            dir=self._output_directory)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(self._manifest, f, indent=1)
+                os.replace(tmp_path, self._manifest_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
@@ -4,6 +4,9 @@ import logging
 class Classify:
     def __init__(self,taxonomy):
         self.taxonomy=self.readRefpkgTax(taxonomy)
+        # Lineages as tuples, computed once so that they can be shared
+        # between placement groups and used as parts of memo keys.
+        self.lineages={tax_id: tuple(lineage) for tax_id, lineage in self.taxonomy.items()}
 
     def readRefpkgTax(self, taxonomy_file):
         ## Read in the taxonomic description of the tree within the refpkg
@@ -13,100 +16,116 @@ class Classify:
 
         return taxonomy_hash
 
-    def assignPlacement(self, placement_json_path, cutoff, resolve_placements):
+    @staticmethod
+    def _parent_index(lineages):
+        ## Map each taxon to its position and parent in the first lineage
+        ## containing it
+        parents={}
+        for lineage in lineages:
+            for idx, taxon in enumerate(lineage):
+                if taxon not in parents:
+                    parents[taxon]=(idx, lineage[idx-1] if idx>0 else None)
+        return parents
+
+    def reduceTaxString(self, lineage_confidences, threshold, resolve_placements):
+        ## Given a list of (lineage, confidence) pairs for a placement group,
+        ## return the lineage and confidences of the taxonomy that can be
+        ## trusted.
+        confidences=[c for _, c in lineage_confidences]
+        total_confidence=sum(confidences)
+        normalised_confidences=[x/total_confidence for x in confidences]
+        tax_that_meets_threshold={'placement':[],
+                                  'confidence':[]}
+        if resolve_placements:
+            parents=self._parent_index([lineage for lineage, _ in lineage_confidences])
+
+        for i in range(0,max([len(lineage) for lineage, _ in lineage_confidences])):
+            cumil_confidence={}
+            for idx, (lineage, _) in enumerate(lineage_confidences):
+                if i < len(lineage) and lineage[i]:
+                    item=lineage[i]
+                    if item in cumil_confidence:
+                        cumil_confidence[item]+=normalised_confidences[idx]
+                    else:
+                        cumil_confidence[item]=normalised_confidences[idx]
+            if resolve_placements:
+                items=sorted([(value, key) for key, value in cumil_confidence.items()], reverse=True)
+                for confidence, taxon in items:
+                    idx, parent=parents[taxon]
+                    if idx==0 or parent in tax_that_meets_threshold['placement']:
+                        tax_that_meets_threshold['placement'].append(taxon)
+                        tax_that_meets_threshold['confidence'].append(confidence)
+                        break
+            else:
+                best_place=max([(value, key) for key, value in cumil_confidence.items()])
+                if best_place[0]>threshold:
+                    tax_that_meets_threshold['placement'].append(best_place[1])
+                    tax_that_meets_threshold['confidence'].append(best_place[0])
+
+        if tax_that_meets_threshold['placement']:
+            return tax_that_meets_threshold
+        else:
+            raise Exception("Programming error.")
+
+    def assignPlacement(self, placement_json, cutoff, resolve_placements,
+                        placed_members=None, read_ids=None):
         ## Function that reads in classification and returns a 'guppy classify'
-        ## like file
+        ## like file. placement_json is either the path to a jplace file or
+        ## the already parsed jplace (see Pplacer.read_jplace).
+        ## placed_members is a dict of the read ID of each placed sequence
+        ## (see ReadIdTable.placed_name) to the IDs of the reads it
+        ## represents, which are resolved to
+        ## (file index, read name) pairs by the ReadIdTable read_ids (see
+        ## Pplacer.alignment_merger). If None, the file index is taken from the
+        ## suffix of each placed read name.
         all_placements_reads={}
-
-        def getIndex(index, lists):
-            gen_list=[]
-
-            for item in lists:
-                try:
-                    gen_list.append(item['p'][index])
-                except IndexError:
-                    gen_list.append(None)
-            return gen_list
-
-        def reduceTaxString(placement_hashes, threshold, resolve_placements):
-            confidences=[x['c'] for x in placement_hashes]
-            normalised_confidences =  [x/sum(confidences) for x in confidences]
-            tax_that_meets_threshold={'placement':[],
-                                      'confidence':[]}
-
-            for i in range(0,max([len(x['p']) for x in placement_hashes])):
-                cumil_confidence={}
-                for idx, item in enumerate(getIndex(i, placement_hashes)):
-                    if item:
-                        if item in cumil_confidence.keys():
-                            cumil_confidence[item]+=normalised_confidences[idx]
-                        else:
-                            cumil_confidence[item]=normalised_confidences[idx]
-                if resolve_placements:
-                    best=False
-                    items=sorted([(value, key) for key, value in cumil_confidence.items()], reverse=True)
-                    while best==False:
-                        try:
-                            best_place=items.pop(0)
-                            parents=[x['p'] for x in placement_hashes if best_place[1] in x['p']][0]
-                            idx=parents.index(best_place[1])
-
-                            if idx==0:
-                                tax_that_meets_threshold['placement'].append(best_place[1])
-                                tax_that_meets_threshold['confidence'].append(best_place[0])
-                                best=True
-                            else:
-                                if parents[idx-1] in tax_that_meets_threshold['placement']:
-                                    tax_that_meets_threshold['placement'].append(best_place[1])
-                                    tax_that_meets_threshold['confidence'].append(best_place[0])
-                                    best=True
-                                else:
-                                    continue
-                        except IndexError:
-                            break
-                else:
-                    best_place=max([(value, key) for key, value in list(cumil_confidence.items())])
-                    if best_place[0]>threshold:
-                        tax_that_meets_threshold['placement'].append(best_place[1])
-                        tax_that_meets_threshold['confidence'].append(best_place[0])
-
-            if tax_that_meets_threshold['placement']:
-                return tax_that_meets_threshold
-            else:
-                raise Exception("Programming error.")
-
-
-        def forcePlacement(placement_list, rank):
-            ranks=['kingdom', 'class', 'phylum', 'order', 'family', 'species']
-            rank_idx=ranks.index(rank)
+        # Many placement groups share the same classifications and
+        # confidences, so the consolidated taxonomy is memoised on the sorted
+        # (classification, summed like_weight_ratio) pairs of each group. It
+        # is stored as a (placement, confidence) tuple of tuples, and each
+        # read is given its own dict of lists, so that changing the result of
+        # one read does not change that of the others.
+        consolidated={}
 
         def consolidatePlacements(placement_list, cutoff, lwr_idx, c_idx, resolve_placements, place_group):
             seen={}
             for placement in placement_list:
                 rank=placement[0]
                 confidence=placement[lwr_idx]
-                if placement[0] not in seen:
-                    try:
-                        taxonomy_string=self.taxonomy[rank]
-                    except KeyError:
+                if rank not in seen:
+                    if rank not in self.lineages:
                         # TODO: Deal with null placements better.
                         logging.warning("null placement encountered in group: %s" % ', '.join([x[0] for x in place_group]))
                         continue
-                    seen[rank]={'c':confidence,
-                                'p':taxonomy_string}
+                    seen[rank]=confidence
                 else:
-                    seen[rank]['c']+=confidence
-
-            seen_items_0_1 = list(seen.items())[0][1]
-            if len(seen)==1 and seen_items_0_1['c']>=0.75: # If there is one entry in seen, and that entry has full confidence.
-                return {'placement': seen_items_0_1['p'],
-                        'confidence': [seen_items_0_1['c']]*len(seen_items_0_1['p'])} # Return that tax
+                    seen[rank]+=confidence
+
+            # Sorted, so that groups listing the same placements in a
+            # different order share an entry
+            key=tuple(sorted(seen.items()))
+            try:
+                return consolidated[key]
+            except KeyError:
+                pass
+
+            if len(seen)==1 and key[0][1]>=0.75: # If there is one entry in seen, and that entry has full confidence.
+                lineage=self.lineages[key[0][0]]
+                best_place=(lineage, (key[0][1],)*len(lineage)) # Return that tax
             elif len(seen)>1: # If there is more than one entry
-                return reduceTaxString(list(seen.values()), cutoff, resolve_placements)
+                reduced=self.reduceTaxString([(self.lineages[rank], c) for rank, c in key],
+                                             cutoff, resolve_placements)
+                best_place=(tuple(reduced['placement']), tuple(reduced['confidence']))
             else:
                 raise Exception("Programming Error: Classify; assignPlacement; consolidatePlacements")
-
-        placement_hash=json.load(open(placement_json_path)) # read in placement json
+            consolidated[key]=best_place
+            return best_place
+
+        if isinstance(placement_json, dict):
+            placement_hash=placement_json
+        else:
+            with open(placement_json) as f:
+                placement_hash=json.load(f) # read in placement json
         try: # Search for the idx of the like field ratio and classification
             lwr_idx=placement_hash['fields'].index('like_weight_ratio')
             c_idx=placement_hash['fields'].index('classification')
@@ -118,12 +137,18 @@ class Classify:
             if best_place: # if it exists
                 reads=[x[0] for x in placement_group['nm']] # make a list of the reads assigned to that placement
                 for read in reads: # and for each read
-                    file_idx=read.split('_')[-1]
-                    read_name='_'.join(read.split('_')[:-1])
-                    if file_idx in all_placements_reads.keys(): # Sort each read by its file index and enter it into hash, with the best placement as the value
-                        all_placements_reads[file_idx][read_name] = best_place
+                    if placed_members is None:
+                        members = [(read.split('_')[-1], '_'.join(read.split('_')[:-1]))]
                     else:
-                        all_placements_reads[file_idx] = {read_name: best_place}
+                        members = [read_ids.resolve(read_id) for read_id in
+                                   placed_members[read_ids.placed_name_id(read)]]
+                    for file_idx, read_name in members:
+                        read_place = {'placement': list(best_place[0]),
+                                      'confidence': list(best_place[1])}
+                        if file_idx in all_placements_reads.keys(): # Sort each read by its file index and enter it into hash, with the best placement as the value
+                            all_placements_reads[file_idx][read_name] = read_place
+                        else:
+                            all_placements_reads[file_idx] = {read_name: read_place}
             else: # If the best placement doesn't exist, fail.
                 raise Exception("Programming Error: Failed to retrieve taxonomy for %s"  % (' '.join([x[0] for x in placement_group['nm']])))
 
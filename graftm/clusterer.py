@@ -1,19 +1,91 @@
 from graftm.deduplicator import Deduplicator
 from graftm.sequence_io import SequenceIO
-from graftm.orfm import OrfM
+from graftm.read_id_table import ReadIdTable
+from graftm.taxonomy_registry import TaxonomyRegistry, SampleAssignments
 import logging
 import os
 
+import numpy as np
+
+class ClusterIndex:
+    '''The membership of the clusters of identical sequences of one file.
+    Only the names of the member reads are kept, in cluster order, so that
+    the members of cluster i are names[offsets[i]:offsets[i+1]].
+
+    Clusters are found by the name of their representative (first) read, or
+    by the name of the read pair it came from (see ReadIdTable.pair_name),
+    as used for the placements of the reverse read pipeline.
+    '''
+
+    def __init__(self, clusters):
+        '''
+        Parameters
+        ----------
+        clusters: list
+            list of lists of Sequence objects, as from
+            Deduplicator.deduplicate
+        '''
+        names = []
+        offsets = [0]
+        self._representative_to_index = {}
+        for index, cluster in enumerate(clusters):
+            self._representative_to_index[cluster[0].name] = index
+            names.extend(s.name for s in cluster)
+            offsets.append(len(names))
+        self._names = np.array(names, dtype=object)
+        self._offsets = np.array(offsets, dtype=np.int64)
+        self._pair_name_to_index = {}
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def index(self, representative_name):
+        return self._representative_to_index[representative_name]
+
+    def pair_name_index(self, slash_endings):
+        '''Return a dict of the pair name of each representative to the
+        index of its cluster, built once. Where the representatives of
+        several clusters share a pair name (e.g. different ORFs of the same
+        read), the last is used.'''
+        try:
+            return self._pair_name_to_index[slash_endings]
+        except KeyError:
+            pass
+        index = {}
+        for name, i in self._representative_to_index.items():
+            index[ReadIdTable.pair_name(ReadIdTable.parse_name(name)[0],
+                                        slash_endings)] = i
+        self._pair_name_to_index[slash_endings] = index
+        return index
+
+    def members(self, representative_name):
+        '''Return an array of the names of the reads in a cluster'''
+        i = self.index(representative_name)
+        return self._names[self._offsets[i]:self._offsets[i+1]]
+
+    def expand(self, cluster_indices):
+        '''Return the names of the reads of each of the given clusters, in
+        order, as an array, and an array of the position in cluster_indices
+        of the cluster each read belongs to'''
+        cluster_indices = np.asarray(cluster_indices, dtype=np.int64)
+        starts = self._offsets[cluster_indices]
+        counts = self._offsets[cluster_indices+1] - starts
+        cluster_positions = np.repeat(np.arange(len(cluster_indices)), counts)
+        # Offset of each read within its cluster, added to the cluster start
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return self._names[starts[cluster_positions] + within], cluster_positions
+
 class Clusterer:
 
-    def __init__(self):
+    def __init__(self, taxonomy_registry=None):
         self.clust = Deduplicator()
+        self.taxonomy_registry = taxonomy_registry if taxonomy_registry is not None \
+            else TaxonomyRegistry()
         self.seqio = SequenceIO()
-        self.seq_library = {}
-
-        self.orfm_regex = OrfM.regular_expression()
+        self.cluster_indices = {}
+        self.representatives = {}
 
-    def uncluster_annotations(self, input_annotations, reverse_pipe):
+    def uncluster_annotations(self, input_annotations, reverse_pipe, slash_endings=False):
         '''
         Update the annotations hash provided by pplacer to include all
         representatives within each cluster
@@ -26,15 +98,19 @@ class Clusterer:
             string as a list.
         reverse_pipe : bool
             True/False, whether the reverse reads pipeline is being followed.
+            If so, the annotations are keyed by the name of each read pair.
+        slash_endings : bool
+            True if the read names end in /1 or /2, which are removed from
+            the pair names of the reverse reads pipeline.
 
         Returns
         -------
         output_annotations : hash
             An updated version of the above, which includes all reads from
-            each cluster
+            each cluster, as a SampleAssignments for each file
         '''
         output_annotations = {}
-        for placed_alignment_file_path, clusters in self.seq_library.items():
+        for placed_alignment_file_path, cluster_index in self.cluster_indices.items():
 
             if reverse_pipe and placed_alignment_file_path.endswith("_reverse_clustered.fa"): continue
             placed_alignment_file = os.path.basename(placed_alignment_file_path)
@@ -44,18 +120,23 @@ class Clusterer:
                 placed_alignment_base = placed_alignment_file.replace('_forward_clustered.fa', '')
             else:
                 placed_alignment_base = placed_alignment_file.replace('_clustered.fa', '')
-            output_annotations[placed_alignment_base] = {}
-            for rep_read_name, rep_read_taxonomy in cluster_classifications.items():
-
-                if reverse_pipe:
-                    orfm_regex = OrfM.regular_expression()
-                    clusters={(orfm_regex.match(key).groups(0)[0] if orfm_regex.match(key) else key): item for key, item in iter(clusters.items())}
-                for read in clusters[rep_read_name]:
-                    output_annotations[placed_alignment_base][read.name] = rep_read_taxonomy
+            assignments = SampleAssignments(self.taxonomy_registry)
+            output_annotations[placed_alignment_base] = assignments
+            if reverse_pipe:
+                lookup = cluster_index.pair_name_index(slash_endings).__getitem__
+            else:
+                lookup = cluster_index.index
+            indices = np.zeros(len(cluster_classifications), dtype=np.int64)
+            taxonomy_ids = np.zeros(len(cluster_classifications), dtype=np.dtype('l'))
+            for i, (rep_read_name, rep_read_taxonomy) in enumerate(cluster_classifications.items()):
+                indices[i] = lookup(rep_read_name)
+                taxonomy_ids[i] = self.taxonomy_registry.intern(rep_read_taxonomy)
+            read_names, cluster_positions = cluster_index.expand(indices)
+            assignments.add_ids(read_names, taxonomy_ids[cluster_positions])
 
         return output_annotations
 
-    def cluster(self, input_fasta_list, reverse_pipe):
+    def cluster(self, input_fasta_list, reverse_pipe, sequences=None):
         '''
         cluster - Clusters reads at 100% identity level and  writes them to
         file. Resets the input_fasta variable as the FASTA file containing the
@@ -67,6 +148,11 @@ class Clusterer:
             list of strings, each a path to input fasta files to be clustered.
         reverse_pipe : bool
             True/False, whether the reverse reads pipeline is being followed.
+        sequences : dict or None
+            if not None, path in input_fasta_list to a list of Sequence
+            objects, which are clustered in place of reading the file. The
+            representatives are then not written to file, but kept in
+            self.representatives under the output path.
         Returns
         -------
         output_fasta_list : list
@@ -76,11 +162,12 @@ class Clusterer:
         output_fasta_list = []
         for input_fasta in input_fasta_list:
             output_path  = input_fasta.replace('_hits.aln.fa', '_clustered.fa')
-            cluster_dict = {}
-
             logging.debug('Clustering reads')
-            if os.path.exists(input_fasta):
-                reads=self.seqio.read_fasta_file(input_fasta) # Read in FASTA records
+            if sequences is not None or os.path.exists(input_fasta):
+                if sequences is not None:
+                    reads=sequences.get(input_fasta, [])
+                else:
+                    reads=self.seqio.read_fasta_file(input_fasta) # Read in FASTA records
                 logging.debug('Found %i reads' % len(reads)) # Report number found
                 clusters=self.clust.deduplicate(reads) # Cluster redundant sequences
                 logging.debug('Clustered to %s groups' % len(clusters)) # Report number of clusters
@@ -89,13 +176,12 @@ class Clusterer:
                 logging.debug("Found no reads to be clustered")
                 clusters = []
 
-            self.seqio.write_fasta_file(
-                                        [x[0] for x in clusters],
-                                        output_path
-                                        ) # Choose the first sequence to write to file as representative (all the same anyway)
-            for cluster in clusters:
-                cluster_dict[cluster[0].name]=cluster # assign the cluster to the dictionary
-            self.seq_library[output_path]= cluster_dict
+            representatives = [x[0] for x in clusters] # Choose the first sequence as representative (all the same anyway)
+            if sequences is not None:
+                self.representatives[output_path] = representatives
+            else:
+                self.seqio.write_fasta_file(representatives, output_path)
+            self.cluster_indices[output_path] = ClusterIndex(clusters)
 
             output_fasta_list.append(output_path)
 
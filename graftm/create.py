@@ -533,9 +533,8 @@ graftM create --taxtastic_taxonomy %s --taxtastic_seqinfo %s --alignment %s  --r
                         itertools.islice(seqio.each_sequence(f), 10),
                         tf)
                 tf.flush()
-                cmd = "graftM graft --forward %s --graftm_package %s --output_directory %s --force" %(
-                    tf.name, package_path, graftM_graft_test_dir_name)
-                extern.run(cmd)
+                from graftm.api import graft
+                graft(tf.name, package_path, scratch_directory=graftM_graft_test_dir_name)
 
 
     def main(self, **kwargs):
@@ -859,10 +858,6 @@ in the final GraftM package. If you are sure these sequences are correct, turn o
             tf.close()
 
         # Test out the gpkg just to be sure.
-        #
-        # TODO: Use graftM through internal means rather than via extern. This
-        # requires some refactoring so that graft() can be called easily with
-        # sane defaults.
         logging.info("Testing gpkg package works")
         self._test_package(output_gpkg_path)
 
@@ -3,6 +3,7 @@ from graftm.diamond import Diamond
 from graftm.unpack_sequences import UnpackRawReads
 from graftm.sequence_search_results import SequenceSearchResult
 from graftm.sequence_extractor import SequenceExtractor
+from graftm.process_runner import PROCESS_RUNNER
 
 class DecoyFilter:
     def __init__(self, proper_hits_diamond, decoy_diamond=None):
@@ -36,12 +37,28 @@ class DecoyFilter:
         -------
         False if no sequences remain after filtering, else True.
         '''
-        # Run query sequences against the proper database
-        seq_ids_and_bitscores = {}
-        logging.debug("Running diamond against the non-decoy sequences")
-        pd = self._proper_hits_diamond.run(
+        # Run query sequences against the proper and decoy databases at the
+        # same time, splitting the threads between them
+        proper_threads = decoy_threads = None
+        threads = self._proper_hits_diamond.threads()
+        if self._decoy_diamond is not None and threads:
+            proper_threads = max(1, (threads+1)//2)
+            decoy_threads = max(1, threads//2)
+        searches = [self._proper_hits_diamond.run_async(
             candidate_sequences_fasta_path,
-            UnpackRawReads.PROTEIN_SEQUENCE_TYPE)
+            UnpackRawReads.PROTEIN_SEQUENCE_TYPE,
+            threads=proper_threads)]
+        if self._decoy_diamond is not None:
+            searches.append(self._decoy_diamond.run_async(
+                candidate_sequences_fasta_path,
+                UnpackRawReads.PROTEIN_SEQUENCE_TYPE,
+                threads=decoy_threads))
+        logging.debug("Running diamond against the non-decoy%s sequences" % (
+            ' and decoy' if self._decoy_diamond is not None else ''))
+        search_results = PROCESS_RUNNER.run_all(searches)
+
+        seq_ids_and_bitscores = {}
+        pd = search_results[0]
         for res in pd.each([SequenceSearchResult.QUERY_ID_FIELD,
                             SequenceSearchResult.ALIGNMENT_BIT_SCORE]):
             seq = res[0]
@@ -58,12 +75,8 @@ class DecoyFilter:
         if self._decoy_diamond is None:
             logging.debug("Not running against the decoy database")
         else:
-            # Run the query sequences against the decoy database, removing from the
-            # list any sequences which hit better the decoy DB.
-            logging.debug("Running diamond against decoy sequences")
-            pd = self._decoy_diamond.run(
-                candidate_sequences_fasta_path,
-                UnpackRawReads.PROTEIN_SEQUENCE_TYPE)
+            # Remove from the list any sequences which hit better the decoy DB.
+            pd = search_results[1]
             for res in pd.each([SequenceSearchResult.QUERY_ID_FIELD,
                                 SequenceSearchResult.ALIGNMENT_BIT_SCORE]):
                 seq = res[0]
@@ -1,31 +1,19 @@
 from graftm.sequence_search_results import DiamondSearchResult
 import tempfile
-import extern
 import os
 from graftm.unpack_sequences import UnpackRawReads
+from graftm.process_runner import PROCESS_RUNNER
 
 class Diamond:
-    def __init__(self, database, threads=None, evalue=None):
+    def __init__(self, database, threads=None, evalue=None, temporary_directory=None):
         self._database = database
         self._threads = threads
         self._evalue = evalue
+        # Where output is written when no daa_file_basename is given, or
+        # None for the tempfile default
+        self._temporary_directory = temporary_directory
 
-    def run(self, input_sequence_file, input_sequence_type, daa_file_basename=None):
-        '''Run input sequences in either blastp or blastx mode against the
-        database specified in __init__.
-
-        Parameters
-        ----------
-        input_sequence_file: str
-            path to query sequences
-        input_sequence_type: either 'nucleotide' or 'protein'
-            the input_sequences are this kind of sequence
-
-        Returns
-        -------
-        DiamondSearchResult
-        '''
-
+    def _command(self, input_sequence_file, input_sequence_type, basename, threads=None):
         cmd_list = ["diamond"]
         if input_sequence_type == UnpackRawReads.PROTEIN_SEQUENCE_TYPE:
             cmd_list.append('blastp')
@@ -34,12 +22,6 @@ class Diamond:
         else:
             raise Exception("Programming error")
 
-        basename = daa_file_basename
-        if basename is None:
-            with tempfile.NamedTemporaryFile(prefix='graftm_diamond') as t:
-                # we are just stealing the name, don't need the file itself
-                basename = t.name
-
         for c in ['-k 1',
                   "-d",
                     self._database,
@@ -48,21 +30,67 @@ class Diamond:
                     "-a",
                     basename]:
             cmd_list.append(c)
-        if self._threads:
+        threads = threads or self._threads
+        if threads:
             cmd_list.append("--threads")
-            cmd_list.append(str(self._threads))
+            cmd_list.append(str(threads))
         if self._evalue:
             cmd_list.append("--evalue")
             cmd_list.append(str(self._evalue))
 
-        cmd = ' '.join(cmd_list)
-        extern.run(cmd)
-
-        daa_name = "%s.daa" % basename
-        res = DiamondSearchResult.import_from_daa_file(daa_name)
+        return ' '.join(cmd_list)
 
+    def _daa_basename(self, daa_file_basename):
         if daa_file_basename is None:
-            # Diamond makes an extra file, need to remove this
-            os.remove(daa_name)
+            with tempfile.NamedTemporaryFile(prefix='graftm_diamond',
+                                             dir=self._temporary_directory) as t:
+                # we are just stealing the name, don't need the file itself
+                return t.name
+        return daa_file_basename
+
+    def run(self, input_sequence_file, input_sequence_type, daa_file_basename=None,
+            input_threads=0):
+        '''Run input sequences in either blastp or blastx mode against the
+        database specified in __init__.
+
+        Parameters
+        ----------
+        input_sequence_file: str
+            path to query sequences
+        input_sequence_type: either 'nucleotide' or 'protein'
+            the input_sequences are this kind of sequence
+        input_threads: int
+            number of threads used to produce input_sequence_file, e.g. when
+            it is a process substitution unpacking reads, counted with those
+            of diamond against the thread budget of PROCESS_RUNNER
 
+        Returns
+        -------
+        DiamondSearchResult
+        '''
+        return PROCESS_RUNNER.run_all([
+            self.run_async(input_sequence_file, input_sequence_type,
+                           daa_file_basename, input_threads=input_threads)])[0]
+
+    def threads(self):
+        return self._threads
+
+    async def run_async(self, input_sequence_file, input_sequence_type,
+                        daa_file_basename=None, threads=None, input_threads=0):
+        '''As per run(), as a coroutine run by the ProcessRunner, so that
+        it can be run at the same time as other commands. If threads is not
+        None, diamond is run with that many threads rather than the number
+        given to the constructor.'''
+        basename = self._daa_basename(daa_file_basename)
+        threads = threads or self._threads
+        daa_name = "%s.daa" % basename
+        try:
+            await PROCESS_RUNNER.run(self._command(input_sequence_file, input_sequence_type,
+                                                   basename, threads),
+                                     threads=(threads or 1) + input_threads)
+            res = await DiamondSearchResult.import_from_daa_file_async(daa_name, PROCESS_RUNNER)
+        finally:
+            # Including any partial output of a failed or cancelled search
+            if daa_file_basename is None and os.path.exists(daa_name):
+                os.remove(daa_name)
         return res
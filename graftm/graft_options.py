@@ -0,0 +1,81 @@
+import argparse
+
+from graftm.run import Run
+from graftm.housekeeping import HouseKeeping
+from graftm.unpack_sequences import UnpackRawReads
+from graftm.placement_cache import PlacementCache
+
+DEFAULT_MIN_ORF_LENGTH = 96
+
+def add_graft_arguments(parser):
+    '''Add the options of graftM graft to an argparse parser. Shared by
+    bin/graftM and graftm.api, so that graft has the same defaults whether
+    run from the command line or from Python.'''
+    input_options = parser.add_argument_group('input options')
+    input_options.add_argument('--forward', nargs='+', metavar='forward_read', help='Path to the reads you wish to run through GraftM, either in fasta (.fa) or fastq (.fq), optionally compressed with gzip (.gz), zstd (.zst), bzip2 (.bz2) or xz (.xz). If you would like to run multiple samples at once, provide a space separated list of the file paths', required=False)
+    input_options.add_argument('--reverse', nargs='+',metavar='reverse read', help='If you have paired end data, you may wish to provide the reverse reads. If you are running more than one dataset, please ensure that the order of the files passed to the --forward and --reverse flags is consistent.', default=None)
+    input_options.add_argument('--interleaved', nargs='+', metavar='interleaved_read', help='Path to the reads you wish to run through GraftM, either in fasta (.fa) or fastq (.fq), optionally compressed with gzip (.gz), zstd (.zst), bzip2 (.bz2) or xz (.xz). If you would like to run multiple samples at once, provide a space separated list of the file paths', required=False)
+    input_options.add_argument('--input_format', choices=sorted(UnpackRawReads.INPUT_FORMATS), help='Format of the reads, required when reading from standard input (given as "-") or a named pipe, which are read only once. The reads of a stream, after any sampling, are then kept as a compressed FASTA file in the temporary directory (see --tmpdir) while it is searched, roughly the size of the compressed input, less any base qualities (default: guess from the file extension)', default=None)
+    input_options.add_argument('--graftm_package', metavar='reference_package', help='Path to the gene specific GraftM package (gpkg).')
+    running_options = parser.add_argument_group('running options')
+    running_options.add_argument('--threads', type=int, metavar='threads', help='The number of threads to be used when running hmmsearch and pplacer', default=5)
+    running_options.add_argument('--input_sequence_type', help='Specify whether the input sequence is "nucleotide" or "aminoacid" sequence data (default: guess)', choices = [UnpackRawReads.PROTEIN_SEQUENCE_TYPE, UnpackRawReads.NUCLEOTIDE_SEQUENCE_TYPE],  default=None)
+    running_options.add_argument('--filter_minimum', type=int, metavar='filter_minimum', help='Minimum number of positions that must be aligned for a sequence to be placed in the phylogenetic tree (default: %sbp for nucleotide packages, %s aa for protein packages)' %
+                                 (Run.MIN_ALIGNED_FILTER_FOR_NUCLEOTIDE_PACKAGES, Run.MIN_ALIGNED_FILTER_FOR_AMINO_ACID_PACKAGES))
+
+    running_options.add_argument('--resume', action="store_true", help='Continue an interrupted run in the same output directory, skipping the search and alignment of samples which were completed with the same inputs and options. Takes precedence over --force.', default=False)
+    running_options.add_argument('--shard_index', type=int, metavar='index', help='Only run the samples assigned to this shard (0-based), so that a large set of samples can be split across separate graftM runs. Samples are assigned to shards by sorting their names. Outputs of the shards can be combined with graftM merge.', default=None)
+    running_options.add_argument('--shard_count', type=int, metavar='number', help='Total number of shards when using --shard_index', default=None)
+    running_options.add_argument('--tmpdir', metavar='directory', help='Write transient files (those passed between programs and removed before graftM finishes) to a new directory created within this one e.g. node-local storage or /dev/shm, rather than to the output directory and the system temporary directory. Unless --keep_intermediates or --resume is specified, the hit sequences and their ORFs and alignments (_hits.fa, _orf.fa and _hits.aln.fa) are then also transient, and not kept in the output directory. Usage of this directory is reported in profile.json (default: transient files are written to the output directory and the system temporary directory)', default=None)
+
+    sampling_options = parser.add_argument_group('read sampling options')
+    sampling_options.add_argument('--max_reads', type=int, metavar='number', help='Stop reading each input file after this many reads, for fast screening. Counts are then of the reads examined, and the number examined is reported in basic_stats.txt (default: read all reads)', default=None)
+    sampling_options.add_argument('--subsample_fraction', type=float, metavar='fraction', help='Search only this fraction of the reads, chosen deterministically by a hash of their name so that pairs are kept together. Counts in the OTU tables are scaled to estimates of those of all reads examined, and written with their 95%% confidence intervals to count_estimates.txt (default: search all reads)', default=None)
+    sampling_options.add_argument('--adaptive_sampling', action="store_true", help='Search the first --max_reads reads (default: %i) of each input file, doubling the number of reads searched until the rate of hits per read of the sample (forward and reverse reads together) changes by less than --adaptive_tolerance between rounds, or the whole input has been searched' % Run.DEFAULT_ADAPTIVE_SAMPLING_READS, default=False)
+    sampling_options.add_argument('--adaptive_tolerance', type=float, metavar='fraction', help='Relative change in the rate of hits per read below which --adaptive_sampling stops', default=0.1)
+
+    searching_options = parser.add_argument_group('searching options')
+    searching_options.add_argument('--evalue', metavar='evalue', help='Specify the evalue cutoff for the hmmsearch, if you would like to use a cutoff different to the default or the trusted cutoff (TC) within the HMM.', type=float, default= '1e-5')
+    searching_options.add_argument('--search_and_align_only', action="store_true", help='Stop GraftM running after reads have been identified and aligned (i.e. no placement step)', default=False)
+    searching_options.add_argument('--search_only', action="store_true", help='Stop GraftM running after reads have been identified (i.e. no alignment or placement steps)', default=False)
+    searching_options.add_argument('--euk_check', action="store_true", help='Cross check identified reads using an 18S specific HMM to help filter out eukaryotic ribosomal reads', default=False)
+    searching_options.add_argument('--search_method',
+                                   choices=('hmmsearch','diamond',
+                                            HouseKeeping.HMMSEARCH_AND_DIAMOND_SEARCH_METHOD),
+                                   help='Search method',
+                                   default='hmmsearch')
+    searching_options.add_argument('--decoy_database', help='Path to a diamond database. Sequences with better hits to these proteins will be excluded.')
+    searching_options.add_argument('--maximum_range', type=int, help='Maximum range to use when searching for potentially linked reads (when searching contigs)', default=None)
+    searching_options.add_argument('--expand_search_contigs', nargs='+', help='Provide an assembly of the sample being searched. This assembly will initially be searched for full length genes, from which a sample specific HMM model will be created and used in the search step of graftM.')
+    searching_options.add_argument('--search_hmm_files', nargs='+', help='Specify a list of paths to custom HMM(s) to search the data with.', default=argparse.SUPPRESS)
+    searching_options.add_argument('--search_hmm_list_file', metavar='Specify a file containing a list of paths to custom HMM(s) to search the data with (one per line).', default=argparse.SUPPRESS)
+    searching_options.add_argument('--search_diamond_file', help='Specify a DIAMOND database with which to search/classify the reads.', default=None)
+    searching_options.add_argument('--aln_hmm_file', help='Reads will be aligned to this HMM after identification. N.B. This option can only be used if no placement is required.', default=argparse.SUPPRESS)
+    placement_options = parser.add_argument_group('taxonomic assignment options')
+    placement_options.add_argument('--assignment_method', help='Taxonomic assignment method, either pplacer (phylogenetic), DIAMOND (pairwise) or nearest_reference (fast and approximate, assigning the taxonomy of the most similar sequence(s) in the reference alignment). default = pplacer', default=Run.PPLACER_TAXONOMIC_ASSIGNMENT, choices=(Run.PPLACER_TAXONOMIC_ASSIGNMENT,Run.DIAMOND_TAXONOMIC_ASSIGNMENT,Run.NEAREST_REFERENCE_TAXONOMIC_ASSIGNMENT))
+    pplacer_options = parser.add_argument_group('pplacer assignment options')
+    pplacer_options.add_argument('--placements_cutoff', metavar='confidence', help='This flag allows you to change the likelihood cutoff for phylogenetic placement of reads.',  default=0.75, type=float)
+    pplacer_options.add_argument('--resolve_placements', action="store_true", help='Ignore the placements cutoff and simply use the best placement assigned to the read.', default=False)
+    pplacer_options.add_argument('--placement_cache', metavar='path', help='Re-use placements of previously seen sequences stored in this cache file (created if it does not exist), and store the placements of new sequences there. Cached placements are specific to the contents of the reference package.', default=None)
+    pplacer_options.add_argument('--placement_cache_max_entries', type=int, metavar='number', help='Maximum number of sequences to keep in the placement cache. The least recently used entries are removed first.', default=PlacementCache.DEFAULT_MAX_ENTRIES)
+    pplacer_options.add_argument('--pplacer_chunk_size', type=int, metavar='number', help='Place sequences in chunks of this many sequences, each placed by a separate pplacer process, bounding the memory used by each process (default: place all sequences with one pplacer process)', default=None)
+    pplacer_options.add_argument('--pplacer_processes', type=int, metavar='number', help='Maximum number of pplacer processes to run at once when --pplacer_chunk_size is specified. --threads are shared between the processes.', default=1)
+    pplacer_options.add_argument('--pplacer_max_memory', type=float, metavar='GB', help='Limit the number of pplacer processes run at once so that their estimated combined memory usage is at most this many gigabytes. Only used with --pplacer_chunk_size.', default=None)
+    pplacer_options.add_argument('--pplacer_mmap_directory', metavar='directory', help='Store pplacer likelihood vectors in memory mapped files in this directory (pplacer --mmap-file) rather than in RAM', default=None)
+    pplacer_options.add_argument('--pretty_jplace', action="store_true", help='Write the per-file placements.jplace files as indented JSON rather than compact JSON', default=False)
+    pplacer_options.add_argument('--no_merge_reads',  action="store_true", help='When this flag is specified, the alignment of the forward and reverse reads will not be merged before placement. If paired reads are provided, pair with the most confident placement will be used for classification.', default=False)
+    nucleotide_options = parser.add_argument_group('nucleotide search-specific options')
+    nucleotide_options.add_argument('--euk_hmm_file', help='Use this flag to specify the HMM that is used in the Eukaryotic contamination screen', default=argparse.SUPPRESS) #TODO: decoy HMMs
+    protein_options = parser.add_argument_group('protein search-specific options')
+    protein_options.add_argument('--min_orf_length', metavar='length', help='Minimum number of nucleotides in an open reading frame', default=DEFAULT_MIN_ORF_LENGTH, type=int)
+    protein_options.add_argument('--restrict_read_length', metavar='length', help='Only use this many base pairs at the start of each sequence searched', type=int)
+
+    logging_options = parser.add_argument_group('logging options')
+    logging_options.add_argument('--verbosity', metavar='verbosity', help='1 - 5, 1 being silent, 5 being noisy indeed.', type=int, default=4)
+    logging_options.add_argument('--log', metavar='logfile', help='Output logging information to this file', default=False)
+
+    output_options = parser.add_argument_group('output options')
+    output_options.add_argument('--output_directory', metavar='reference_package', help='Output directory name', default="GraftM_output")
+    output_options.add_argument('--force', action="store_true", help='Force overwrite the output directory if one already exists with the same name', default=False)
+    output_options.add_argument('--keep_intermediates', action="store_true", help='Write the aligned, clustered and combined reads passed between the alignment and taxonomic assignment steps to the output directory and keep them, rather than passing them in memory (or, for the combined alignment placed by pplacer, writing it to a transient file)', default=False)
+    output_options.add_argument('--max_samples_for_krona', type=int, help='If the number of samples is greater than this, do not output KRONA diagram', default=Run.DEFAULT_MAX_SAMPLES_FOR_KRONA)
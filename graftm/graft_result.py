@@ -0,0 +1,57 @@
+class GraftResult:
+    '''The outcome of running graft on one or more samples, as returned by
+    graftm.api.graft'''
+
+    # Stages timed for the basic statistics, in the order they are reported
+    SEARCH_STAGE = 'search'
+    ALIGNMENT_STAGE = 'alignment'
+    TAXONOMIC_ASSIGNMENT_STAGE = 'taxonomic_assignment'
+    TIMED_STAGES = [SEARCH_STAGE, ALIGNMENT_STAGE, TAXONOMIC_ASSIGNMENT_STAGE]
+
+    def __init__(self, samples, assignments, hit_counts, times, profile, read_sampling=None):
+        '''
+        Parameters
+        ----------
+        samples: list of str
+            names of the samples, in the order they were run
+        assignments: dict
+            sample name to SampleAssignments (or dict) of read name to
+            lineage, a list or tuple of str starting with 'Root'
+        hit_counts: dict
+            sample name to the number of reads found in the search step (for
+            paired reads, forward and reverse reads are counted separately)
+        times: dict
+            stage (one of TIMED_STAGES) to seconds, or 'n/a' if the stage was
+            not run, as reported in the basic statistics
+        profile: dict
+            resources used by each stage and external command, as per
+            Profiler.report
+        read_sampling: dict
+            sample name to the ReadSampling of the reads searched, when only
+            some of the reads were searched (--max_reads, --subsample_fraction
+            or --adaptive_sampling), otherwise empty. Assignments and hit
+            counts are of the reads searched.
+        '''
+        self.samples = samples
+        self.assignments = assignments
+        self.hit_counts = hit_counts
+        self.times = times
+        self.profile = profile
+        self.read_sampling = read_sampling if read_sampling is not None else {}
+        self._otu_table = None
+
+    def otu_table(self):
+        '''Return an OtuTable of the number of reads assigned to each lineage
+        in each sample, with columns in the order of self.samples'''
+        if self._otu_table is None:
+            from graftm.summarise import Stats_And_Summary
+            self._otu_table = Stats_And_Summary().otu_table(
+                [self.assignments[sample] for sample in self.samples])
+        return self._otu_table
+
+    def counts(self, sample):
+        '''Return a dict of lineage (tuple of str) to the number of reads of
+        the sample assigned to it'''
+        table = self.otu_table()
+        column = table.counts[:, self.samples.index(sample)].tocoo()
+        return {table.lineages[row]: int(count) for row, count in zip(column.row, column.data)}
@@ -2,7 +2,10 @@ import os
 
 class GraftMFiles:
     
-    def __init__(self, old_title, outdir, direction):
+    def __init__(self, old_title, outdir, direction, scratch_directory=None):
+        '''The hits and their ORFs and alignment, which are only needed while
+        graft runs, and the combined alignment are put in scratch_directory
+        if it is given, otherwise in outdir'''
         if direction in ['forward', 'reverse', 'interleaved']:
             self.basename = os.path.join(direction, old_title + '_' + direction)
         elif direction == False:
@@ -11,7 +14,15 @@ class GraftMFiles:
             raise Exception('Programming Error.')   
          
         self.outdir = outdir
-    
+        self.scratchdir = scratch_directory if scratch_directory else outdir
+    
+    def make_scratch_directory(self, out_path):
+        '''Create the directory of the files of out_path in the scratch
+        directory, if there is one'''
+        if self.scratchdir != self.outdir:
+            os.makedirs(os.path.dirname(os.path.join(self.scratchdir, out_path, self.basename)),
+                        exist_ok=True)
+
     def search_otu_table(self):
         return os.path.join(self.outdir, "search_otu_table.txt")
     
@@ -45,7 +56,7 @@ class GraftMFiles:
         return os.path.join(self.outdir, "krona.html")
     
     def aligned_fasta_output_path(self, out_path):
-        return os.path.join(self.outdir, out_path, "%s_hits.aln.fa" % self.basename)
+        return os.path.join(self.scratchdir, out_path, "%s_hits.aln.fa" % self.basename)
 
     def orf_output_path(self, out_path):
         return os.path.join(self.outdir, out_path, "%s_orf" % self.basename)
@@ -54,7 +65,7 @@ class GraftMFiles:
         return os.path.join(self.outdir, out_path, "%s_orf.titles" % self.basename)
 
     def orf_fasta_output_path(self, out_path):
-        return os.path.join(self.outdir, out_path, "%s_orf.fa" % self.basename)
+        return os.path.join(self.scratchdir, out_path, "%s_orf.fa" % self.basename)
 
     def conv_output_for_path(self, out_path):
         return os.path.join(self.outdir, out_path, "%s_conv_for.faa" % self.basename)
@@ -69,10 +80,10 @@ class GraftMFiles:
         return os.path.join(self.outdir, out_path, "%s_conv_rev.faa" % self.basename)
     
     def comb_aln_fa(self):
-        return os.path.join(self.outdir, "combined_alignment.aln.fa")
+        return os.path.join(self.scratchdir, "combined_alignment.aln.fa")
 
     def fa_output_path(self, out_path):
-        return os.path.join(self.outdir, out_path, "%s_hits.fa" % self.basename)     
+        return os.path.join(self.scratchdir, out_path, "%s_hits.fa" % self.basename)     
         
     def readnames_output_path(self, out_path):
         return os.path.join(self.outdir, out_path, "%s_readnames.txt" % self.basename)
@@ -83,6 +94,9 @@ class GraftMFiles:
     def basic_stats_path(self):
         return os.path.join(self.outdir, "basic_stats.txt")
 
+    def profile_path(self):
+        return os.path.join(self.outdir, "profile.json")
+
     def for_aln_path(self, out_path):
         return os.path.join(self.outdir, out_path, "%s_for_aln.fa" % self.basename)
         
@@ -92,6 +106,15 @@ class GraftMFiles:
     def combined_biom_output_path(self):
         return os.path.join(self.outdir, "graftm.biom")
     
+    def shard_manifest_path(self):
+        return os.path.join(self.outdir, "shard_manifest.json")
+
+    def count_estimates_output_path(self):
+        return os.path.join(self.outdir, "count_estimates.txt")
+
+    def read_sampling_path(self, out_path):
+        return os.path.join(self.outdir, out_path, "%s_read_sampling.txt" % self.basename)
+
     def combined_summary_table_output_path(self):
         return os.path.join(self.outdir, "combined_count_table.txt")
     
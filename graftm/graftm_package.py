@@ -5,6 +5,7 @@ import logging
 import extern
 
 from graftm.getaxnseq import Getaxnseq
+from graftm.resident_cache import RESIDENT_CACHE
 
 class InsufficientGraftMPackageException(Exception): pass
 
@@ -64,7 +65,13 @@ class GraftMPackage:
         graftm_output_path: str
             path to base directory of graftm
         '''
+        return RESIDENT_CACHE.get(
+            'graftm_package',
+            [os.path.join(graftm_package_path, GraftMPackage._CONTENTS_FILE_NAME)],
+            lambda: GraftMPackage._acquire(graftm_package_path))
 
+    @staticmethod
+    def _acquire(graftm_package_path):
         with open(os.path.join(
                 graftm_package_path,
                 GraftMPackage._CONTENTS_FILE_NAME
@@ -1,6 +1,8 @@
 import logging
 import extern
 
+from graftm.process_runner import PROCESS_RUNNER
+
 class NoInputSequencesException(Exception):
     def __init__(self, command):
         """Instantiate with the command used that went amiss"""
@@ -22,7 +24,7 @@ class HmmSearcher:
         self._num_cpus = num_cpus
         self._extra_args = extra_args
 
-    def hmmsearch(self, input_pipe, hmms, output_files):
+    def hmmsearch(self, input_pipe, hmms, output_files, input_threads=1):
         r"""Run HMMsearch with all the HMMs, generating output files
 
         Parameters
@@ -36,6 +38,9 @@ class HmmSearcher:
         output_files: list of paths
             A list of (string) paths to output CSV files to be generated by the
             HMM searching
+        input_threads: Integer
+            The number of threads used by input_pipe, counted with those of
+            hmmsearch against the thread budget of PROCESS_RUNNER
 
         Returns
         -------
@@ -61,7 +66,7 @@ class HmmSearcher:
             logging.debug("Running command: %s" % cmd)
 
             try:
-                extern.run(cmd)
+                PROCESS_RUNNER.run_sync(cmd, threads=self._num_cpus + input_threads)
             except extern.ExternCalledProcessError as e:
                 if e.stderr == b'\nError: Sequence file - is empty or misformatted\n\n':
                     raise NoInputSequencesException(cmd)
@@ -3,6 +3,7 @@ import shutil
 import logging
 import inspect
 from graftm.graftm_package import GraftMPackage
+from graftm.unpack_sequences import UnpackRawReads
 
 class InvalidFileExtensionError(Exception):
     pass
@@ -79,7 +80,10 @@ following extensions: %s" % ' '.join(valid_extensions.keys()))
             except:
                 pass
 
-    def make_working_directory(self, directory_path, force):
+    def make_working_directory(self, directory_path, force, resume=False):
+        if resume and os.path.isdir(directory_path):
+            # Keep the outputs of the interrupted run
+            return
         if force:
             shutil.rmtree(directory_path, ignore_errors=True)
             os.mkdir(directory_path)
@@ -98,6 +102,30 @@ following extensions: %s" % ' '.join(valid_extensions.keys()))
                 logging.info('Please specify a confidence level (-d) between 0.5 and 1.0! Found: %s' % args.placements_cutoff)
                 exit(1)
 
+            if args.max_reads is not None and args.max_reads < 1:
+                logging.info('Please specify a --max_reads of at least 1. Found: %s' % args.max_reads)
+                exit(1)
+            if args.subsample_fraction is not None and \
+                    not 0 < args.subsample_fraction <= 1:
+                logging.info('Please specify a --subsample_fraction greater than 0 and at most 1. Found: %s' % args.subsample_fraction)
+                exit(1)
+            if args.adaptive_tolerance < 0:
+                logging.info('Please specify a non-negative --adaptive_tolerance. Found: %s' % args.adaptive_tolerance)
+                exit(1)
+
+            read_files = (args.forward or []) + (args.reverse or []) + (args.interleaved or [])
+            streams = [f for f in read_files if UnpackRawReads.is_stream_path(f)]
+            if streams:
+                if args.input_format is None:
+                    logging.error('Please specify --input_format when reading from standard input or a named pipe')
+                    exit(1)
+                if args.adaptive_sampling:
+                    logging.error('--adaptive_sampling cannot be used when reading from standard input or a named pipe, as the reads can only be read once')
+                    exit(1)
+                if len(set(streams)) != len(streams):
+                    logging.error('Standard input or a named pipe can only be given as input once')
+                    exit(1)
+
             if args.interleaved and args.forward:
                 logging.info('Please specify either reads with one of'
                              '--forward or --interleaved, not both')
@@ -131,9 +159,9 @@ following extensions: %s" % ' '.join(valid_extensions.keys()))
 
     def _check_file_existence(self, files):
         '''Iterate through files and exit(1) if any do not pass
-        os.path.isfile'''
+        os.path.isfile, other than standard input and named pipes'''
         for f in files:
-            if not os.path.isfile(f):
+            if not os.path.isfile(f) and not UnpackRawReads.is_stream_path(f):
                 logging.error("The file '%s' does not appear to exist, stopping" % f)
                 exit(1)
 
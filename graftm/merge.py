@@ -0,0 +1,152 @@
+import os
+import json
+import logging
+from array import array
+
+from biom.util import biom_open
+
+from graftm.graftm_output_paths import GraftMFiles
+from graftm.housekeeping import HouseKeeping
+from graftm.search_table import SearchTableWriter
+from graftm.summarise import Stats_And_Summary, OtuTable
+from graftm.taxonomy_registry import TaxonomyRegistry
+
+class DuplicateSampleException(Exception): pass
+class IncompleteShardsException(Exception): pass
+
+class Merger:
+    '''Combine the outputs of several graftM graft runs over different samples
+    (e.g. shards of a large set of samples run on separate nodes) into one
+    set of outputs, as if all samples had been run together.
+
+    Count tables are read one line at a time and only their non-zero counts
+    are kept, so memory use is proportional to the size of the merged table
+    rather than to the inputs.
+
+    If the inputs were run with --shard_index/--shard_count, their shard
+    manifests are used to check that every shard is present, and to skip
+    the outputs of shards which had no samples.
+    '''
+
+    def merge(self, graft_output_directories, output_directory, force=False):
+        '''
+        Parameters
+        ----------
+        graft_output_directories: list of str
+            output directories of graftM graft runs to merge
+        output_directory: str
+            directory to write the combined count table, BIOM file and search
+            OTU table to. Created if it does not exist.
+        force: bool
+            overwrite output_directory if it already exists
+        '''
+        HouseKeeping().make_working_directory(output_directory, force)
+        output_files = GraftMFiles('', output_directory, False)
+        input_files = [GraftMFiles('', d, False) for d in graft_output_directories]
+
+        manifests = self._read_shard_manifests(input_files)
+        if manifests is None:
+            count_tables = [f.combined_summary_table_output_path() for f in input_files]
+            search_tables = [f.search_otu_table() for f in input_files]
+        else:
+            count_tables = []
+            search_tables = []
+            # Order samples as if all shards had been run together
+            for files, manifest in sorted(zip(input_files, manifests),
+                                          key=lambda x: x[1]['shard_index']):
+                if len(manifest['samples']) == 0: continue
+                outputs = manifest['outputs']
+                if 'combined_count_table' in outputs:
+                    count_tables.append(os.path.join(files.outdir, outputs['combined_count_table']))
+                else:
+                    logging.warning("Shard %i has no count table, so its samples are not included in the merged count table" % \
+                                    manifest['shard_index'])
+                search_tables.append(os.path.join(files.outdir,
+                                                  outputs.get('search_otu_table', 'search_otu_table.txt')))
+
+        otu_table, sample_names = self._read_otu_tables(count_tables)
+        logging.info("Merged %i lineages across %i samples from %i graftM output(s)" % (
+            len(otu_table.lineages), len(sample_names), len(input_files)))
+        summary = Stats_And_Summary()
+        with open(output_files.combined_summary_table_output_path(), 'w') as f:
+            summary.write_tabular_otu_table(sample_names, otu_table, f)
+        with biom_open(output_files.combined_biom_output_path(), 'w') as f:
+            biom_successful = summary.write_biom(sample_names, otu_table, f)
+        if not biom_successful:
+            os.remove(output_files.combined_biom_output_path())
+
+        missing = [path for path in search_tables if not os.path.exists(path)]
+        if len(missing) > 0:
+            logging.warning("Not writing a merged search OTU table since some inputs have none e.g. %s" % missing[0])
+        else:
+            SearchTableWriter().merge_search_otu_tables(search_tables,
+                                                        output_files.search_otu_table())
+
+    def _read_shard_manifests(self, input_files):
+        '''Return the shard manifest of each input, or None if the inputs
+        were not run as shards. Raise an IncompleteShardsException unless
+        exactly one of each shard is present.'''
+        paths = [f.shard_manifest_path() for f in input_files]
+        exists = [os.path.exists(p) for p in paths]
+        if not any(exists):
+            return None
+        if not all(exists):
+            raise IncompleteShardsException(
+                "Some but not all inputs have a shard manifest, e.g. %s is missing" % \
+                paths[exists.index(False)])
+        manifests = []
+        for path in paths:
+            with open(path) as f:
+                manifests.append(json.load(f))
+        shard_counts = set([m['shard_count'] for m in manifests])
+        if len(shard_counts) != 1:
+            raise IncompleteShardsException("Inputs were run with different --shard_count values: %s" % \
+                                            ', '.join([str(c) for c in sorted(shard_counts)]))
+        shard_count = shard_counts.pop()
+        indices = sorted([m['shard_index'] for m in manifests])
+        if indices != list(range(shard_count)):
+            missing = sorted(set(range(shard_count)) - set(indices))
+            raise IncompleteShardsException(
+                "Expected each of %i shards exactly once, but found shard(s) %s%s" % (
+                    shard_count, ', '.join([str(i) for i in indices]),
+                    (" (missing %s)" % ', '.join([str(i) for i in missing])) if missing else ''))
+        logging.info("Merging %i shards" % shard_count)
+        return manifests
+
+    def _read_otu_tables(self, paths):
+        '''Read tabular OTU tables as written by
+        Stats_And_Summary.write_tabular_otu_table, returning an OtuTable of
+        their union and the list of sample names'''
+        taxonomy_registry = TaxonomyRegistry()
+        taxonomy_ids = array('l')
+        sample_indices = array('l')
+        counts = array('l')
+        sample_names = []
+        seen_samples = set()
+        for path in paths:
+            logging.debug("Reading count table %s" % path)
+            with open(path) as f:
+                header = f.readline().rstrip('\n').split('\t')
+                if len(header) < 2 or header[0] != '#ID' or header[-1] != 'ConsensusLineage':
+                    raise Exception("Unexpected header in count table %s" % path)
+                table_samples = header[1:-1]
+                for sample in table_samples:
+                    if sample in seen_samples:
+                        raise DuplicateSampleException(
+                            "Sample %s found in more than one graftM output, e.g. %s" % (sample, path))
+                    seen_samples.add(sample)
+                offset = len(sample_names)
+                sample_names += table_samples
+                for line in f:
+                    splits = line.rstrip('\n').split('\t')
+                    if len(splits) != len(header):
+                        raise Exception("Unexpected number of fields in count table %s: %s" % (path, line))
+                    taxonomy_id = taxonomy_registry.intern(splits[-1].split('; '))
+                    for i, count in enumerate(splits[1:-1]):
+                        if count != '0':
+                            taxonomy_ids.append(taxonomy_id)
+                            sample_indices.append(offset+i)
+                            counts.append(int(count))
+        return OtuTable.from_coordinates(taxonomy_registry, taxonomy_ids, sample_indices,
+                                         counts, len(sample_names)), \
+            sample_names
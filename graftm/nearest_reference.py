@@ -0,0 +1,143 @@
+import logging
+import numpy as np
+
+from graftm.sequence_io import SequenceIO
+from graftm.getaxnseq import Getaxnseq
+
+class NearestReferenceClassifier:
+    '''A fast, approximate alternative to phylogenetic placement. Each aligned
+    read is compared to every sequence in the reference alignment of a
+    GraftM package over the alignment columns covered by the read, and
+    assigned the taxonomy of the reference(s) with the most identical
+    residues. When several references tie, the read is assigned to the
+    lowest common ancestor of their taxonomies.
+
+    Reads must be aligned to the same columns as the reference alignment,
+    as they are by SequenceSearcher.align.
+    '''
+
+    DEFAULT_BATCH_SIZE = 1000
+
+    # Gap characters, which do not count towards the identity of a read and
+    # a reference.
+    _UNINFORMATIVE_CHARACTERS = b'-.'
+
+    def __init__(self, reference_alignment_path, taxonomy_path, seqinfo_path,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        '''
+        Parameters
+        ----------
+        reference_alignment_path: str
+            path to the aligned reference sequences of the refpkg
+        taxonomy_path: str
+            path to the taxtastic taxonomy file of the refpkg
+        seqinfo_path: str
+            path to the taxtastic seqinfo file of the refpkg
+        batch_size: int
+            number of reads compared to the references at once. Memory usage
+            is proportional to batch_size * number of references.
+        '''
+        self._batch_size = batch_size
+        with open(taxonomy_path) as tax:
+            with open(seqinfo_path) as seqinfo:
+                taxonomy_definition = Getaxnseq().read_taxtastic_taxonomy_and_seqinfo(
+                    tax, seqinfo)
+
+        names = []
+        sequences = []
+        for seq in SequenceIO().read_fasta_file(reference_alignment_path):
+            names.append(seq.name)
+            sequences.append(seq.seq)
+        if len(sequences) == 0:
+            raise Exception("No reference sequences found in %s" % reference_alignment_path)
+        self._alignment_length = len(sequences[0])
+        self._references = self._encode(sequences)
+        self._reference_taxonomies = [taxonomy_definition[name] for name in names]
+
+        informative = ~np.isin(self._references, self._uninformative_codes())
+        self._alphabet = np.unique(self._references[informative])
+        logging.debug("Read %i reference sequences of alignment length %i" % (
+            len(names), self._alignment_length))
+
+    @staticmethod
+    def _uninformative_codes():
+        return np.frombuffer(NearestReferenceClassifier._UNINFORMATIVE_CHARACTERS,
+                             dtype=np.uint8)
+
+    def _encode(self, aligned_sequences):
+        '''Return a 2D uint8 array of the upper cased aligned sequences, one
+        row per sequence'''
+        for s in aligned_sequences:
+            if len(s) != self._alignment_length:
+                raise Exception("Aligned sequence is of length %i, expected %i" % (
+                    len(s), self._alignment_length))
+        return np.frombuffer(''.join(aligned_sequences).upper().encode(),
+                             dtype=np.uint8).reshape(len(aligned_sequences),
+                                                     self._alignment_length)
+
+    def _matches(self, queries):
+        '''Return a (number of queries) x (number of references) array of the
+        number of identical informative residues'''
+        matches = np.zeros((queries.shape[0], self._references.shape[0]),
+                           dtype=np.float32)
+        for code in self._alphabet:
+            query_has = (queries == code).astype(np.float32)
+            if not query_has.any(): continue
+            matches += query_has.dot((self._references == code).astype(np.float32).T)
+        return matches
+
+    @staticmethod
+    def _lowest_common_ancestor(taxonomies):
+        lca = []
+        for taxa in zip(*taxonomies):
+            if all(t == taxa[0] for t in taxa[1:]):
+                lca.append(taxa[0])
+            else:
+                break
+        return lca
+
+    def classify(self, aligned_sequences):
+        '''Assign taxonomy to aligned sequences.
+
+        Parameters
+        ----------
+        aligned_sequences: dict
+            read name to aligned sequence
+
+        Returns
+        -------
+        dict of read name to taxonomy (list of str, starting with 'Root'),
+        in the same form as the pplacer and diamond assignment methods
+        '''
+        # Identical aligned sequences need only be compared once
+        sequence_to_names = {}
+        for name, seq in aligned_sequences.items():
+            try:
+                sequence_to_names[seq].append(name)
+            except KeyError:
+                sequence_to_names[seq] = [name]
+        unique_sequences = list(sequence_to_names.keys())
+
+        assignments = {}
+        for start in range(0, len(unique_sequences), self._batch_size):
+            batch = unique_sequences[start:start+self._batch_size]
+            matches = self._matches(self._encode(batch))
+            best = matches.max(axis=1)
+            for i, seq in enumerate(batch):
+                if best[i] == 0:
+                    taxonomy = ['Root']
+                else:
+                    ties = np.flatnonzero(matches[i] == best[i])
+                    taxonomy = ['Root'] + self._lowest_common_ancestor(
+                        [self._reference_taxonomies[j] for j in ties])
+                for name in sequence_to_names[seq]:
+                    assignments[name] = taxonomy
+        logging.debug("Assigned taxonomy to %i reads (%i unique aligned sequences)" % (
+            len(assignments), len(unique_sequences)))
+        return assignments
+
+    def classify_alignment_file(self, aligned_fasta_path):
+        '''As per classify(), reading the aligned sequences from a FASTA file'''
+        with open(aligned_fasta_path) as f:
+            aligned_sequences = {name: seq for name, seq, _ in SequenceIO().each(f)}
+        return self.classify(aligned_sequences)
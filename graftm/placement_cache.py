@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+
+class PlacementCache:
+    '''An on-disk cache of pplacer placements, so that aligned sequences seen
+    in previous runs do not need to be placed again. Entries are keyed on a
+    fingerprint of the reference package contents together with a hash of
+    the aligned sequence, and hold the jplace placement rows ('p') for that
+    sequence. The jplace fields, tree and version of each reference package
+    are stored alongside so that a jplace can be rebuilt entirely from the
+    cache.
+
+    When the number of cached sequences exceeds max_entries, the least
+    recently used entries are evicted.
+    '''
+
+    DEFAULT_MAX_ENTRIES = 1000000
+
+    _SQLITE_MAX_VARIABLES = 500
+    _JPLACE_HEADER_KEYS = ('fields', 'tree', 'version', 'metadata')
+
+    def __init__(self, cache_path, refpkg_path, max_entries=DEFAULT_MAX_ENTRIES):
+        '''
+        Parameters
+        ----------
+        cache_path: str
+            path to the cache database, created if it does not exist
+        refpkg_path: str
+            path to the pplacer reference package which placements are
+            computed against
+        max_entries: int
+            maximum number of sequences to keep in the cache
+        '''
+        self._max_entries = max_entries
+        self._refpkg = self.refpkg_fingerprint(refpkg_path)
+        logging.debug("Using placement cache %s with reference package fingerprint %s" % (
+            cache_path, self._refpkg))
+        self._db = sqlite3.connect(cache_path, timeout=600)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS placements ("
+                             "refpkg TEXT NOT NULL, "
+                             "sequence_hash TEXT NOT NULL, "
+                             "placements TEXT NOT NULL, "
+                             "last_used REAL NOT NULL, "
+                             "PRIMARY KEY (refpkg, sequence_hash))")
+            self._db.execute("CREATE INDEX IF NOT EXISTS placements_last_used "
+                             "ON placements (last_used)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS jplace_headers ("
+                             "refpkg TEXT PRIMARY KEY, "
+                             "header TEXT NOT NULL)")
+
+    @staticmethod
+    def refpkg_fingerprint(refpkg_path):
+        '''Return a hex digest of the names and contents of all files in the
+        reference package, so that any change to the package invalidates
+        cached placements.'''
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(refpkg_path):
+            dirs.sort()
+            for f in sorted(files):
+                path = os.path.join(root, f)
+                digest.update(os.path.relpath(path, refpkg_path).encode())
+                digest.update(b'\0')
+                with open(path, 'rb') as fh:
+                    for chunk in iter(lambda: fh.read(1 << 20), b''):
+                        digest.update(chunk)
+                digest.update(b'\0')
+        return digest.hexdigest()
+
+    @staticmethod
+    def _sequence_hash(aligned_sequence):
+        return hashlib.sha1(aligned_sequence.encode()).hexdigest()
+
+    def jplace_header(self):
+        '''Return the cached jplace header (dict with fields, tree, version
+        and metadata) for this reference package, or None if there is none'''
+        row = self._db.execute("SELECT header FROM jplace_headers WHERE refpkg = ?",
+                               (self._refpkg,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def lookup(self, aligned_sequences):
+        '''Return a dict of aligned sequence to its cached placement rows, for
+        those of the given sequences which are in the cache.
+
+        Parameters
+        ----------
+        aligned_sequences: iterable of str
+            aligned sequences to look up
+
+        Returns
+        -------
+        dict of aligned sequence to list of jplace placement rows
+        '''
+        if self.jplace_header() is None:
+            return {}
+        hash_to_sequence = {self._sequence_hash(s): s for s in aligned_sequences}
+        hashes = list(hash_to_sequence.keys())
+        found = {}
+        now = time.time()
+        with self._db:
+            for i in range(0, len(hashes), self._SQLITE_MAX_VARIABLES):
+                batch = hashes[i:i+self._SQLITE_MAX_VARIABLES]
+                params = ','.join(['?']*len(batch))
+                for sequence_hash, placements in self._db.execute(
+                        "SELECT sequence_hash, placements FROM placements "
+                        "WHERE refpkg = ? AND sequence_hash IN (%s)" % params,
+                        [self._refpkg]+batch):
+                    found[hash_to_sequence[sequence_hash]] = json.loads(placements)
+                self._db.execute(
+                    "UPDATE placements SET last_used = ? "
+                    "WHERE refpkg = ? AND sequence_hash IN (%s)" % params,
+                    [now, self._refpkg]+batch)
+        logging.info("Found %i of %i sequences in the placement cache" % (
+            len(found), len(hashes)))
+        return found
+
+    def store(self, sequence_to_placements, jplace):
+        '''Add placements to the cache, evicting the least recently used
+        entries if the cache becomes too large.
+
+        Parameters
+        ----------
+        sequence_to_placements: dict
+            aligned sequence to list of jplace placement rows
+        jplace: dict
+            the jplace (or just its header) that the placements came from.
+            If the fields differ from those of previously cached placements
+            for this reference package, the old placements are discarded.
+        '''
+        header = {key: jplace[key] for key in self._JPLACE_HEADER_KEYS if key in jplace}
+        previous_header = self.jplace_header()
+        now = time.time()
+        with self._db:
+            if previous_header is not None and \
+                    (previous_header['fields'] != header['fields'] or
+                     previous_header['tree'] != header['tree']):
+                logging.warning("jplace format of the placement cache differs from that of pplacer, discarding old cached placements")
+                self._db.execute("DELETE FROM placements WHERE refpkg = ?",
+                                 (self._refpkg,))
+            self._db.execute("INSERT OR REPLACE INTO jplace_headers (refpkg, header) VALUES (?, ?)",
+                             (self._refpkg, json.dumps(header)))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO placements "
+                "(refpkg, sequence_hash, placements, last_used) VALUES (?, ?, ?, ?)",
+                ((self._refpkg, self._sequence_hash(seq), json.dumps(placements), now)
+                 for seq, placements in sequence_to_placements.items()))
+            self._evict()
+
+    def _evict(self):
+        num_entries = self._db.execute("SELECT COUNT(*) FROM placements").fetchone()[0]
+        if num_entries > self._max_entries:
+            num_to_evict = num_entries - self._max_entries
+            logging.debug("Evicting %i entries from the placement cache" % num_to_evict)
+            self._db.execute("DELETE FROM placements WHERE rowid IN ("
+                             "SELECT rowid FROM placements ORDER BY last_used LIMIT ?)",
+                             (num_to_evict,))
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM placements").fetchone()[0]
+
+    def close(self):
+        self._db.close()
@@ -3,12 +3,17 @@ import os
 import json
 import logging
 import re
+import tempdir
 
-from Bio import SeqIO
+from concurrent.futures import ThreadPoolExecutor
 
 from graftm.timeit import Timer
 from graftm.classify import Classify
+from graftm.profiler import Profiler
+from graftm.read_id_table import ReadIdTable
 from graftm.housekeeping import HouseKeeping
+from graftm.sequence_io import SequenceIO
+from graftm.resident_cache import RESIDENT_CACHE
 T=Timer()
 
 
@@ -17,40 +22,311 @@ class Pplacer:
     ### and running comparisons between forward and revere reads if reverse
     ### reads are provided.
 
-    def __init__(self, refpkg):
+    def __init__(self, refpkg, placement_cache=None, chunk_size=None,
+                 max_processes=1, max_memory=None, mmap_directory=None,
+                 pretty_jplace=False, temporary_directory=None):
+        '''
+        Parameters
+        ----------
+        refpkg: str
+            path to the pplacer reference package
+        placement_cache: PlacementCache or None
+            re-use and store placements in this cache
+        chunk_size: int or None
+            if not None, split the sequences to be placed into chunks of this
+            many sequences, each placed by a separate pplacer process
+        max_processes: int
+            maximum number of pplacer processes to run at once when chunking.
+            The threads given to pplacer() are shared between them.
+        max_memory: float or None
+            if not None, limit the number of pplacer processes run at once so
+            that their combined memory usage, estimated from the peak usage
+            of placing the first chunk, is at most this many gigabytes
+        mmap_directory: str or None
+            if not None, have pplacer store likelihood vectors in memory
+            mapped files in this directory rather than in RAM
+        pretty_jplace: bool
+            write per-file jplace files as indented JSON, rather than compact
+            JSON
+        temporary_directory: str or None
+            directory to split alignments into chunks in, and to write the
+            sequences not found in the placement cache to, or None for the
+            tempfile default
+        '''
         self.refpkg = refpkg
         self.hk = HouseKeeping()
+        self.placed_members = None
+        self.read_ids = None
+        self.placement_cache = placement_cache
+        self.chunk_size = chunk_size
+        self.max_processes = max_processes
+        self.max_memory = max_memory
+        self.mmap_directory = mmap_directory
+        self.temporary_directory = temporary_directory
+        self.pretty_jplace = pretty_jplace
+
+    def _pplacer_command(self, threads, output_path, input_path):
+        cmd = "pplacer -j %s --verbosity 0 --out-dir %s -c %s" % (str(threads), output_path, self.refpkg)
+        if self.mmap_directory:
+            cmd += " --mmap-file %s" % self._mmap_path(input_path)
+        return "%s %s" % (cmd, input_path)
 
     # Run pplacer
     def pplacer(self, output_file, output_path, input_path, threads):
         ## Runs pplacer on concatenated alignment file
-        cmd = "pplacer -j %s --verbosity 0 --out-dir %s -c %s %s" % (str(threads), output_path, self.refpkg, input_path) # Set command
-        extern.run(cmd)
+        if self.chunk_size:
+            return self._chunked_pplacer(output_path, input_path, threads)
+        cmd = self._pplacer_command(threads, output_path, input_path) # Set command
+        try:
+            extern.run(cmd)
+        finally:
+            self._remove_mmap_files([input_path])
         output_path = '.'.join(input_path.split('.')[:-1]) + '.jplace'
         return output_path
 
-    def alignment_merger(self, alignment_files, output_alignment_path):
-        ## Concatenate aligned read_files into one file. Each read with it's
-        ## own unique identifier assigning it to a particular origin file
+    def _mmap_path(self, input_path):
+        return os.path.join(self.mmap_directory,
+                            os.path.basename(input_path) + '.mmap')
+
+    def _remove_mmap_files(self, input_paths):
+        if self.mmap_directory:
+            self.hk.delete([p for p in (self._mmap_path(i) for i in input_paths)
+                            if os.path.exists(p)])
+
+    def _split_alignment(self, input_path, chunk_size, output_directory):
+        '''Split the sequences in input_path into FASTA files in
+        output_directory, each with at most chunk_size sequences. Return a
+        list of the paths to the chunks.'''
+        chunk_paths = []
+        chunk = None
+        with open(input_path) as f:
+            for i, (name, seq, _) in enumerate(SequenceIO().each(f)):
+                if i % chunk_size == 0:
+                    if chunk: chunk.close()
+                    chunk_paths.append(os.path.join(output_directory,
+                                                    "chunk%i.aln.fa" % len(chunk_paths)))
+                    chunk = open(chunk_paths[-1], 'w')
+                chunk.write(">%s\n%s\n" % (name, seq))
+        if chunk: chunk.close()
+        return chunk_paths
+
+    def _merge_jplaces(self, jplace_paths, output_jplace_path):
+        '''Concatenate the placements of several jplace files generated
+        with the same reference package into one jplace file'''
+        merged = None
+        for path in jplace_paths:
+            with open(path) as f:
+                jplace = json.load(f)
+            if merged is None:
+                merged = jplace
+            else:
+                merged['placements'] += jplace['placements']
+        with open(output_jplace_path, 'w') as f:
+            json.dump(merged, f)
+
+    def _chunked_pplacer(self, output_path, input_path, threads):
+        '''Place the sequences in input_path with several pplacer processes
+        each placing a chunk of the sequences, so that the memory used by
+        each process is bounded. Write the merged placements to a jplace file
+        and return its path, as per pplacer().'''
+        output_jplace = '.'.join(input_path.split('.')[:-1]) + '.jplace'
+        with tempdir.TempDir(basedir=self.temporary_directory) as chunk_directory:
+            chunk_paths = self._split_alignment(input_path, self.chunk_size, chunk_directory)
+            logging.info("Placing sequences in %i chunk(s) of up to %i sequences" % (
+                len(chunk_paths), self.chunk_size))
+            jplace_paths = ['.'.join(c.split('.')[:-1]) + '.jplace' for c in chunk_paths]
+            num_processes = max(1, min(self.max_processes, threads, len(chunk_paths)))
+
+            remaining = list(chunk_paths)
+            if self.max_memory and num_processes > 1:
+                # Place the first chunk by itself to estimate the memory
+                # required by each pplacer process, from the peak usage of
+                # that process alone.
+                first = remaining.pop(0)
+                try:
+                    _, usage = Profiler.run_measured(
+                        self._pplacer_command(threads, chunk_directory, first))
+                finally:
+                    self._remove_mmap_files([first])
+                peak_gb = max(float(usage['peak_rss_kb']) / 1024 / 1024, 1e-6)
+                num_processes = max(1, min(num_processes, int(self.max_memory / peak_gb)))
+                logging.debug("pplacer used up to %.2f GB, running %i pplacer process(es) at once" % (
+                    peak_gb, num_processes))
+
+            threads_per_process = max(1, threads // num_processes)
+            commands = [self._pplacer_command(threads_per_process, chunk_directory, c)
+                        for c in remaining]
+            try:
+                with ThreadPoolExecutor(max_workers=num_processes) as executor:
+                    # In copies of this context, so that the commands are
+                    # recorded by its profiler
+                    futures = [executor.submit(Profiler.copy_context().run, extern.run, command)
+                               for command in commands]
+                    for future in futures: future.result()
+            finally:
+                self._remove_mmap_files(remaining)
+            self._merge_jplaces(jplace_paths, output_jplace)
+        return output_jplace
+
+    @staticmethod
+    def _placement_names(placement):
+        if 'nm' in placement:
+            return [x[0] for x in placement['nm']]
+        elif 'n' in placement:
+            return placement['n']
+        else:
+            raise Exception("Unexpected jplace format: Either 'nm' or 'n' are expected as keys in placement jplace .JSON file")
+
+    @staticmethod
+    def read_jplace(jplace_path):
+        '''Read a jplace file once into a dict which can be shared by
+        classification and splitting. Placements are normalised so that
+        each has 'p' and 'nm' keys, with the 'n' form of pplacer's output
+        converted to 'nm' entries of multiplicity 1.'''
+        with open(jplace_path) as f:
+            jplace = json.load(f)
+        for placement in jplace['placements']:
+            if 'nm' not in placement:
+                placement['nm'] = [[name, 1] for name in Pplacer._placement_names(placement)]
+                del placement['n']
+        return jplace
+
+    def pplacer_with_cache(self, output_file, output_path, input_path, threads):
+        '''As per pplacer(), except that placements of sequences found in the
+        placement cache are re-used, so that pplacer is only run on novel
+        sequences (or not at all). The placements of novel sequences are
+        added to the cache, and a single jplace file containing the
+        placements from both sources is written.
+
+        Returns
+        -------
+        path to the jplace file
+        '''
+        with open(input_path) as f:
+            name_to_sequence = {name: seq for name, seq, _ in SequenceIO().each(f)}
+        cached = self.placement_cache.lookup(name_to_sequence.values())
+        jplace_path = '.'.join(input_path.split('.')[:-1]) + '.jplace'
+
+        novel_names = [name for name, seq in name_to_sequence.items() if seq not in cached]
+        if len(novel_names) > 0:
+            if len(cached) > 0:
+                # Place only the novel sequences, from a separate alignment
+                # so that the input (kept with --keep_intermediates) still
+                # has every sequence placed
+                with tempdir.TempDir(basedir=self.temporary_directory) as novel_directory:
+                    novel_path = os.path.join(novel_directory, os.path.basename(input_path))
+                    with open(novel_path, 'w') as f:
+                        for name in novel_names:
+                            f.write(">%s\n%s\n" % (name, name_to_sequence[name]))
+                    novel_jplace_path = self.pplacer(output_file, novel_directory,
+                                                     novel_path, threads)
+                    with open(novel_jplace_path) as f:
+                        jplace_json = json.load(f)
+            else:
+                self.pplacer(output_file, output_path, input_path, threads)
+                with open(jplace_path) as f:
+                    jplace_json = json.load(f)
+            novel_placements = {}
+            for placement in jplace_json['placements']:
+                for name in self._placement_names(placement):
+                    novel_placements[name_to_sequence[name]] = placement['p']
+            self.placement_cache.store(novel_placements, jplace_json)
+        else:
+            logging.info("All sequences were found in the placement cache, not running pplacer")
+            jplace_json = self.placement_cache.jplace_header()
+            jplace_json['placements'] = []
+
+        if len(cached) > 0:
+            for name, seq in name_to_sequence.items():
+                if seq in cached:
+                    jplace_json['placements'].append({'p': cached[seq],
+                                                      'nm': [[name, 1]]})
+            with open(jplace_path, 'w') as f:
+                json.dump(jplace_json, f)
+        return jplace_path
+
+    @staticmethod
+    def _each_aligned_sequence(alignment_file, sequences):
+        '''Yield (name, sequence) of each sequence of an alignment, from
+        sequences if it is not None, otherwise from the file'''
+        if sequences is not None:
+            for sequence in sequences.get(alignment_file, []):
+                yield sequence.name, sequence.seq
+        else:
+            with open(alignment_file) as f:
+                for name, seq, _ in SequenceIO().each(f):
+                    yield name, seq
+
+    def alignment_merger(self, alignment_files, output_alignment_path, sequences=None):
+        '''Concatenate aligned read files into one file for placement.
+        Identical aligned sequences are dereplicated across all of the files,
+        so that each unique sequence is placed only once. Each read is given
+        an integer ID in self.read_ids, the first occurrence of each sequence
+        is written named by its ID (see ReadIdTable.placed_name), and the IDs
+        of every read sharing that sequence are recorded in
+        self.placed_members under the ID of the first.
+
+        Parameters
+        ----------
+        alignment_files : list
+            list of paths to aligned fasta files, or None for files without
+            an alignment
+        output_alignment_path : str
+            path to write the combined, dereplicated alignment to
+        sequences: dict or None
+            if not None, alignment file path to a list of Sequence objects,
+            used in place of reading the file
+
+        Returns
+        -------
+        alias_hash : dict
+            file alias (str) to a dict with the 'output_path' of the jplace
+            file for that alias
+        '''
         alias_hash = {} # Set up a hash with file names and their unique identifier
-        file_number = 0 # file counter (unique identifier)
+        sequence_to_placed_id = {}
+        self.placed_members = {}
+        self.read_ids = ReadIdTable()
+        num_sequences = 0
         with open(output_alignment_path, 'w') as output:
-            for alignment_file in alignment_files: # For each alignment
-                if alignment_file is not None:
-                    alignments = list(SeqIO.parse(open(alignment_file, 'r'), 'fasta')) # read list
-                    for record in alignments: # For each record in the read list
-                        record.id = record.id + '_' + str(file_number) # append the unique identifier to the record id
-                    SeqIO.write(alignments, output, "fasta") # And write the reads to the file
-                    alias_hash[str(file_number)] = {'output_path': os.path.join(os.path.dirname(alignment_file), 'placements.jplace')}
-                file_number += 1
+            for file_number, alignment_file in enumerate(alignment_files):
+                if alignment_file is None: continue
+                alias = str(file_number)
+                for name, seq in self._each_aligned_sequence(alignment_file, sequences):
+                    num_sequences += 1
+                    read_id = self.read_ids.add(file_number, name)
+                    try:
+                        placed_id = sequence_to_placed_id[seq]
+                    except KeyError:
+                        placed_id = read_id
+                        sequence_to_placed_id[seq] = placed_id
+                        self.placed_members[placed_id] = []
+                        output.write(">%s\n%s\n" % (ReadIdTable.placed_name(placed_id), seq))
+                    self.placed_members[placed_id].append(read_id)
+                alias_hash[alias] = {'output_path': os.path.join(os.path.dirname(alignment_file), 'placements.jplace')}
+        logging.info("Dereplicated %i aligned sequences from %i file(s) to %i for placement" % \
+                     (num_sequences, len(alias_hash), len(sequence_to_placed_id)))
         return alias_hash
 
+    @staticmethod
+    def placed_name_members(placed_name, placed_members=None, read_ids=None):
+        '''Return a list of (file alias, read name) pairs represented by a
+        sequence name in the combined alignment, resolving the read IDs of
+        placed_members through read_ids. When no placed_members are given,
+        the name is taken to be the read name with the alias appended.'''
+        if placed_members is None:
+            splits = placed_name.split('_')
+            return [(splits[-1], '_'.join(splits[:-1]))]
+        return [read_ids.resolve(read_id) for read_id in
+                placed_members[ReadIdTable.placed_name_id(placed_name)]]
+
     def convert_cluster_dict_keys_to_aliases(self, cluster_dict, alias_hash):
         '''
         Parameters
         ----------
         cluster_dict : dict
-            dictionary stores information on pre-placement clustering
+            path of each clustered file to its ClusterIndex, as in
+            Clusterer.cluster_indices
         alias_hash : dict
             Stores information on each input read file given to GraftM, the
             corresponding reads found within each file, and their taxonomy
@@ -70,7 +346,8 @@ class Pplacer:
 
 
 
-    def jplace_split(self, original_jplace, cluster_dict):
+    def jplace_split(self, original_jplace, cluster_dict, placed_members=None,
+                     read_ids=None):
         '''
         To make GraftM more efficient, reads are dereplicated and merged into
         one file prior to placement using pplacer. This function separates the
@@ -84,7 +361,14 @@ class Pplacer:
         original_jplace : dict (json)
             json .jplace file from the pplacer step.
         cluster_dict : dict
-            dictionary stores information on pre-placement clustering
+            file alias to the ClusterIndex of the pre-placement clustering
+            of that file
+        placed_members : dict or None
+            read ID of each placed sequence to the list of IDs of the reads
+            it represents, as generated by alignment_merger. If None, the file alias is taken from the
+            suffix of each placed read name.
+        read_ids : ReadIdTable or None
+            table resolving the read IDs of placed_members
 
         Returns
         -------
@@ -105,21 +389,17 @@ class Pplacer:
             else:
                 raise Exception("Unexpected jplace format: Either 'nm' or 'n' are expected as keys in placement jplace .JSON file")
 
-            for nm_entry in nm:
-                nm_list = []
-                placement_read_name, plval = nm_entry
-                read_alias_idx = placement_read_name.split('_')[-1] # Split the alias
-                                    # index out of the read name, which
-                                    # corresponds to the input file from
-                                    # which the read originated.
-                read_name = '_'.join(placement_read_name.split('_')[:-1])
-                read_cluster = cluster_dict[read_alias_idx][read_name]
-                for read in read_cluster:
-                    nm_list.append([read.name, plval])
-                if read_alias_idx not in nm_dict:
-                    nm_dict[read_alias_idx] = nm_list
-                else:
-                    nm_dict[read_alias_idx] += nm_entry
+            for placement_read_name, plval in nm:
+                # Expand the placed sequence into each of the input files
+                # and clusters which it represents.
+                for read_alias_idx, read_name in self.placed_name_members(placement_read_name,
+                                                                          placed_members,
+                                                                          read_ids):
+                    nm_list = [[name, plval] for name in cluster_dict[read_alias_idx].members(read_name)]
+                    if read_alias_idx not in nm_dict:
+                        nm_dict[read_alias_idx] = nm_list
+                    else:
+                        nm_dict[read_alias_idx] += nm_list
 
             for alias_idx, nm_list in nm_dict.items():
                 placement_hash = {'p': p,
@@ -130,8 +410,9 @@ class Pplacer:
                     output_hash[alias_idx].append(placement_hash)
         return output_hash
 
-    def write_jplace(self, original_jplace, alias_hash):
-        # Write the jplace file to their respective file paths.
+    def write_jplace(self, original_jplace, alias_hash, pretty=False):
+        # Write the jplace file to their respective file paths. Compact JSON
+        # is written unless pretty is True.
         for alias_idx in alias_hash.keys():
             output = {'fields'     : original_jplace['fields'],
                       'version'    : original_jplace['version'],
@@ -139,11 +420,14 @@ class Pplacer:
                       'placements' : alias_hash[alias_idx]['place'],
                       'metadata'   : original_jplace['metadata']}
             with open(alias_hash[alias_idx]['output_path'], 'w') as output_io:
-                json.dump(output, output_io, ensure_ascii=False, indent=3, separators=(',', ': '))
+                if pretty:
+                    json.dump(output, output_io, ensure_ascii=False, indent=3, separators=(',', ': '))
+                else:
+                    json.dump(output, output_io, ensure_ascii=False, separators=(',', ':'))
 
     @T.timeit
     def place(self, reverse_pipe, seqs_list, resolve_placements, files, args,
-              slash_endings, tax_descr, clusterer):
+              slash_endings, tax_descr, clusterer, sequences=None):
         '''
         placement - This is the placement pipeline in GraftM, in aligned reads
                     are placed into phylogenetic trees, and the results interpreted.
@@ -166,6 +450,9 @@ class Pplacer:
             graftM output file name object
         args : obj
             argparse object
+        sequences : dict or None
+            if not None, path in seqs_list to a list of aligned Sequence
+            objects, used in place of reading the file
         Returns
         -------
         trusted_placements : dict
@@ -174,7 +461,7 @@ class Pplacer:
         trusted_placements = {}
         files_to_delete = []
         # Merge the alignments so they can all be placed at once.
-        alias_hash = self.alignment_merger(seqs_list, files.comb_aln_fa())
+        alias_hash = self.alignment_merger(seqs_list, files.comb_aln_fa(), sequences)
         files_to_delete += seqs_list
         files_to_delete.append(files.comb_aln_fa())
         if os.path.getsize(files.comb_aln_fa()) == 0:
@@ -186,16 +473,23 @@ class Pplacer:
             return to_return
 
         # Run pplacer on merged file
-        jplace = self.pplacer(files.jplace_output_path(), args.output_directory, files.comb_aln_fa(), args.threads)
+        if self.placement_cache:
+            jplace = self.pplacer_with_cache(files.jplace_output_path(), os.path.dirname(files.comb_aln_fa()), files.comb_aln_fa(), args.threads)
+        else:
+            jplace = self.pplacer(files.jplace_output_path(), os.path.dirname(files.comb_aln_fa()), files.comb_aln_fa(), args.threads)
         files_to_delete.append(jplace)
         logging.info("Placements finished")
 
-        #Read the json of refpkg
+        # Read the jplace once, for both classification and splitting
+        jplace_json = self.read_jplace(jplace)
         logging.info("Reading classifications")
-        classifications=Classify(tax_descr).assignPlacement(
-                                                           jplace,
+        classify=RESIDENT_CACHE.get('classify', [tax_descr], lambda: Classify(tax_descr))
+        classifications=classify.assignPlacement(
+                                                           jplace_json,
                                                            args.placements_cutoff,
-                                                           resolve_placements
+                                                           resolve_placements,
+                                                           self.placed_members,
+                                                           self.read_ids
                                                            )
         logging.info("Reads classified")
         # If the reverse pipe has been specified, run the comparisons between the two pipelines. If not then just return.
@@ -204,15 +498,19 @@ class Pplacer:
 
             if reverse_pipe:
                 base_file=os.path.basename(file).replace('_forward_hits.aln.fa', '')
-                forward_gup=classifications.pop(sorted(classifications.keys())[0])
-                reverse_gup=classifications.pop(sorted(classifications.keys())[0])
+                forward_alias=sorted(classifications.keys())[0]
+                forward_gup=classifications.pop(forward_alias)
+                reverse_alias=sorted(classifications.keys())[0]
+                reverse_gup=classifications.pop(reverse_alias)
                 seqs_list.pop(idx+1)
                 placements_hash = Compare().compare_placements(
                                                                forward_gup,
                                                                reverse_gup,
                                                                args.placements_cutoff,
                                                                slash_endings,
-                                                               base_file
+                                                               base_file,
+                                                               self.read_ids.pair_names(int(forward_alias), slash_endings),
+                                                               self.read_ids.pair_names(int(reverse_alias), slash_endings)
                                                                )
                 trusted_placements[base_file]=placements_hash['trusted_placements']
 
@@ -224,11 +522,12 @@ class Pplacer:
                         trusted_placements[base_file][read] = entry['placement']
         # Split the original jplace file
         # and write split jplaces to separate file directories
-        with open(jplace) as f: jplace_json = json.load(f)
-        cluster_dict = self.convert_cluster_dict_keys_to_aliases(clusterer.seq_library,
+        cluster_dict = self.convert_cluster_dict_keys_to_aliases(clusterer.cluster_indices,
                                                                  alias_hash)
         hash_with_placements = self.jplace_split(jplace_json,
-                                                 cluster_dict)
+                                                 cluster_dict,
+                                                 self.placed_members,
+                                                 self.read_ids)
 
         for file_alias, placement_entries_list in hash_with_placements.items():
             alias_hash[file_alias]['place'] = placement_entries_list
@@ -236,10 +535,17 @@ class Pplacer:
         for k, v in alias_hash.items():
             if 'place' not in v:
                 alias_hash[k]['place'] = []
+            if files.scratchdir != files.outdir:
+                # The alignments were in the scratch directory, but the
+                # per-file jplaces are outputs
+                v['output_path'] = os.path.join(files.outdir,
+                                                os.path.relpath(v['output_path'], files.scratchdir))
         self.write_jplace(jplace_json,
-                          alias_hash)
+                          alias_hash,
+                          self.pretty_jplace)
 
-        self.hk.delete(files_to_delete)# Remove combined split, not really useful
+        if not args.keep_intermediates:
+            self.hk.delete(files_to_delete)# Remove combined split, not really useful
 
         return trusted_placements
 
@@ -248,11 +554,17 @@ class Compare:
 
     def __init__(self): pass
 
-    def _compare_hits(self, forward_reads, reverse_reads, file_name, slash_endings):
+    def _compare_hits(self, forward_reads, reverse_reads, file_name, slash_endings,
+                      forward_pair_names=None, reverse_pair_names=None):
         ## Take a paired read run, and compare hits between the two, report the
         ## number of hits each, the crossover, and a
+        ## The pair names are dicts of read name to the name shared by both
+        ## reads of the pair (see ReadIdTable.pair_names). If None, they are
+        ## parsed from the read names.
 
-        def remove_endings(read_list, slash_endings):
+        def remove_endings(read_list, slash_endings, pair_names):
+            if pair_names is not None:
+                return {pair_names[read]: read for read in read_list}
             orfm_regex = re.compile('^(\S+)_(\d+)_(\d)_(\d+)')
             d = {}
             for read in read_list:
@@ -270,8 +582,8 @@ class Compare:
                 d[new_read]=read
             return d
 
-        forward_reads=remove_endings(forward_reads, slash_endings)
-        reverse_reads=remove_endings(reverse_reads, slash_endings)
+        forward_reads=remove_endings(forward_reads, slash_endings, forward_pair_names)
+        reverse_reads=remove_endings(reverse_reads, slash_endings, reverse_pair_names)
         # Report and record the crossover
         crossover_hits = [x for x in forward_reads.keys() if x in reverse_reads.keys()]
 
@@ -288,7 +600,8 @@ class Compare:
 
         return crossover_hits, forward_reads, reverse_reads
 
-    def compare_placements(self, forward_gup, reverse_gup, placement_cutoff, slash_endings, base_file):
+    def compare_placements(self, forward_gup, reverse_gup, placement_cutoff, slash_endings, base_file,
+                           forward_pair_names=None, reverse_pair_names=None):
         ## Take guppy placement file for the forward and reverse reads, compare
         ## the placement, and make a call as to which is to be trusted. Return
         ## a list of trusted reads for use by the summary step in GraftM
@@ -296,7 +609,9 @@ class Compare:
         crossover, for_dict, rev_dict = self._compare_hits(list(forward_gup.keys()),
                                                            list(reverse_gup.keys()),
                                                            base_file,
-                                                           slash_endings)
+                                                           slash_endings,
+                                                           forward_pair_names,
+                                                           reverse_pair_names)
 
         comparison_hash = {'trusted_placements': {}} # Set up a hash that will record info on each placement
         for read in crossover:
@@ -0,0 +1,261 @@
+import os
+import time
+import signal
+import asyncio
+import logging
+import threading
+import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import extern
+
+class ProcessRunner:
+    '''Runs external commands as asyncio subprocesses, so that independent
+    commands can be run at the same time, with their stdout streamed to a
+    handler line by line as it is produced rather than collected once the
+    command finishes.
+
+    The total number of threads used by the commands running at once is
+    limited across all threads and event loops of the process, so that
+    concurrent steps do not oversubscribe the machine. Each command counts
+    as the number of threads it is run with. If any of a set of commands run
+    with run_all() fails, the others are killed.
+
+    Commands are run with bash -o pipefail, as per extern.run, and failures
+    raise extern.ExternCalledProcessError. While a Profiler is installed, the
+    wall time and exit status of each command are recorded by it.
+    '''
+
+    def __init__(self, max_threads=None):
+        '''
+        Parameters
+        ----------
+        max_threads: int
+            maximum number of threads used by the commands running at once.
+            Default: the number of CPUs.
+        '''
+        self._budget = _ThreadBudget(self._thread_limit(max_threads))
+
+    @staticmethod
+    def _thread_limit(max_threads):
+        return max(1, max_threads or os.cpu_count() or 1)
+
+    @property
+    def max_threads(self):
+        return self._budget.max_threads
+
+    def set_max_threads(self, max_threads):
+        '''Change the maximum number of threads used at once. The commands
+        already running or waiting stay counted against the same budget, so
+        the limit applies to them and to those run after.'''
+        self._budget.resize(self._thread_limit(max_threads))
+
+    async def run(self, command, stdin=None, line_handler=None, threads=1):
+        '''Run a command, waiting until enough of the thread budget is free.
+
+        Parameters
+        ----------
+        command: str
+            command to be run by bash
+        stdin: str or bytes
+            written to the standard input of the command, or None
+        line_handler: function
+            if not None, called with each line (str, including the newline)
+            of the standard output of the command as it is read
+        threads: int
+            number of threads the command uses. Commands using more than
+            max_threads are run when no other command is running.
+
+        Returns
+        -------
+        the standard output of the command as a str, or None if a
+        line_handler was given
+        '''
+        budget = self._budget
+        threads = max(1, threads or 1)
+        await budget.acquire(threads)
+        try:
+            return await self._run(command, stdin, line_handler)
+        finally:
+            budget.release(threads)
+
+    def run_sync(self, command, stdin=None, threads=1):
+        '''As run(), blocking until the command has finished, for commands
+        run one at a time in place of extern.run but within the thread
+        budget'''
+        return self.run_all([self.run(command, stdin=stdin, threads=threads)])[0]
+
+    async def _run(self, command, stdin, line_handler):
+        # Local import, as the profiler is only needed when profiling
+        from graftm.profiler import Profiler
+
+        logging.debug("Running extern cmd: %s" % command)
+        loop = asyncio.get_running_loop()
+        start = time.time()
+        # Started with Popen rather than asyncio, whose child watcher would
+        # reap the process before its resource usage could be collected
+        process = subprocess.Popen(
+            ["bash", "-o", "pipefail", "-c", command],
+            stdin=subprocess.PIPE if stdin is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            # In its own process group, so that the whole pipeline can be
+            # killed if cancelled
+            start_new_session=True)
+        reaped = _in_thread(Profiler.reap, process.pid)
+        transports = []
+        try:
+            stdout_chunks = []
+            async def read_pipe(pipe):
+                reader = asyncio.StreamReader()
+                transport, _ = await loop.connect_read_pipe(
+                    lambda: asyncio.StreamReaderProtocol(reader), pipe)
+                transports.append(transport)
+                return reader
+            stdout_reader = await read_pipe(process.stdout)
+            stderr_reader = await read_pipe(process.stderr)
+            async def read_stdout():
+                async for line in stdout_reader:
+                    if line_handler:
+                        line_handler(line.decode())
+                    else:
+                        stdout_chunks.append(line)
+            written = None if stdin is None else _in_thread(
+                self._write_stdin, process.stdin,
+                stdin.encode() if isinstance(stdin, str) else stdin)
+            _, stderr = await asyncio.gather(read_stdout(), stderr_reader.read())
+            if written is not None:
+                await asyncio.wrap_future(written)
+            returncode, usage = await asyncio.wrap_future(reaped)
+        except BaseException:
+            # Cancelled, or the handler failed
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await asyncio.wrap_future(reaped)
+            raise
+        finally:
+            for transport in transports:
+                transport.close()
+        process.returncode = returncode
+
+        profiler = Profiler.installed()
+        if profiler:
+            profiler.record_command(command, time.time() - start, returncode, usage)
+        stdout = b''.join(stdout_chunks)
+        if returncode != 0:
+            raise extern.ExternCalledProcessError(
+                subprocess.CompletedProcess(command, returncode, stdout, stderr),
+                command)
+        return None if line_handler else stdout.decode('UTF-8')
+
+    @staticmethod
+    def _write_stdin(pipe, data):
+        try:
+            pipe.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            try:
+                pipe.close()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    def run_all(self, coroutines):
+        '''Run coroutines (e.g. those of run()) concurrently in a new event
+        loop, returning their results in order. If any raises an exception,
+        the others are cancelled, killing their commands, and the exception
+        is raised.
+        '''
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._run_all(coroutines))
+        # Called from within an event loop (e.g. from async code or Jupyter),
+        # which cannot run another, so run them in a loop of a new thread
+        # Local import, as the profiler is only needed when profiling
+        from graftm.profiler import Profiler
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(Profiler.copy_context().run, asyncio.run,
+                                   self._run_all(coroutines)).result()
+
+    @staticmethod
+    async def _run_all(coroutines):
+        tasks = [asyncio.ensure_future(c) for c in coroutines]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+def _in_thread(function, *args):
+    '''Call a blocking function in a new thread, returning a
+    concurrent.futures.Future of its result. The future is marked as running,
+    so it is not cancelled when an asyncio future wrapping it is, and can be
+    awaited again after a cancellation.'''
+    future = Future()
+    future.set_running_or_notify_cancel()
+    def target():
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=target, daemon=True).start()
+    return future
+
+class _ThreadBudget:
+    '''A count of the threads in use, shared by the threads and event loops
+    of the process. Coroutines wait on a future of their own loop rather than
+    blocking a thread, so that a waiter which is cancelled holds nothing.'''
+
+    def __init__(self, max_threads):
+        self.max_threads = max_threads
+        self._used = 0
+        self._lock = threading.Lock()
+        self._waiters = []
+
+    async def acquire(self, threads):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                # A command using more than the whole budget runs alone
+                if self._used + threads <= self.max_threads or self._used == 0:
+                    self._used += threads
+                    return
+                waiter = (loop, loop.create_future())
+                self._waiters.append(waiter)
+            try:
+                await waiter[1]
+            finally:
+                with self._lock:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+
+    def resize(self, max_threads):
+        with self._lock:
+            self.max_threads = max_threads
+        # Waiters may fit within a larger budget
+        self.release(0)
+
+    def release(self, threads):
+        with self._lock:
+            self._used -= threads
+            waiters, self._waiters = self._waiters, []
+        # Each waiter checks again whether there are enough threads free
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(self._wake, future)
+            except RuntimeError:
+                # The loop of the waiter has been closed
+                pass
+
+    @staticmethod
+    def _wake(future):
+        if not future.done():
+            future.set_result(None)
+
+# Shared by all graftM modules in this process, so that the limit on the
+# number of threads used at once applies to all of them
+PROCESS_RUNNER = ProcessRunner()
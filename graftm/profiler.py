@@ -0,0 +1,311 @@
+import os
+import json
+import time
+import logging
+import resource
+import subprocess
+import threading
+import contextvars
+
+import extern
+
+# extern.run as it was before any profiler was installed
+_EXTERN_RUN = extern.run
+
+# The profiler installed in the calling context, if any. It is context-local
+# so that concurrent graft runs in one process (e.g. through graftm.api) each
+# record only their own commands.
+_INSTALLED = contextvars.ContextVar('graftm_profiler', default=None)
+
+def _profiled_run(command, stdin=None):
+    '''In place of extern.run, running the command through the profiler
+    installed in the calling context, or as extern.run if there is none'''
+    profiler = _INSTALLED.get()
+    if profiler is None:
+        return _EXTERN_RUN(command, stdin=stdin)
+    return profiler.run(command, stdin)
+
+class Profiler:
+    '''Records the resources used by each stage of the graft pipeline and by
+    each external command it runs, for writing to a machine-readable report.
+
+    For each stage and command, the wall time, user and system CPU time
+    (including that of child processes), peak resident set size and bytes
+    read and written are recorded. Stages may also record the number of
+    reads they processed.
+
+    External commands are accounted for individually by running them in
+    place of extern.run while the profiler is installed in the context of
+    the caller. Their CPU time and
+    peak RSS are those of the command and its descendants, as reported when
+    the command is reaped. Bytes read and written are taken from
+    /proc/<pid>/io, so are only available on Linux, and count all reads and
+    writes, including those to pipes and those served by the page cache.
+
+    If a ScratchDirectory is given, its usage is measured after each stage
+    and command, and reported alongside them.
+
+    Commands run concurrently by the ProcessRunner are reaped by it with
+    reap(), so the same resources are recorded for them.
+    '''
+
+    def __init__(self, scratch_directory=None):
+        '''
+        Parameters
+        ----------
+        scratch_directory: ScratchDirectory
+            scratch directory of the run, or None if there is none
+        '''
+        self.scratch_directory = scratch_directory
+        self.stages = []
+        self.commands = []
+        # The stage being run by each thread, as the forward and reverse reads
+        # are searched and aligned in separate threads. Threads which did not
+        # start a stage (e.g. those of a pool used within a stage) are
+        # attributed to the most recently started stage.
+        self._thread_stage = threading.local()
+        self._current_stage = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _proc_io(pid='self'):
+        '''Return (bytes read, bytes written) by the process, or (None, None)
+        if they are not available on this system'''
+        try:
+            with open('/proc/%s/io' % pid) as f:
+                io = dict(line.split(': ') for line in f.read().splitlines())
+            return int(io['rchar']), int(io['wchar'])
+        except (IOError, OSError, KeyError, ValueError):
+            return None, None
+
+    @staticmethod
+    def _cpu_times():
+        us = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return us.ru_utime + children.ru_utime, us.ru_stime + children.ru_stime
+
+    @staticmethod
+    def _difference(end, start):
+        if end is None or start is None:
+            return None
+        return end - start
+
+    def start_stage(self, name, sample=None):
+        '''Begin recording a stage, returning the record of the stage, which
+        is to be passed to end_stage.
+
+        Parameters
+        ----------
+        name: str
+            name of the stage e.g. 'search'
+        sample: str
+            name of the sample the stage is run on, or None if it is run on
+            all samples at once
+        '''
+        user, system = self._cpu_times()
+        read, written = self._proc_io()
+        stage = {'stage': name,
+                 'sample': sample,
+                 '_start': (time.time(), user, system, read, written)}
+        self._thread_stage.stage = stage
+        self._current_stage = stage
+        return stage
+
+    def end_stage(self, stage, reads=None):
+        '''Finish recording a stage.
+
+        Parameters
+        ----------
+        stage: dict
+            as returned by start_stage
+        reads: int
+            number of reads processed by the stage, or None if not known
+        '''
+        start_time, start_user, start_system, start_read, start_written = stage.pop('_start')
+        user, system = self._cpu_times()
+        read, written = self._proc_io()
+        command_peak_rss = [c['peak_rss_kb'] for c in self.commands
+                            if c['stage'] is stage and c['peak_rss_kb'] is not None]
+        stage.update({
+            'wall_seconds': round(time.time() - start_time, 3),
+            'user_seconds': round(user - start_user, 3),
+            'system_seconds': round(system - start_system, 3),
+            # ru_maxrss of this process is the peak over its lifetime, so far
+            'peak_rss_kb': max([resource.getrusage(resource.RUSAGE_SELF).ru_maxrss] + command_peak_rss),
+            'bytes_read': self._difference(read, start_read),
+            'bytes_written': self._difference(written, start_written),
+            'reads': reads})
+        if self.scratch_directory:
+            stage['scratch_bytes'] = self.scratch_directory.measure()
+        with self._lock:
+            self.stages.append(stage)
+        if getattr(self._thread_stage, 'stage', None) is stage:
+            self._thread_stage.stage = None
+        if self._current_stage is stage:
+            self._current_stage = None
+
+    def current_stage(self):
+        '''Return the stage being run by the calling thread, or None'''
+        return getattr(self._thread_stage, 'stage', None) or self._current_stage
+
+    def run(self, command, stdin=None):
+        '''As extern.run, recording the resources used by the command'''
+        stdout, stderr, record = self._execute(command, stdin)
+        self._record(record)
+        return self._check(command, stdout, stderr, record)
+
+    @staticmethod
+    def run_measured(command):
+        '''As extern.run, but returning (stdout, record) where record is a
+        dict of the resources used by the command itself, as in report().
+        The command is recorded by the installed profiler, if any.'''
+        stdout, stderr, record = Profiler._execute(command, None)
+        profiler = Profiler.installed()
+        if profiler:
+            profiler._record(record)
+        return Profiler._check(command, stdout, stderr, record), record
+
+    @staticmethod
+    def _check(command, stdout, stderr, record):
+        if record['exit_status'] != 0:
+            raise extern.ExternCalledProcessError(
+                subprocess.CompletedProcess(["bash", '-o', 'pipefail', "-c", command],
+                                            record['exit_status'], stdout, stderr),
+                command)
+        return stdout.decode('UTF-8')
+
+    def _record(self, record):
+        record['stage'] = self.current_stage()
+        with self._lock:
+            if self.scratch_directory:
+                record['scratch_bytes'] = self.scratch_directory.measure()
+            self.commands.append(record)
+
+    @staticmethod
+    def _execute(command, stdin):
+        '''Run a command, returning (stdout, stderr, record) without raising
+        if it fails'''
+        logging.debug("Running extern cmd: %s" % command)
+        start = time.time()
+        process = subprocess.Popen(
+            ["bash", '-o', 'pipefail', "-c", command],
+            stdin=subprocess.PIPE if stdin is not None else None,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = Profiler._communicate(
+            process, stdin.encode() if isinstance(stdin, str) else stdin)
+
+        exit_status, usage = Profiler.reap(process.pid)
+        process.returncode = exit_status
+        record = Profiler._command_record(command, time.time() - start,
+                                          exit_status, usage)
+        return stdout, stderr, record
+
+    @staticmethod
+    def reap(pid):
+        '''Wait for a child process to finish and reap it, returning
+        (exit status, usage) where usage is a dict of the resources used by
+        the process and its descendants, as in the records of report(). The
+        process must not be reaped by anything else, e.g. an asyncio child
+        watcher.'''
+        # Read the IO counters of the finished process before it is reaped
+        os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+        read, written = Profiler._proc_io(pid)
+        _, status, usage = os.wait4(pid, 0)
+        return os.waitstatus_to_exitcode(status), {
+            'user_seconds': round(usage.ru_utime, 3),
+            'system_seconds': round(usage.ru_stime, 3),
+            'peak_rss_kb': usage.ru_maxrss,
+            'bytes_read': read,
+            'bytes_written': written}
+
+    @staticmethod
+    def _command_record(command, wall_seconds, exit_status, usage):
+        record = {'command': command,
+                  'stage': None,
+                  'wall_seconds': round(wall_seconds, 3)}
+        record.update(usage)
+        record['exit_status'] = exit_status
+        return record
+
+    def record_command(self, command, wall_seconds, exit_status, usage):
+        '''Record a command run other than through run(), given the usage
+        returned by reap()'''
+        self._record(self._command_record(command, wall_seconds, exit_status, usage))
+
+    @staticmethod
+    def _communicate(process, stdin):
+        '''Write stdin to the process and read all of its stdout and stderr,
+        without waiting for it (so that it can be reaped by os.wait4)'''
+        outputs = {}
+        def read(name, stream):
+            outputs[name] = stream.read()
+            stream.close()
+        readers = [threading.Thread(target=read, args=(name, stream)) for name, stream in
+                   (('stdout', process.stdout), ('stderr', process.stderr))]
+        for reader in readers: reader.start()
+        if process.stdin is not None:
+            try:
+                process.stdin.write(stdin)
+            except BrokenPipeError:
+                pass
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+        for reader in readers: reader.join()
+        return outputs['stdout'], outputs['stderr']
+
+    @staticmethod
+    def installed():
+        '''Return the profiler installed in the calling context, or None'''
+        return _INSTALLED.get()
+
+    def install(self):
+        '''Profile all commands run through extern.run in the calling context
+        (and threads started with a copy of it, see copy_context()) until
+        uninstall() is called. extern.run is replaced once, by a function
+        which runs commands as before in contexts without a profiler.'''
+        extern.run = _profiled_run
+        _INSTALLED.set(self)
+
+    def uninstall(self):
+        if _INSTALLED.get() is self:
+            _INSTALLED.set(None)
+
+    @staticmethod
+    def copy_context():
+        '''Return a copy of the calling context, for running functions in
+        other threads (with its run method) so that their commands are
+        recorded by the profiler installed in the calling context'''
+        return contextvars.copy_context()
+
+    @staticmethod
+    def reset():
+        '''Restore extern.run as it was before any profiler was installed,
+        and remove the profiler of the calling context, e.g. after a job which
+        may have left one installed, so that later jobs do not record into
+        it'''
+        extern.run = _EXTERN_RUN
+        _INSTALLED.set(None)
+
+    def report(self):
+        '''Return the profile as a JSON-serialisable dict'''
+        stage_indices = {id(stage): i for i, stage in enumerate(self.stages)}
+        commands = []
+        for command in self.commands:
+            command = dict(command)
+            stage = command.pop('stage')
+            command['stage'] = None if stage is None else stage['stage']
+            command['sample'] = None if stage is None else stage['sample']
+            command['stage_index'] = stage_indices.get(id(stage))
+            commands.append(command)
+        report = {'stages': self.stages, 'commands': commands}
+        if self.scratch_directory:
+            report['scratch'] = self.scratch_directory.report()
+        return report
+
+    def write(self, path):
+        logging.info("Writing profile to %s" % path)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=1)
@@ -0,0 +1,146 @@
+import re
+from array import array
+
+class ReadIdTable:
+    '''Compact integer identifiers for the reads passed between the placement
+    stages of graft, each mapped to a record of the sample (file index) it
+    came from, its name, and the read name, ORF and split parsed from the
+    suffixes appended by OrfM and SequenceSearcher._extract_multiple_hits.
+
+    Names are parsed once when a read is added, so later stages use the IDs
+    and recorded fields rather than appending and stripping suffixes of the
+    name, and the name is only needed again when writing output.
+    '''
+
+    # OrfM appends _startPosition_frameNumber_orfNumber to the name of the
+    # read. Unlike OrfM.regular_expression() this is anchored at the end, so
+    # that underscores elsewhere in read names are kept.
+    ORF_REGEX = re.compile(r'^(.+)_(\d+)_(\d)_(\d+)$')
+    # Appended by SequenceSearcher._extract_multiple_hits, before OrfM is run
+    SPLIT_REGEX = re.compile(r'^(.+)_split_(\d+)$')
+
+    NOT_PRESENT = -1
+
+    # Reads are named by ID in the alignment given to pplacer. Reference
+    # sequences are often named by numeric IDs, so the prefix keeps query
+    # names distinct from them.
+    PLACED_NAME_PREFIX = 'graftm_q'
+
+    def __init__(self):
+        self._samples = array('i')
+        self._names = []
+        self._read_names = []
+        self._orf_starts = array('q')
+        self._orf_frames = array('b')
+        self._orf_numbers = array('i')
+        self._splits = array('i')
+
+    def __len__(self):
+        return len(self._names)
+
+    @staticmethod
+    def parse_name(name):
+        '''Parse a name given to a hit in graft
+
+        Returns
+        -------
+        (read_name, orf, split) where orf is a (start, frame, number) tuple
+        and split the index of the hit within the read, each None if the name
+        has no such suffix.
+        '''
+        orf = None
+        match = ReadIdTable.ORF_REGEX.match(name)
+        if match:
+            name = match.group(1)
+            orf = (int(match.group(2)), int(match.group(3)), int(match.group(4)))
+        split = None
+        match = ReadIdTable.SPLIT_REGEX.match(name)
+        if match:
+            name = match.group(1)
+            split = int(match.group(2))
+        return name, orf, split
+
+    def add(self, sample, name):
+        '''Add a read, returning its ID
+
+        Parameters
+        ----------
+        sample: int
+            index of the file (or sample) the read came from
+        name: str
+            name of the read, as aligned
+
+        Returns
+        -------
+        int
+        '''
+        read_name, orf, split = self.parse_name(name)
+        read_id = len(self._names)
+        self._samples.append(sample)
+        self._names.append(name)
+        # The name is shared rather than copied when there are no suffixes
+        self._read_names.append(name if read_name == name else read_name)
+        start, frame, number = orf if orf else (self.NOT_PRESENT,)*3
+        self._orf_starts.append(start)
+        self._orf_frames.append(frame)
+        self._orf_numbers.append(number)
+        self._splits.append(self.NOT_PRESENT if split is None else split)
+        return read_id
+
+    def sample(self, read_id):
+        return self._samples[read_id]
+
+    def name(self, read_id):
+        '''Return the name of the read as it was added, for output'''
+        return self._names[read_id]
+
+    def read_name(self, read_id):
+        '''Return the name of the read the hit came from, without the ORF or
+        split suffixes'''
+        return self._read_names[read_id]
+
+    def orf(self, read_id):
+        '''Return the (start, frame, number) of the ORF, or None'''
+        if self._orf_starts[read_id] == self.NOT_PRESENT:
+            return None
+        return (self._orf_starts[read_id], self._orf_frames[read_id],
+                self._orf_numbers[read_id])
+
+    def split(self, read_id):
+        '''Return the index of the hit within the read, or None if there was
+        only one'''
+        split = self._splits[read_id]
+        return None if split == self.NOT_PRESENT else split
+
+    @staticmethod
+    def placed_name(read_id):
+        '''Return the name of a read in the alignment given to pplacer'''
+        return ReadIdTable.PLACED_NAME_PREFIX + str(read_id)
+
+    @staticmethod
+    def placed_name_id(placed_name):
+        '''Return the read ID of a name returned by placed_name()'''
+        return int(placed_name[len(ReadIdTable.PLACED_NAME_PREFIX):])
+
+    def resolve(self, read_id):
+        '''Return the (file alias, name) of a read, where the alias is the
+        sample index as a str as used in the alias_hash of Pplacer'''
+        return str(self._samples[read_id]), self._names[read_id]
+
+    def pair_names(self, sample, slash_endings):
+        '''Return a dict of the name of each read of a sample to the name
+        shared by both reads of its pair, i.e. the read name without ORF or
+        split suffixes or, if slash_endings, the trailing /1 or /2'''
+        pair_names = {}
+        for read_id, read_sample in enumerate(self._samples):
+            if read_sample == sample:
+                pair_names[self._names[read_id]] = self.pair_name(
+                    self._read_names[read_id], slash_endings)
+        return pair_names
+
+    @staticmethod
+    def pair_name(read_name, slash_endings):
+        '''Return the name shared by both reads of a pair given the read name
+        without ORF or split suffixes, i.e. without the trailing /1 or /2 if
+        slash_endings'''
+        return read_name[:-2] if slash_endings else read_name
@@ -0,0 +1,185 @@
+import math
+import logging
+import threading
+
+class ReadSampling:
+    '''The number of reads examined and kept when graft is run on a subset of
+    the reads of an input (--max_reads and/or --subsample_fraction), from
+    which the counts of the reads examined are estimated.
+
+    Subsampled reads are chosen by a hash of their name, so each read is kept
+    independently with probability subsample_fraction, and the count of a
+    lineage is binomially distributed. Estimates are scaled by the inverse of
+    the fraction, with a normal approximation confidence interval.
+    '''
+
+    FILE_HEADER = ['reads_examined', 'reads_kept', 'complete']
+
+    # Two-sided 95% confidence interval
+    Z_SCORE = 1.959964
+
+    def __init__(self, reads_seen, reads_kept, complete, subsample_fraction=None):
+        '''
+        Parameters
+        ----------
+        reads_seen: int
+            number of reads read from the input
+        reads_kept: int
+            number of those reads passed on for searching
+        complete: bool
+            True if the whole input was read, False if reading stopped early
+            because of --max_reads
+        subsample_fraction: float
+            fraction of reads kept, or None if all reads were kept
+        '''
+        self.reads_seen = reads_seen
+        self.reads_kept = reads_kept
+        self.complete = complete
+        self.subsample_fraction = subsample_fraction
+
+    @staticmethod
+    def read(path, subsample_fraction=None):
+        '''Read the counts written by the sampling command of
+        UnpackRawReads'''
+        with open(path) as f:
+            fields = f.read().split()
+        return ReadSampling(int(fields[0]), int(fields[1]), fields[2] == '1',
+                            subsample_fraction)
+
+    @staticmethod
+    def combine(samplings):
+        '''Return the ReadSampling of a sample from those of each of its read
+        files (e.g. forward and reverse), or None if they were not sampled.
+        Reads are counted across the files, as are the hits found.'''
+        samplings = [s for s in samplings if s is not None]
+        if len(samplings) == 0:
+            return None
+        return ReadSampling(sum([s.reads_seen for s in samplings]),
+                            sum([s.reads_kept for s in samplings]),
+                            all([s.complete for s in samplings]),
+                            samplings[0].subsample_fraction)
+
+    def scale(self):
+        '''Return the factor by which counts are multiplied to estimate those
+        of all the reads examined'''
+        return 1.0 / self.subsample_fraction if self.subsample_fraction else 1.0
+
+    def estimate(self, count):
+        '''Return the estimated count of all reads examined, and the lower and
+        upper bounds of its confidence interval, given the count observed in
+        the reads kept'''
+        scale = self.scale()
+        estimate = count * scale
+        if self.subsample_fraction is None:
+            return estimate, estimate, estimate
+        half_width = self.Z_SCORE * math.sqrt(count * (1 - self.subsample_fraction)) * scale
+        return estimate, max(count, estimate - half_width), estimate + half_width
+
+
+class AdaptiveSampling:
+    '''Decides the number of reads searched by --adaptive_sampling for a
+    sample. Each round, every read file of the sample (e.g. forward and
+    reverse) is searched to the same --max_reads, and the number is doubled
+    until the rate of hits per read across the files is stable between
+    rounds, or an input has been read to the end. The files therefore stop
+    together, so mates are not lost and the sample has one sample size.
+
+    Each file is searched in its own thread, calling stop() after each
+    round, which waits until the other files have reported the same round.
+    '''
+
+    def __init__(self, file_count, max_reads, tolerance):
+        '''
+        Parameters
+        ----------
+        file_count: int
+            number of read files searched for the sample
+        max_reads: int
+            number of reads searched in the first round
+        tolerance: float
+            relative change in the rate of hits per read below which
+            sampling stops
+        '''
+        self.max_reads = max_reads
+        self._file_count = file_count
+        self._tolerance = tolerance
+        self._condition = threading.Condition()
+        self._reports = []
+        self._round = 0
+        self._previous_hit_rate = None
+        self._stopped = False
+        self._fixed = False
+
+    def stop(self, max_reads, hit_count, sampling):
+        '''Report the hits found in a round of searching a read file,
+        waiting for the other files of the sample to report theirs.
+
+        Parameters
+        ----------
+        max_reads: int or None
+            number of reads the round searched
+        hit_count: int
+            number of hits found
+        sampling: ReadSampling
+            reads examined by the round
+
+        Returns
+        -------
+        True if searching should stop, otherwise the file is searched again
+        to the (updated) max_reads attribute.
+        '''
+        with self._condition:
+            if self._stopped:
+                return True
+            if not self._fixed:
+                round_index = self._round
+                self._reports.append((hit_count, sampling))
+                if len(self._reports) >= self._file_count:
+                    self._decide()
+                else:
+                    self._condition.wait_for(
+                        lambda: self._round != round_index or self._fixed)
+            if self._fixed:
+                return sampling.complete or max_reads == self.max_reads
+            return self._stopped
+
+    def withdraw(self, sampling):
+        '''Stop waiting for a read file whose search was not run, e.g.
+        because it was loaded from a checkpoint, given the ReadSampling of
+        that search. The other files are then searched to the same number
+        of reads, without further rounds.'''
+        with self._condition:
+            self._file_count -= 1
+            if not self._fixed:
+                self._fixed = True
+                self.max_reads = None if sampling is None or sampling.complete \
+                    else sampling.reads_seen
+            self._condition.notify_all()
+
+    def abort(self):
+        '''Release the other read files of the sample after the search of
+        one failed'''
+        with self._condition:
+            self._stopped = True
+            self._round += 1
+            self._condition.notify_all()
+
+    def _decide(self):
+        hit_count = sum([hits for hits, _ in self._reports])
+        sampling = ReadSampling.combine([s for _, s in self._reports])
+        hit_rate = float(hit_count) / max(1, sampling.reads_seen)
+        if any([s.complete for _, s in self._reports]):
+            self._stopped = True
+        elif self._previous_hit_rate is not None and \
+                abs(hit_rate - self._previous_hit_rate) <= \
+                self._tolerance * max(hit_rate, self._previous_hit_rate):
+            logging.info("Hit rate stabilised after examining %i reads" % sampling.reads_seen)
+            self._stopped = True
+        else:
+            self._previous_hit_rate = hit_rate
+            self.max_reads *= 2
+            logging.info("Hit rate of %f after examining %i reads, searching %i reads" % (
+                hit_rate, sampling.reads_seen, self.max_reads))
+        self._reports = []
+        self._round += 1
+        self._condition.notify_all()
@@ -0,0 +1,63 @@
+import os
+import logging
+import threading
+
+class ResidentCache:
+    '''Keeps objects loaded from files, such as GraftM packages and parsed
+    taxonomies, in memory so that a long-running process (i.e. graftM serve)
+    loads them once rather than once per job.
+
+    Entries are keyed on the paths, sizes and modification times of the
+    files they were loaded from, so they are reloaded if the files change.
+    The cache is disabled unless enable() is called, in which case get()
+    simply calls the loader, so that one-off runs do not hold on to objects
+    longer than they need to.
+    '''
+
+    def __init__(self):
+        self._entries = {}
+        self._enabled = False
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self._enabled = True
+
+    @staticmethod
+    def _file_key(path):
+        try:
+            stat = os.stat(path)
+            return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            return (os.path.abspath(path), None, None)
+
+    def get(self, kind, paths, loader):
+        '''Return the object of the given kind loaded from paths, calling
+        loader() to load it if it is not already in the cache.
+
+        Parameters
+        ----------
+        kind: hashable
+            what is loaded, distinguishing different objects loaded from the
+            same files
+        paths: list of str
+            files the object is loaded from
+        loader: function
+            called with no arguments to load the object
+        '''
+        if not self._enabled:
+            return loader()
+        key = (kind,) + tuple([self._file_key(p) for p in paths])
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key]
+        logging.debug("Loading %s into resident cache from %s" % (kind, ', '.join(paths)))
+        value = loader()
+        with self._lock:
+            self._entries[key] = value
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+# Shared by all graftM modules in this process
+RESIDENT_CACHE = ResidentCache()
@@ -4,30 +4,22 @@ import os
 import logging
 import tempfile
 import shutil
+import json
 
-from graftm.sequence_search_results import SequenceSearchResult
 from graftm.graftm_output_paths import GraftMFiles
-from graftm.search_table import SearchTableWriter
-from graftm.sequence_searcher import SequenceSearcher
-from graftm.hmmsearcher import NoInputSequencesException
 from graftm.housekeeping import HouseKeeping
-from graftm.summarise import Stats_And_Summary
-from graftm.pplacer import Pplacer
-from graftm.create import Create
-from graftm.update import Update
 from graftm.unpack_sequences import UnpackRawReads
 from graftm.graftm_package import GraftMPackage
-from graftm.expand_searcher import ExpandSearcher
-from graftm.diamond import Diamond
-from graftm.getaxnseq import Getaxnseq
-from graftm.sequence_io import SequenceIO
 from graftm.timeit import Timer
-from graftm.clusterer import Clusterer
-from graftm.decorator import Decorator
 from graftm.external_program_suite import ExternalProgramSuite
-from graftm.archive import Archive
-from graftm.decoy_filter import DecoyFilter
-from biom.util import biom_open
+from graftm.version import __version__
+from graftm.resident_cache import RESIDENT_CACHE
+from graftm.graft_result import GraftResult
+from graftm.read_sampling import ReadSampling, AdaptiveSampling
+
+# Modules used by only some subcommands are imported where they are used,
+# since importing them all (and Biopython, biom, dendropy etc. in turn)
+# dominates the start up time of short graftM invocations.
 
 T=Timer()
 
@@ -43,14 +35,21 @@ class Run:
 
     PPLACER_TAXONOMIC_ASSIGNMENT = 'pplacer'
     DIAMOND_TAXONOMIC_ASSIGNMENT = 'diamond'
+    NEAREST_REFERENCE_TAXONOMIC_ASSIGNMENT = 'nearest_reference'
 
     MIN_ALIGNED_FILTER_FOR_NUCLEOTIDE_PACKAGES = 95
     MIN_ALIGNED_FILTER_FOR_AMINO_ACID_PACKAGES = 30
 
     DEFAULT_MAX_SAMPLES_FOR_KRONA = 100
+    # Reads examined in the first round of --adaptive_sampling, unless
+    # --max_reads is given
+    DEFAULT_ADAPTIVE_SAMPLING_READS = 100000
 
     NO_ORFS_EXITSTATUS = 128
 
+    GRAFT_PROGRAMS = ['orfm', 'nhmmer', 'hmmsearch', 'mfqe', 'pplacer',
+                      'ktImportText', 'diamond']
+
     def __init__(self, args):
         self.args = args
         self.setattributes(self.args)
@@ -58,11 +57,19 @@ class Run:
     def setattributes(self, args):
 
         self.hk = HouseKeeping()
-        self.s = Stats_And_Summary()
         if args.subparser_name == 'graft':
-            commands = ExternalProgramSuite(['orfm', 'nhmmer', 'hmmsearch',
-                                             'mfqe', 'pplacer',
-                                             'ktImportText', 'diamond'])
+            from graftm.sequence_searcher import SequenceSearcher
+            from graftm.summarise import Stats_And_Summary
+            from graftm.pplacer import Pplacer
+            from graftm.placement_cache import PlacementCache
+            from graftm.taxonomy_registry import TaxonomyRegistry
+
+            self.s = Stats_And_Summary()
+            self.scratch = None
+            # Only checked once by a graftM serve process
+            commands = RESIDENT_CACHE.get(
+                'graft_programs', [],
+                lambda: ExternalProgramSuite(Run.GRAFT_PROGRAMS))
             self.hk.set_attributes(self.args)
             self.hk.set_euk_hmm(self.args)
             if args.euk_check:self.args.search_hmm_files.append(self.args.euk_hmm_file)
@@ -70,11 +77,27 @@ class Run:
             self.ss = SequenceSearcher(self.args.search_hmm_files,
                            (None if self.args.search_only else self.args.aln_hmm_file))
             self.sequence_pair_list = self.hk.parameter_checks(args)
+            # Lineages of assigned reads are interned here, and shared
+            # between the taxonomic assignment and summary steps
+            self.taxonomy_registry = TaxonomyRegistry()
             if hasattr(args, 'reference_package'):
-                self.p = Pplacer(self.args.reference_package)
+                if self.args.placement_cache:
+                    placement_cache = PlacementCache(self.args.placement_cache,
+                                                     self.args.reference_package,
+                                                     self.args.placement_cache_max_entries)
+                else:
+                    placement_cache = None
+                self.p = Pplacer(self.args.reference_package,
+                                 placement_cache,
+                                 chunk_size=self.args.pplacer_chunk_size,
+                                 max_processes=self.args.pplacer_processes,
+                                 max_memory=self.args.pplacer_max_memory,
+                                 mmap_directory=self.args.pplacer_mmap_directory,
+                                 pretty_jplace=self.args.pretty_jplace)
 
 
         elif self.args.subparser_name == "create":
+            from graftm.create import Create
             commands = ExternalProgramSuite(['taxit', 'FastTreeMP',
                                              'hmmalign', 'mafft'])
             self.create = Create(commands)
@@ -83,7 +106,7 @@ class Run:
 
 
     def summarise(self, base_list, trusted_placements, reverse_pipe, times,
-                  hit_read_count_list, max_samples_for_krona):
+                  hit_read_count_list, max_samples_for_krona, read_sampling=None):
         '''
         summarise - write summary information to file, including otu table, biom
                     file, krona plot, and timing information
@@ -109,9 +132,14 @@ class Run:
         max_samples_for_krona: int
             If the number of files processed is greater than this number, then
             do not generate a krona diagram.
+        read_sampling: dict
+            ReadSampling of each sample, if only some of its reads were
+            searched. Counts are then scaled to estimates, which are written
+            with their confidence intervals to a separate table.
         Returns
         -------
         '''
+        from biom.util import biom_open
 
         # Summary steps.
         placements_list = []
@@ -130,13 +158,22 @@ class Run:
         #                         self.gmf.coverage_table_path(base),
         #                         summary_dict[base]['read_length'])
 
+        # Count reads once, for the summary table, biom file and krona plot
+        otu_table = self.s.otu_table(placements_list)
+        if read_sampling:
+            samplings = [read_sampling[base] for base in base_list]
+            logging.info('Writing estimated counts')
+            with open(self.gmf.count_estimates_output_path(), 'w') as f:
+                self.s.write_count_estimates(base_list, otu_table, samplings, f)
+            otu_table = otu_table.scaled([s.scale() for s in samplings])
+
         logging.info('Writing summary table')
         with open(self.gmf.combined_summary_table_output_path(), 'w') as f:
-            self.s.write_tabular_otu_table(base_list, placements_list, f)
+            self.s.write_tabular_otu_table(base_list, otu_table, f)
 
         logging.info('Writing biom file')
         with biom_open(self.gmf.combined_biom_output_path(), 'w') as f:
-            biom_successful = self.s.write_biom(base_list, placements_list, f)
+            biom_successful = self.s.write_biom(base_list, otu_table, f)
         if not biom_successful:
             os.remove(self.gmf.combined_biom_output_path())
 
@@ -144,16 +181,18 @@ class Run:
         if len(base_list) > max_samples_for_krona:
             logging.warn("Skipping creation of Krona diagram since there are too many input files. The maximum can be overridden using --max_samples_for_krona")
         else:
-            self.s.write_krona_plot(base_list, placements_list, self.gmf.krona_output_path())
+            self.s.write_krona_plot(base_list, otu_table, self.gmf.krona_output_path())
 
         # Basic statistics
         placed_reads=[len(trusted_placements[base]) for base in base_list]
         self.s.build_basic_statistics(times, hit_read_count_list, placed_reads, \
-                                      base_list, self.gmf.basic_stats_path())
+                                      base_list, self.gmf.basic_stats_path(),
+                                      [read_sampling[base] for base in base_list] \
+                                          if read_sampling else None)
 
         # Delete unnecessary files
         logging.info('Cleaning up')
-        for base in base_list:
+        for base in ([] if self.args.keep_intermediates else base_list):
             directions = ['forward', 'reverse']
             if reverse_pipe:
                 for i in range(0,2):
@@ -191,6 +230,43 @@ class Run:
         # The Graft pipeline:
         # Searches for reads using hmmer, and places them in phylogenetic
         # trees to derive a community structure.
+        try:
+            result = self.graft_pipeline()
+            if result is None:
+                return
+
+            stage = self.profiler.start_stage('summary')
+            self.summarise(result.samples, result.assignments, self._reverse_pipe,
+                           [result.times[stage_name] for stage_name in GraftResult.TIMED_STAGES],
+                           self._hit_read_count_list, self.args.max_samples_for_krona,
+                           result.read_sampling)
+            self.profiler.end_stage(stage, sum([len(a) for a in result.assignments.values()]))
+            self._write_profile()
+            self._write_shard_manifest()
+            return result
+        finally:
+            # The profiler is only uninstalled by _write_profile on success, so
+            # also when graft fails or exits early
+            if getattr(self, 'profiler', None) is not None:
+                self.profiler.uninstall()
+            self._remove_scratch()
+
+    def graft_pipeline(self):
+        '''Run the search, alignment and taxonomic assignment steps of graft,
+        without writing the summary outputs, returning a GraftResult (or None
+        if there are no samples to run in this shard). Intermediate files are
+        written to the output directory.'''
+        from concurrent.futures import ThreadPoolExecutor
+        from graftm.search_table import SearchTableWriter
+        from graftm.expand_searcher import ExpandSearcher
+        from graftm.diamond import Diamond
+        from graftm.decoy_filter import DecoyFilter
+        from graftm.clusterer import Clusterer
+        from graftm.checkpoint import Checkpointer
+        from graftm.profiler import Profiler
+        from graftm.scratch import ScratchDirectory
+        from graftm.process_runner import PROCESS_RUNNER
+
         if self.args.graftm_package:
             gpkg = GraftMPackage.acquire(self.args.graftm_package)
         else:
@@ -202,7 +278,12 @@ class Run:
         seqs_list           = []
         search_results      = []
         hit_read_count_list = []
+        sample_hit_counts   = {}
+        sample_samplings    = {}
         db_search_results   = []
+        # Whether read names end in /1 or /2, as of the last read file with
+        # hits
+        slash_endings       = False
 
 
         if gpkg:
@@ -255,7 +336,31 @@ class Run:
         # Set the output directory if not specified and create that directory
         logging.debug('Creating working directory: %s' % self.args.output_directory)
         self.hk.make_working_directory(self.args.output_directory,
-                                       self.args.force)
+                                       self.args.force,
+                                       self.args.resume)
+
+        if self.args.shard_count is not None or self.args.shard_index is not None:
+            self.sequence_pair_list = self._shard_sequence_pairs(self.sequence_pair_list,
+                                                                 self.args.shard_index,
+                                                                 self.args.shard_count,
+                                                                 INTERLEAVED,
+                                                                 self.args.input_format)
+            if len(self.sequence_pair_list) == 0:
+                logging.info("No samples assigned to shard %i of %i" % (
+                    self.args.shard_index, self.args.shard_count))
+                self._write_shard_manifest()
+                return None
+
+        if self.args.tmpdir:
+            self.scratch = ScratchDirectory(self.args.tmpdir)
+            logging.info("Writing transient files to %s" % self.scratch.path)
+            self.ss.temporary_directory = self.scratch.path
+            if hasattr(self, 'p'):
+                self.p.temporary_directory = self.scratch.path
+        self.profiler = Profiler(self.scratch)
+        self.profiler.install()
+        # Commands run at the same time share the thread budget
+        PROCESS_RUNNER.set_max_threads(self.args.threads)
 
         # Set pipeline and evalue by checking HMM format
         if self.args.search_only:
@@ -312,24 +417,54 @@ class Run:
 
         first_search_method = self.args.search_method
         if self.args.decoy_database:
-            decoy_filter = DecoyFilter(Diamond(diamond_db, threads=self.args.threads),
+            decoy_filter = DecoyFilter(Diamond(diamond_db, threads=self.args.threads,
+                                               temporary_directory=self._temporary_directory()),
                                        Diamond(self.args.decoy_database,
-                                               threads=self.args.threads))
+                                               threads=self.args.threads,
+                                               temporary_directory=self._temporary_directory()))
             doing_decoy_search = True
         elif self.args.search_method == self.hk.HMMSEARCH_AND_DIAMOND_SEARCH_METHOD:
-            decoy_filter = DecoyFilter(Diamond(diamond_db, threads=self.args.threads))
+            decoy_filter = DecoyFilter(Diamond(diamond_db, threads=self.args.threads,
+                                               temporary_directory=self._temporary_directory()))
             doing_decoy_search = True
             first_search_method = self.hk.HMMSEARCH_SEARCH_METHOD
         else:
             doing_decoy_search = False
 
+        if self.args.resume:
+            checkpointer = Checkpointer(self.args.output_directory, vars(self.args))
+        else:
+            checkpointer = None
+
+        # Unless their files are required, aligned reads are kept in memory,
+        # keyed by the path they would otherwise be written to
+        if self.args.keep_intermediates or self.args.search_and_align_only or \
+                self.args.merge_reads:
+            aligned_sequences = None
+        else:
+            aligned_sequences = {}
+
+        # Settings shared by the search and alignment of each read file
+        pipeline = {'checkpointer': checkpointer,
+                    'search_method': first_search_method,
+                    'maximum_range': maximum_range,
+                    'diamond_db': diamond_db,
+                    'decoy_filter': decoy_filter if doing_decoy_search else None,
+                    'filter_minimum': filter_minimum,
+                    'align_in_memory': aligned_sequences is not None}
+
+        # Paths of outputs combining all samples
+        self.gmf = GraftMFiles('', self.args.output_directory, False,
+                               self._scratch_path())
+
         # For each pair (or single file passed to GraftM)
         logging.debug('Working with %i file(s)' % len(self.sequence_pair_list))
         for pair in self.sequence_pair_list:
             # Guess the sequence file type, if not already specified to GraftM
             unpack = UnpackRawReads(pair[0],
                                     self.args.input_sequence_type,
-                                    INTERLEAVED)
+                                    INTERLEAVED,
+                                    input_format=self.args.input_format)
 
             # Set the basename, and make an entry to the summary table.
             base = unpack.basename()
@@ -339,18 +474,18 @@ class Run:
             # Make the working base subdirectory
             self.hk.make_working_directory(os.path.join(self.args.output_directory,
                                                         base),
-                                           self.args.force)
+                                           self.args.force,
+                                           self.args.resume)
 
             # for each of the paired end read files
+            read_files = []
             for read_file in pair:
-                unpack = UnpackRawReads(read_file,
-                                        self.args.input_sequence_type,
-                                        INTERLEAVED)
                 if read_file is None:
                     # placeholder for interleaved (second file is None)
                     continue
 
-                if not os.path.isfile(read_file): # Check file exists
+                if not os.path.isfile(read_file) and \
+                        not UnpackRawReads.is_stream_path(read_file): # Check file exists
                     logging.info('%s does not exist! Skipping this file..' % read_file)
                     continue
 
@@ -358,105 +493,67 @@ class Run:
                 if len(pair) == 2:
                     direction = 'interleaved' if pair[1] is None \
                                               else pair_direction.pop(0)
-                    logging.info("Working on %s reads" % direction)
-                    self.gmf = GraftMFiles(base,
-                                           self.args.output_directory,
-                                           direction)
                     self.hk.make_working_directory(os.path.join(self.args.output_directory,
                                                                 base,
                                                                 direction),
-                                                   self.args.force)
+                                                   self.args.force,
+                                                   self.args.resume)
                 else:
                     direction = False
-                    self.gmf = GraftMFiles(base,
-                                           self.args.output_directory,
-                                           direction)
-
-                if self.args.type == self.PIPELINE_AA:
-                    logging.debug("Running protein pipeline")
-                    try:
-                        search_time, (result, complement_information) = self.ss.aa_db_search(
-                            self.gmf,
-                            base,
-                            unpack,
-                            first_search_method,
-                            maximum_range,
-                            self.args.threads,
-                            self.args.evalue,
-                            self.args.min_orf_length,
-                            self.args.restrict_read_length,
-                            diamond_db
-                        )
-                    except NoInputSequencesException as e:
-                        logging.error("No sufficiently long open reading frames were found, indicating"
-                                      " either the input sequences are too short or the min orf length"
-                                      " cutoff is too high. Cannot continue sorry. Alternatively, there"
-                                      " is something amiss with the installation of OrfM. The specific"
-                                      " command that failed was: %s" % e.command)
-                        exit(Run.NO_ORFS_EXITSTATUS)
-
-                # Or the DNA pipeline
-                elif self.args.type == self.PIPELINE_NT:
-                    logging.debug("Running nucleotide pipeline")
-                    search_time, (result, complement_information)  = self.ss.nt_db_search(
-                        self.gmf,
-                        base,
-                        unpack,
-                        self.args.euk_check,
-                        self.args.search_method,
-                        maximum_range,
-                        self.args.threads,
-                        self.args.evalue
-                    )
-
-                reads_detected = True
-                if not result.hit_fasta() or os.path.getsize(result.hit_fasta()) == 0:
-                    logging.info('No reads found in %s' % base)
-                    reads_detected = False
-
-
+                read_files.append((read_file, direction))
+
+            adaptive_sampling = None
+            if self.args.adaptive_sampling:
+                adaptive_sampling = AdaptiveSampling(
+                    len(read_files),
+                    self.args.max_reads or Run.DEFAULT_ADAPTIVE_SAMPLING_READS,
+                    self.args.adaptive_tolerance)
+
+            if len(read_files) == 2:
+                # Forward and reverse reads are searched and aligned at the
+                # same time, each with half of the threads
+                threads = [max(1, (self.args.threads+1) // 2),
+                           max(1, self.args.threads // 2)]
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    # Each in a copy of this context, so that their commands
+                    # are recorded by the profiler of this run
+                    futures = [executor.submit(Profiler.copy_context().run,
+                                               self._search_and_align,
+                                               read_file, base, direction,
+                                               read_threads, pipeline,
+                                               adaptive_sampling)
+                               for (read_file, direction), read_threads
+                               in zip(read_files, threads)]
+                    outcomes = [future.result() for future in futures]
+            else:
+                outcomes = [self._search_and_align(read_file, base, direction,
+                                                   self.args.threads, pipeline,
+                                                   adaptive_sampling)
+                            for read_file, direction in read_files]
+
+            for result, search_time, sample_aln_time, hit_aligned_reads, aln_result, sampling in outcomes:
+                sample_samplings.setdefault(base, []).append(sampling)
+                if result is None:
+                    # No hits remain after decoy filtering
+                    continue
 
                 if self.args.search_only:
                     db_search_results.append(result)
                     base_list.append(base)
                     continue
 
-                # Filter out decoys if specified
-                if reads_detected and doing_decoy_search:
-                    with tempfile.NamedTemporaryFile(prefix="graftm_decoy", suffix='.fa') as f:
-                        tmpname = f.name
-                    any_remaining = decoy_filter.filter(result.hit_fasta(),
-                                                        tmpname)
-                    if any_remaining:
-                        shutil.move(tmpname, result.hit_fasta())
-                    else:
-                        # No hits remain after decoy filtering.
-                        os.remove(result.hit_fasta())
-                        continue
-
-                if self.args.assignment_method == Run.PPLACER_TAXONOMIC_ASSIGNMENT:
-                    logging.info('aligning reads to reference package database')
-                    hit_aligned_reads = self.gmf.aligned_fasta_output_path(base)
-
-                    if reads_detected:
-                        aln_time, aln_result = self.ss.align(
-                                                            result.hit_fasta(),
-                                                            hit_aligned_reads,
-                                                            complement_information,
-                                                            self.args.type,
-                                                            filter_minimum
-                                                            )
-                    else:
-                        aln_time = 'n/a'
-                    if not os.path.exists(hit_aligned_reads): # If all were filtered out, or there just was none..
-                        with open(hit_aligned_reads,'w') as f:
-                            pass # just touch the file, nothing else
+                aln_time = sample_aln_time
+                if hit_aligned_reads is not None:
+                    if aligned_sequences is not None:
+                        aligned_sequences[hit_aligned_reads] = aln_result
                     seqs_list.append(hit_aligned_reads)
 
                 db_search_results.append(result)
                 base_list.append(base)
                 search_results.append(result.search_result)
                 hit_read_count_list.append(result.hit_count)
+                sample_hit_counts[base] = sample_hit_counts.get(base, 0) + result.hit_count[1]
+                slash_endings = result.slash_endings
 
         # Write summary table
         srchtw = SearchTableWriter()
@@ -465,6 +562,8 @@ class Run:
                                       self.gmf.search_otu_table())
 
         if self.args.search_only:
+            self._write_profile()
+            self._write_shard_manifest()
             logging.info('Stopping before alignment and taxonomic assignment phase\n')
             exit(0)
 
@@ -490,6 +589,8 @@ class Run:
 
         # Leave the pipeline if search only was specified
         if self.args.search_and_align_only:
+            self._write_profile()
+            self._write_shard_manifest()
             logging.info('Stopping before taxonomic assignment phase\n')
             exit(0)
         elif not any(base_list):
@@ -497,36 +598,374 @@ class Run:
             exit(0)
         self.gmf = GraftMFiles('',
                                self.args.output_directory,
-                               False)
+                               False,
+                               self._scratch_path())
 
         if self.args.assignment_method == Run.PPLACER_TAXONOMIC_ASSIGNMENT:
-            clusterer=Clusterer()
+            clusterer=Clusterer(self.taxonomy_registry)
             # Classification steps
-            seqs_list=clusterer.cluster(seqs_list, REVERSE_PIPE)
+            stage = self.profiler.start_stage('clustering')
+            seqs_list=clusterer.cluster(seqs_list, REVERSE_PIPE, aligned_sequences)
+            self.profiler.end_stage(stage)
             logging.info("Placing reads into phylogenetic tree")
+            stage = self.profiler.start_stage('placement')
             taxonomic_assignment_time, assignments=self.p.place(REVERSE_PIPE,
                                                                 seqs_list,
                                                                 self.args.resolve_placements,
                                                                 self.gmf,
                                                                 self.args,
-                                                                result.slash_endings,
+                                                                slash_endings,
                                                                 gpkg.taxtastic_taxonomy_path(),
-                                                                clusterer)
-            assignments = clusterer.uncluster_annotations(assignments, REVERSE_PIPE)
+                                                                clusterer,
+                                                                None if aligned_sequences is None \
+                                                                    else clusterer.representatives)
+            self.profiler.end_stage(stage, sum([len(a) for a in assignments.values()]))
+            stage = self.profiler.start_stage('unclustering')
+            assignments = clusterer.uncluster_annotations(assignments, REVERSE_PIPE,
+                                                          slash_endings)
 
         elif self.args.assignment_method == Run.DIAMOND_TAXONOMIC_ASSIGNMENT:
             logging.info("Assigning taxonomy with diamond")
+            stage = self.profiler.start_stage('taxonomic_assignment')
             taxonomic_assignment_time, assignments = self._assign_taxonomy_with_diamond(\
                         base_list,
                         db_search_results,
                         gpkg,
                         self.gmf)
             aln_time = 'n/a'
+        elif self.args.assignment_method == Run.NEAREST_REFERENCE_TAXONOMIC_ASSIGNMENT:
+            logging.info("Assigning taxonomy by nearest reference sequence")
+            stage = self.profiler.start_stage('taxonomic_assignment')
+            if REVERSE_PIPE:
+                logging.warning("Unmerged reverse reads are not used with --assignment_method %s" % \
+                                Run.NEAREST_REFERENCE_TAXONOMIC_ASSIGNMENT)
+                self.hk.delete(seqs_list[1::2])
+                seqs_list = seqs_list[0::2]
+            taxonomic_assignment_time, assignments = self._assign_taxonomy_with_nearest_reference(\
+                        base_list,
+                        seqs_list,
+                        gpkg,
+                        aligned_sequences)
         else: raise Exception("Unexpected assignment method encountered: %s" % self.args.placement_method)
-        
-        self.summarise(base_list, assignments, REVERSE_PIPE,
-                       [search_time, aln_time, taxonomic_assignment_time],
-                       hit_read_count_list, self.args.max_samples_for_krona)
+        self.profiler.end_stage(stage, sum([len(assignments[base]) for base in base_list]))
+
+        self._reverse_pipe = REVERSE_PIPE
+        self._hit_read_count_list = hit_read_count_list
+        return GraftResult(base_list,
+                           {base: assignments[base] for base in base_list},
+                           {base: sample_hit_counts.get(base, 0) for base in base_list},
+                           dict(zip(GraftResult.TIMED_STAGES,
+                                    [search_time, aln_time, taxonomic_assignment_time])),
+                           self.profiler.report(),
+                           {base: ReadSampling.combine(sample_samplings.get(base, []))
+                            for base in base_list if self._is_sampled()})
+
+    def _search_and_align(self, read_file, base, direction, threads, pipeline,
+                          adaptive_sampling=None):
+        '''Search a read file for hits, filter out decoys and, if the
+        assignment method requires it, align the hits, re-using checkpoints
+        where available.
+
+        Parameters
+        ----------
+        read_file: str
+            path to the reads
+        base: str
+            name of the sample
+        direction: str or False
+            'forward', 'reverse' or 'interleaved' for paired reads, otherwise
+            False
+        threads: int
+            number of threads for the read file, shared between unpacking and
+            searching the reads
+        pipeline: dict
+            settings shared by each read file, as set in graft_pipeline
+        adaptive_sampling: AdaptiveSampling
+            shared by the read files of the sample with --adaptive_sampling,
+            otherwise None
+
+        Returns
+        -------
+        tuple of (search result, or None if no hits remain after decoy
+        filtering; search time; alignment time; path of the aligned hits, or
+        None if not aligned; aligned hits if kept in memory; ReadSampling of
+        the reads searched, or None if all reads were searched)
+        '''
+        from graftm.checkpoint import Checkpointer
+
+        # A stream cannot be read again when resuming
+        checkpointer = None if UnpackRawReads.is_stream_path(read_file) \
+            else pipeline['checkpointer']
+        if direction:
+            logging.info("Working on %s reads" % direction)
+        gmf = GraftMFiles(base,
+                          self.args.output_directory,
+                          direction,
+                          self._scratch_path())
+        gmf.make_scratch_directory(base)
+
+        sample_checkpoint = os.path.join(base, gmf.basename)
+        if checkpointer:
+            search_fingerprint = checkpointer.fingerprint(Checkpointer.SEARCH_STAGE,
+                                                          [read_file])
+            checkpoint = checkpointer.load(sample_checkpoint,
+                                           Checkpointer.SEARCH_STAGE,
+                                           search_fingerprint)
+        else:
+            checkpoint = None
+
+        if checkpoint is not None:
+            search_time, result, complement_information, no_hits_after_decoy, sampling = checkpoint
+            if adaptive_sampling:
+                adaptive_sampling.withdraw(sampling)
+        else:
+            stage = self.profiler.start_stage('search', gmf.basename)
+            max_reads = adaptive_sampling.max_reads if adaptive_sampling \
+                else self.args.max_reads
+            search_time = 0
+            # The reads are decompressed in the same pipeline as they are
+            # searched, and both count against the threads of this read file.
+            # Decompressing is much faster than searching, so it is given a
+            # quarter of them.
+            unpack_threads = max(1, threads // 4)
+            search_threads = max(1, threads - unpack_threads)
+            while True:
+                unpack = UnpackRawReads(read_file,
+                                        self.args.input_sequence_type,
+                                        True if self.args.interleaved else False,
+                                        max_reads,
+                                        self.args.subsample_fraction,
+                                        gmf.read_sampling_path(base),
+                                        self.args.input_format,
+                                        unpack_threads,
+                                        self._temporary_directory())
+                try:
+                    round_time, (result, complement_information) = self._search(
+                        gmf, base, unpack, search_threads, pipeline)
+                except BaseException:
+                    if adaptive_sampling:
+                        # Do not leave the other read files waiting
+                        adaptive_sampling.abort()
+                    raise
+                finally:
+                    # Only the hits are needed from here on
+                    unpack.remove_spool()
+                search_time += round_time
+                sampling = unpack.sampling()
+                # Stop once the rate of hits of the sample is stable between
+                # rounds
+                if not adaptive_sampling or adaptive_sampling.stop(
+                        max_reads, result.hit_count[1], sampling):
+                    break
+                max_reads = adaptive_sampling.max_reads
+            if sampling:
+                logging.info("Examined %i reads, of which %i were searched%s" % (
+                    sampling.reads_seen, sampling.reads_kept,
+                    '' if sampling.complete else ' (reading stopped before the end of the input)'))
+
+            # Filter out decoys if specified
+            no_hits_after_decoy = False
+            if not self.args.search_only and pipeline['decoy_filter'] and \
+                    result.hit_fasta() and os.path.getsize(result.hit_fasta()) > 0:
+                with tempfile.NamedTemporaryFile(prefix="graftm_decoy", suffix='.fa',
+                                                 dir=self._temporary_directory()) as f:
+                    tmpname = f.name
+                any_remaining = pipeline['decoy_filter'].filter(result.hit_fasta(),
+                                                                tmpname)
+                if any_remaining:
+                    shutil.move(tmpname, result.hit_fasta())
+                else:
+                    # No hits remain after decoy filtering.
+                    os.remove(result.hit_fasta())
+                    no_hits_after_decoy = True
+            self.profiler.end_stage(stage, result.hit_count[1])
+
+            if checkpointer:
+                checkpointer.save(sample_checkpoint,
+                                  Checkpointer.SEARCH_STAGE,
+                                  search_fingerprint,
+                                  (search_time, result, complement_information, no_hits_after_decoy, sampling),
+                                  [result.hit_fasta()] if result.hit_fasta() and os.path.exists(result.hit_fasta()) else [])
+
+        if no_hits_after_decoy:
+            return None, search_time, None, None, None, sampling
+
+        reads_detected = True
+        if not result.hit_fasta() or os.path.getsize(result.hit_fasta()) == 0:
+            logging.info('No reads found in %s' % base)
+            reads_detected = False
+
+        if self.args.search_only or self.args.assignment_method not in \
+                (Run.PPLACER_TAXONOMIC_ASSIGNMENT, Run.NEAREST_REFERENCE_TAXONOMIC_ASSIGNMENT):
+            return result, search_time, 'n/a', None, None, sampling
+
+        logging.info('aligning reads to reference package database')
+        hit_aligned_reads = gmf.aligned_fasta_output_path(base)
+        in_memory = pipeline['align_in_memory']
+
+        if checkpointer:
+            alignment_fingerprint = checkpointer.fingerprint(
+                Checkpointer.ALIGNMENT_STAGE,
+                [result.hit_fasta()] if reads_detected else [],
+                search_fingerprint)
+            checkpoint = checkpointer.load(sample_checkpoint,
+                                           Checkpointer.ALIGNMENT_STAGE,
+                                           alignment_fingerprint)
+        else:
+            checkpoint = None
+
+        if checkpoint is not None:
+            aln_time, aln_result = checkpoint
+        else:
+            stage = self.profiler.start_stage('alignment', gmf.basename)
+            if reads_detected:
+                aln_time, aln_result = self.ss.align(
+                                                    result.hit_fasta(),
+                                                    None if in_memory else hit_aligned_reads,
+                                                    complement_information,
+                                                    self.args.type,
+                                                    pipeline['filter_minimum']
+                                                    )
+            else:
+                aln_time, aln_result = 'n/a', []
+            if not in_memory and not os.path.exists(hit_aligned_reads): # If all were filtered out, or there just was none..
+                with open(hit_aligned_reads,'w') as f:
+                    pass # just touch the file, nothing else
+            self.profiler.end_stage(stage, result.hit_count[1])
+            if checkpointer:
+                if in_memory:
+                    checkpointer.save(sample_checkpoint,
+                                      Checkpointer.ALIGNMENT_STAGE,
+                                      alignment_fingerprint,
+                                      (aln_time, aln_result),
+                                      [])
+                else:
+                    checkpointer.save(sample_checkpoint,
+                                      Checkpointer.ALIGNMENT_STAGE,
+                                      alignment_fingerprint,
+                                      (aln_time, None),
+                                      [hit_aligned_reads])
+        return result, search_time, aln_time, hit_aligned_reads, \
+            aln_result if in_memory else None, sampling
+
+    def _search(self, gmf, base, unpack, threads, pipeline):
+        '''Search reads with the protein or nucleotide pipeline, as per
+        _search_and_align, returning the search time, search result and
+        complement information.'''
+        from graftm.hmmsearcher import NoInputSequencesException
+
+        if self.args.type == self.PIPELINE_AA:
+            logging.debug("Running protein pipeline")
+            try:
+                search_time, (result, complement_information) = self.ss.aa_db_search(
+                    gmf,
+                    base,
+                    unpack,
+                    pipeline['search_method'],
+                    pipeline['maximum_range'],
+                    threads,
+                    self.args.evalue,
+                    self.args.min_orf_length,
+                    self.args.restrict_read_length,
+                    pipeline['diamond_db']
+                )
+            except NoInputSequencesException as e:
+                logging.error("No sufficiently long open reading frames were found, indicating"
+                              " either the input sequences are too short or the min orf length"
+                              " cutoff is too high. Cannot continue sorry. Alternatively, there"
+                              " is something amiss with the installation of OrfM. The specific"
+                              " command that failed was: %s" % e.command)
+                exit(Run.NO_ORFS_EXITSTATUS)
+
+        # Or the DNA pipeline
+        elif self.args.type == self.PIPELINE_NT:
+            logging.debug("Running nucleotide pipeline")
+            search_time, (result, complement_information)  = self.ss.nt_db_search(
+                gmf,
+                base,
+                unpack,
+                self.args.euk_check,
+                self.args.search_method,
+                pipeline['maximum_range'],
+                threads,
+                self.args.evalue
+            )
+        return search_time, (result, complement_information)
+
+    @staticmethod
+    def _sample_name(pair, interleaved, input_format=None):
+        return UnpackRawReads(pair[0], None, interleaved,
+                              input_format=input_format).basename()
+
+    @staticmethod
+    def _shard_sequence_pairs(sequence_pair_list, shard_index, shard_count, interleaved,
+                              input_format=None):
+        '''Return the sequence pairs of the samples assigned to the given
+        shard. Samples are sorted by name and dealt out to shards in turn, so
+        the assignment depends only on the set of sample names, not the order
+        in which they were given.'''
+        if shard_index is None or shard_count is None:
+            raise Exception("--shard_index and --shard_count must be specified together")
+        if shard_index < 0 or shard_index >= shard_count:
+            raise Exception("--shard_index must be between 0 and --shard_count - 1")
+        names = sorted(set([Run._sample_name(pair, interleaved, input_format)
+                            for pair in sequence_pair_list]))
+        shard_of_name = {name: i % shard_count for i, name in enumerate(names)}
+        sharded = [pair for pair in sequence_pair_list
+                   if shard_of_name[Run._sample_name(pair, interleaved, input_format)] == shard_index]
+        logging.info("Running %i of %i sample(s) in shard %i of %i" % (
+            len(sharded), len(sequence_pair_list), shard_index, shard_count))
+        return sharded
+
+    def _is_sampled(self):
+        return self.args.max_reads is not None or \
+            self.args.subsample_fraction is not None or \
+            self.args.adaptive_sampling
+
+    def _scratch_path(self):
+        # Kept intermediates are written alongside the outputs, as are the
+        # hits, which must outlive the run for --resume to use its checkpoints
+        if self.scratch and not self.args.keep_intermediates and \
+                not self.args.resume:
+            return self.scratch.path
+        return None
+
+    def _temporary_directory(self):
+        # Temporary files are always in the scratch directory, if any
+        return self.scratch.path if self.scratch else None
+
+    def _remove_scratch(self):
+        if self.scratch:
+            self.scratch.cleanup()
+            self.scratch = None
+
+    def _write_profile(self):
+        '''Write the resources used by each stage and external command of
+        the run to a JSON file next to the basic statistics'''
+        self.profiler.uninstall()
+        self.profiler.write(GraftMFiles('', self.args.output_directory, False).profile_path())
+
+    def _write_shard_manifest(self):
+        '''When running as one shard of a larger set of samples, write a
+        manifest of the samples and outputs of this shard, for graftM merge'''
+        if self.args.shard_count is None: return
+        files = GraftMFiles('', self.args.output_directory, False)
+        interleaved = True if self.args.interleaved else False
+        outputs = {}
+        for key, path in (('combined_count_table', files.combined_summary_table_output_path()),
+                          ('biom', files.combined_biom_output_path()),
+                          ('search_otu_table', files.search_otu_table())):
+            if os.path.exists(path):
+                outputs[key] = os.path.basename(path)
+        manifest = {'shard_index': self.args.shard_index,
+                    'shard_count': self.args.shard_count,
+                    'samples': [self._sample_name(pair, interleaved, self.args.input_format)
+                                for pair in self.sequence_pair_list],
+                    'graftm_version': __version__,
+                    'graftm_package': self.args.graftm_package,
+                    'outputs': outputs}
+        with open(files.shard_manifest_path(), 'w') as f:
+            json.dump(manifest, f, indent=1)
 
     @T.timeit
     def _assign_taxonomy_with_diamond(self, base_list, db_search_results,
@@ -551,18 +990,29 @@ class Run:
         2. assignments i.e. dict of base_list entry to dict of read names to
             to taxonomies, or None if there was no hit detected.
         '''
+        from graftm.diamond import Diamond
+        from graftm.getaxnseq import Getaxnseq
+        from graftm.sequence_io import SequenceIO
+        from graftm.sequence_search_results import SequenceSearchResult
+        from graftm.taxonomy_registry import SampleAssignments
+
         runner = Diamond(graftm_package.diamond_database_path(),
                          self.args.threads,
-                         self.args.evalue)
-        taxonomy_definition = Getaxnseq().read_taxtastic_taxonomy_and_seqinfo\
-                (open(graftm_package.taxtastic_taxonomy_path()),
-                 open(graftm_package.taxtastic_seqinfo_path()))
+                         self.args.evalue,
+                         self._temporary_directory())
+        taxonomy_definition = RESIDENT_CACHE.get(
+            'taxonomy_definition',
+            [graftm_package.taxtastic_taxonomy_path(), graftm_package.taxtastic_seqinfo_path()],
+            lambda: Getaxnseq().read_taxtastic_taxonomy_and_seqinfo(
+                open(graftm_package.taxtastic_taxonomy_path()),
+                open(graftm_package.taxtastic_seqinfo_path())))
         results = {}
+        hit_to_taxonomy_id = {}
 
         # For each of the search results,
         for i, search_result in enumerate(db_search_results):
             if search_result.hit_fasta() is None:
-                sequence_id_to_taxonomy = {}
+                sequence_id_to_taxonomy = SampleAssignments(self.taxonomy_registry)
             else:
                 sequence_id_to_hit = {}
                 # Run diamond
@@ -580,19 +1030,72 @@ class Run:
                         sequence_id_to_hit[res[0]] = res[1]
 
                 # Extract taxonomy of the best hit, and add in the no hits
-                sequence_id_to_taxonomy = {}
+                sequence_id_to_taxonomy = SampleAssignments(self.taxonomy_registry)
                 for seqio in SequenceIO().read_fasta_file(search_result.hit_fasta()):
                     name = seqio.name
                     if name in sequence_id_to_hit:
-                        # Add Root; to be in line with pplacer assignment method
-                        sequence_id_to_taxonomy[name] = ['Root']+taxonomy_definition[sequence_id_to_hit[name]]
+                        hit = sequence_id_to_hit[name]
+                        try:
+                            taxonomy_id = hit_to_taxonomy_id[hit]
+                        except KeyError:
+                            # Add Root; to be in line with pplacer assignment method
+                            taxonomy_id = self.taxonomy_registry.intern(
+                                ['Root']+taxonomy_definition[hit])
+                            hit_to_taxonomy_id[hit] = taxonomy_id
+                        sequence_id_to_taxonomy.add_id(name, taxonomy_id)
                     else:
                         # picked up in the initial search (by hmmsearch, say), but diamond misses it
-                        sequence_id_to_taxonomy[name] = ['Root']
+                        sequence_id_to_taxonomy.add(name, ['Root'])
 
             results[base_list[i]] = sequence_id_to_taxonomy
         return results
 
+    @T.timeit
+    def _assign_taxonomy_with_nearest_reference(self, base_list, seqs_list,
+                                                graftm_package, aligned_sequences=None):
+        '''Assign taxonomy to aligned reads by comparison to the aligned
+        reference sequences of the GraftM package
+
+        Parameters
+        ----------
+        base_list: list of str
+            list of sequence block names
+        seqs_list: list of str
+            paths to the aligned reads of each entry in base_list
+        graftm_package: GraftMPackage object
+            reference alignment and taxonomy are taken from this package
+        aligned_sequences: dict or None
+            if not None, path in seqs_list to a list of aligned Sequence
+            objects, used in place of reading the file
+
+        Returns
+        -------
+        list of
+        1. time taken for assignment
+        2. assignments i.e. dict of base_list entry to dict of read names to
+            to taxonomies
+        '''
+        from graftm.nearest_reference import NearestReferenceClassifier
+        from graftm.taxonomy_registry import SampleAssignments
+
+        paths = [graftm_package.alignment_fasta_path(),
+                 graftm_package.taxtastic_taxonomy_path(),
+                 graftm_package.taxtastic_seqinfo_path()]
+        classifier = RESIDENT_CACHE.get('nearest_reference_classifier', paths,
+                                        lambda: NearestReferenceClassifier(*paths))
+        results = {}
+        for base, aligned_reads in zip(base_list, seqs_list):
+            if aligned_sequences is not None:
+                classifications = classifier.classify(
+                    {s.name: s.seq for s in aligned_sequences.get(aligned_reads, [])})
+            else:
+                classifications = classifier.classify_alignment_file(aligned_reads)
+            results[base] = SampleAssignments.from_dict(classifications,
+                                                        self.taxonomy_registry)
+        if not self.args.keep_intermediates:
+            self.hk.delete(seqs_list)
+        return results
+
     def main(self):
 
         if self.args.subparser_name == 'graft':
@@ -699,6 +1202,7 @@ class Run:
                 else:
                     self.args.output = self.args.graftm_package + '-update.gpkg'
 
+            from graftm.update import Update
             Update(ExternalProgramSuite(
                 ['taxit', 'FastTreeMP', 'hmmalign', 'mafft'])).update(
                     input_sequence_path=self.args.sequences,
@@ -707,6 +1211,7 @@ class Run:
                     output_graftm_package_path=self.args.output)
 
         elif self.args.subparser_name == 'expand_search':
+            from graftm.expand_searcher import ExpandSearcher
             args = self.args
             if not args.graftm_package and not args.search_hmm_files:
                 logging.error("expand_search mode requires either --graftm_package or --search_hmm_files")
@@ -731,6 +1236,7 @@ class Run:
 
 
         elif self.args.subparser_name == 'tree':
+            from graftm.decorator import Decorator
             if self.args.graftm_package:
                 # shim in the paths from the graftm package, not overwriting
                 # any of the provided paths.
@@ -788,6 +1294,7 @@ If you're unsure see graftM tree -h")
                 exit(1)
 
         elif self.args.subparser_name == 'archive':
+            from graftm.archive import Archive
             # Back slashes in the ASCII art are escaped.
             if self.args.verbosity >= self._MIN_VERBOSITY_FOR_ART: print("""
                                ARCHIVE
@@ -844,6 +1351,22 @@ If you're unsure see graftM tree -h")
                 logging.error("Please specify whether to either create or export a GraftM package")
                 exit(1)
 
+        elif self.args.subparser_name == 'merge':
+            from graftm.merge import Merger
+            Merger().merge(self.args.graft_output_directories,
+                           self.args.output_directory,
+                           force=self.args.force)
+
+        elif self.args.subparser_name == 'serve':
+            from graftm.server import GraftServer
+            GraftServer(self.args.socket,
+                        self.args.graftm_packages,
+                        self.args.workers).serve_forever()
+
+        elif self.args.subparser_name == 'client':
+            from graftm.server import GraftClient
+            exit(GraftClient(self.args.socket).graft(self.args.job_arguments))
+
 
 
 
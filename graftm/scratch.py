@@ -0,0 +1,68 @@
+import os
+import shutil
+import logging
+import tempfile
+
+class ScratchDirectory:
+    '''A directory for the transient files of a graft run, such as those
+    passed between external programs, so that they can be kept on fast
+    node-local storage or a tmpfs like /dev/shm, rather than on the
+    (possibly networked) filesystem of the output directory.
+
+    Temporary files are created in the scratch directory by passing its path
+    to the objects which create them, rather than by changing the default
+    directory of the tempfile module, which would affect the whole process.
+    The amount of data in the directory is measured each time
+    measure() is called, which the Profiler does after each external command
+    and stage, from which peak usage and an estimate of the bytes written to
+    the directory are reported.
+    '''
+
+    def __init__(self, parent=None):
+        '''
+        Parameters
+        ----------
+        parent: str
+            directory to create the scratch directory in. Default: that of
+            the tempfile module i.e. $TMPDIR or the system default.
+        '''
+        self.path = tempfile.mkdtemp(prefix='graftm_scratch_', dir=parent)
+        self.peak_bytes = 0
+        self._file_bytes = {}
+
+    def measure(self):
+        '''Record the current contents of the scratch directory, returning the
+        number of bytes it contains'''
+        total = 0
+        for directory, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                try:
+                    stat = os.lstat(os.path.join(directory, filename))
+                except OSError:
+                    # Removed since it was listed
+                    continue
+                total += stat.st_size
+                key = (stat.st_dev, stat.st_ino, stat.st_ctime_ns)
+                if stat.st_size > self._file_bytes.get(key, 0):
+                    self._file_bytes[key] = stat.st_size
+        self.peak_bytes = max(self.peak_bytes, total)
+        return total
+
+    def bytes_written(self):
+        '''Return the sum of the largest size seen of each file in the scratch
+        directory. This is a lower bound on the bytes written to it, as files
+        created and removed between measurements are not seen.'''
+        return sum(self._file_bytes.values())
+
+    def report(self):
+        return {'directory': self.path,
+                'peak_bytes': self.peak_bytes,
+                'bytes_written': self.bytes_written()}
+
+    def cleanup(self):
+        '''Remove the scratch directory'''
+        if os.path.exists(self.path):
+            self.measure()
+            logging.info("Scratch directory %s used at most %i bytes (at least %i bytes written)" % (
+                self.path, self.peak_bytes, self.bytes_written()))
+            shutil.rmtree(self.path, ignore_errors=True)
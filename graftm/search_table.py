@@ -145,3 +145,35 @@ class SearchTableWriter:
                                         base_list)
 
         self._write_results(db_count, output_path)
+
+    def merge_search_otu_tables(self, search_otu_table_paths, output_path):
+        '''
+        Combine search OTU tables written by build_search_otu_table for
+        different samples into one table. Tables are read one line at a
+        time.
+
+        Parameters
+        ----------
+        search_otu_table_paths: list
+            Paths to the search OTU tables to merge
+        output_path: str
+            Path to output file to which the merged table will be written.
+        '''
+        db_count = {}
+        for path in search_otu_table_paths:
+            with open(path) as f:
+                header = f.readline().rstrip('\n').split('\t')
+                if header[0] != '#ID':
+                    raise Exception("Unexpected header in search OTU table %s" % path)
+                samples = header[1:]
+                for sample in samples:
+                    if sample in db_count:
+                        raise Exception("Sample %s found in more than one search OTU table, e.g. %s" % (sample, path))
+                    db_count[sample] = {}
+                for line in f:
+                    splits = line.rstrip('\n').split('\t')
+                    for sample, count in zip(samples, splits[1:]):
+                        if count != '0':
+                            db_count[sample][splits[0]] = int(count)
+
+        self._write_results(db_count, output_path)
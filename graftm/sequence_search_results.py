@@ -54,9 +54,7 @@ class SequenceSearchResult:
 
 class DiamondSearchResult(SequenceSearchResult):
     @staticmethod
-    def import_from_daa_file(daa_filename):
-        '''Generate new results object from the output of diamond blastx/p'''
-
+    def _new():
         # blast m8 format is
         # 'qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore
         res = DiamondSearchResult()
@@ -77,6 +75,32 @@ class DiamondSearchResult(SequenceSearchResult):
                        SequenceSearchResult.ALIGNMENT_DIRECTION,
                        SequenceSearchResult.HMM_NAME_FIELD
                        ]
+        return res
+
+    def _add_row(self, row, daa_filename):
+        # 'qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore
+        #    0       1     2      3        4        5      6     7    8      9    10     11
+        query_start = int(row[6])
+        query_end = int(row[7])
+        self.results.append([row[0],
+                             row[1],
+                             row[2],
+                             row[3],
+                             row[4],
+                             query_start,
+                             query_end,
+                             int(row[8]),
+                             int(row[9]),
+                             row[10],
+                             row[11],
+                             query_start < query_end,
+                             os.path.basename(daa_filename)
+                             ])
+
+    @staticmethod
+    def import_from_daa_file(daa_filename):
+        '''Generate new results object from the output of diamond blastx/p'''
+        res = DiamondSearchResult._new()
 
         cmd = "diamond view -a '%s'" % daa_filename
         logging.debug("Running cmd: %s" % cmd)
@@ -90,24 +114,27 @@ class DiamondSearchResult(SequenceSearchResult):
                             "stderr was %s" % (cmd, stderr))
 
         for row in reader:
-            # 'qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore
-            #    0       1     2      3        4        5      6     7    8      9    10     11
-            query_start = int(row[6])
-            query_end = int(row[7])
-            res.results.append([row[0],
-                                 row[1],
-                                 row[2],
-                                 row[3],
-                                 row[4],
-                                 query_start,
-                                 query_end,
-                                 int(row[8]),
-                                 int(row[9]),
-                                 row[10],
-                                 row[11],
-                                 query_start < query_end,
-                                 os.path.basename(daa_filename)
-                                 ])
+            res._add_row(row, daa_filename)
+        return res
+
+    @staticmethod
+    async def import_from_daa_file_async(daa_filename, process_runner):
+        '''As per import_from_daa_file, as a coroutine which parses the
+        output of diamond view as it is produced
+
+        Parameters
+        ----------
+        daa_filename: str
+            path to the diamond output
+        process_runner: ProcessRunner
+            runs diamond view
+        '''
+        res = DiamondSearchResult._new()
+        def add_line(line):
+            if line.strip():
+                res._add_row(line.rstrip('\n').split('\t'), daa_filename)
+        await process_runner.run("diamond view -a '%s'" % daa_filename,
+                                 line_handler=add_line)
         return res
 
 class HMMSearchResult(SequenceSearchResult):
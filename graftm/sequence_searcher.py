@@ -1,5 +1,4 @@
 
-import extern
 import os
 import re
 import itertools
@@ -8,8 +7,9 @@ import tempfile
 import subprocess
 
 from Bio import SeqIO
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
 from collections import OrderedDict
-from io import StringIO
 
 from graftm.timeit import Timer
 from graftm.hmmsearcher import HmmSearcher, NhmmerSearcher
@@ -18,11 +18,10 @@ from graftm.diamond import Diamond
 from graftm.sequence_search_results import SequenceSearchResult, HMMSearchResult
 from graftm.readHmmTable import HMMreader
 from graftm.db_search_results import DBSearchResult
+from graftm.sequence_io import Sequence
+from graftm.process_runner import PROCESS_RUNNER
+from graftm.unpack_sequences import UnpackRawReads
 
-FORMAT_FASTA = "FORMAT_FASTA"
-FORMAT_FASTQ = "FORMAT_FASTQ"
-FORMAT_FASTQ_GZ = "FORMAT_FASTQ_GZ"
-FORMAT_FASTA_GZ = "FORMAT_FASTA_GZ"
 PIPELINE_AA = "P"
 PIPELINE_NT = "D"
 PREVIOUS_SPAN_CUTOFF = 0.25
@@ -31,11 +30,32 @@ T = Timer()
 class InterleavedFileError(Exception):
     pass
 
+class StockholmParser:
+    '''Parses a Stockholm format alignment, such as that output by hmmalign,
+    fed to it line by line, into SeqRecords with '.' gaps converted to '-',
+    as per Bio.SeqIO'''
+
+    def __init__(self):
+        self._sequences = OrderedDict()
+
+    def feed(self, line):
+        if line.startswith('#') or line.startswith('//'):
+            return
+        fields = line.split()
+        if len(fields) == 2:
+            self._sequences.setdefault(fields[0], []).append(fields[1])
+
+    def records(self):
+        return [SeqRecord(Seq(''.join(chunks).replace('.', '-')), id=name, description='')
+                for name, chunks in self._sequences.items()]
+
 class SequenceSearcher:
 
-    def __init__(self, search_hmm, aln_hmm=None):
+    def __init__(self, search_hmm, aln_hmm=None, temporary_directory=None):
         self.search_hmm = search_hmm
         self.aln_hmm = aln_hmm
+        # Directory for temporary files, or None for the tempfile default
+        self.temporary_directory = temporary_directory
 
     def _get_sequence_directions(self, search_result):
         sequence_directions = {}
@@ -61,21 +81,27 @@ class SequenceSearcher:
         pipeline: str
             either PIPELINE_AA = "P" or PIPELINE_NT = "D"
         forward_reads_output_fh: str
-            Where to write aligned forward reads
+            Where to write aligned forward reads, or None to keep them in
+            memory
         reverse_reads_output_fh: str
-            Where to write aligned reverse reads
+            Where to write aligned reverse reads, or None to keep them in
+            memory
         Returns
         -------
-        Nothing.
+        list of the output paths of the forward (and reverse, if any)
+        alignments, or of lists of aligned SeqRecords if they are kept in
+        memory
         '''
         if pipeline == PIPELINE_AA:
             reverse_direction_reads_present=False
         else:
             reverse_direction_reads_present=False in directions.values()
 
-        with tempfile.NamedTemporaryFile(prefix='for_file', suffix='.fa') as for_file_fh:
+        with tempfile.NamedTemporaryFile(prefix='for_file', suffix='.fa',
+                                         dir=self.temporary_directory) as for_file_fh:
             for_file = for_file_fh.name
-            with tempfile.NamedTemporaryFile(prefix='rev_file', suffix='.fa') as rev_file_fh:
+            with tempfile.NamedTemporaryFile(prefix='rev_file', suffix='.fa',
+                                             dir=self.temporary_directory) as rev_file_fh:
                 rev_file = rev_file_fh.name
                 # Align input reads to a specified hmm.
                 if reverse_direction_reads_present:  # Any that are in the reverse direction would be True
@@ -104,26 +130,34 @@ class SequenceSearcher:
                         for record in forward:
                             for_aln.write('>' + record.id + '\n')
                             for_aln.write(str(record.seq) + '\n')
-                            # HMMalign and convert to fasta format
-                    if any(forward):
-                        self.hmmalign_sequences(self.aln_hmm, for_file, forward_reads_output_path)
-                    else:
-                        cmd = 'touch %s' % (forward_reads_output_path)
-                        extern.run(cmd)
                     with open(rev_file, 'w') as rev_aln:
                         logging.debug("Writing reverse direction reads to %s" % rev_file)
                         for record in reverse:
                             if record.id and record.seq:
                                 rev_aln.write('>' + record.id + '\n')
                                 rev_aln.write(str(record.seq.reverse_complement()) + '\n')
-                    self.hmmalign_sequences(self.aln_hmm, rev_file, reverse_reads_output_path)
-                    conv_files = [forward_reads_output_path, reverse_reads_output_path]
+
+                    # HMMalign the forward and reverse reads at the same time
+                    # and convert to fasta format
+                    alignments = [self._hmmalign_sequences_async(self.aln_hmm, rev_file, reverse_reads_output_path)]
+                    if any(forward):
+                        alignments.insert(0, self._hmmalign_sequences_async(self.aln_hmm, for_file, forward_reads_output_path))
+                    alignments = PROCESS_RUNNER.run_all(alignments)
+                    reverse_alignment = alignments.pop()
+                    if any(forward):
+                        forward_alignment = alignments.pop()
+                    elif forward_reads_output_path:
+                        with open(forward_reads_output_path, 'w'):
+                            pass
+                        forward_alignment = forward_reads_output_path
+                    else:
+                        forward_alignment = []
+                    conv_files = [forward_alignment, reverse_alignment]
                     return conv_files
 
                 else:
                     # If there are only forward reads, just hmmalign and be done with it.
-                    self.hmmalign_sequences(self.aln_hmm, input_path, forward_reads_output_path)
-                    conv_files = [forward_reads_output_path]
+                    conv_files = [self.hmmalign_sequences(self.aln_hmm, input_path, forward_reads_output_path)]
 
                     return conv_files
 
@@ -137,21 +171,32 @@ class SequenceSearcher:
         sequences: str
             path to file of sequences to be aligned
         output_file: str
-            write sequences to this file
+            write sequences to this file, or None to return them
 
         Returns
         -------
-        nothing
+        output_file, or a list of aligned SeqRecords if output_file is None
         '''
+        return PROCESS_RUNNER.run_all([
+            self._hmmalign_sequences_async(hmm, sequences, output_file)])[0]
 
+    async def _hmmalign_sequences_async(self, hmm, sequences, output_file):
+        '''As per hmmalign_sequences, as a coroutine, parsing the output of
+        hmmalign as it is produced'''
         cmd = 'hmmalign --trim %s %s' % (hmm, sequences)
-        output = extern.run(cmd)
+        parser = StockholmParser()
+        await PROCESS_RUNNER.run(cmd, line_handler=parser.feed)
+        records = parser.records()
+        if output_file is None:
+            return records
         with open(output_file, 'w') as f:
-            SeqIO.write(SeqIO.parse(StringIO(output), 'stockholm'), f, 'fasta')
+            for record in records:
+                f.write(">%s\n%s\n" % (record.id, record.seq))
+        return output_file
 
     def makeSequenceBinary(self, sequences, fm):
         cmd = 'makehmmerdb %s %s' % (sequences, fm)
-        extern.run(cmd)
+        PROCESS_RUNNER.run_sync(cmd)
 
     def hmmsearch(self, output_path, input_path, unpack, seq_type, threads, cutoff, orfm):
         '''
@@ -208,8 +253,10 @@ class SequenceSearcher:
         # Choose an input to this base command based off the file format found.
         if seq_type == 'nucleotide':  # If the input is nucleotide sequence
             input_cmd = orfm.command_line(input_path)
+            input_threads = unpack.threads + 1
         elif seq_type == 'aminoacid':  # If the input is amino acid sequence
             input_cmd = unpack.command_line()
+            input_threads = unpack.threads
         else:
             raise Exception('Programming Error: error guessing input sequence type')
 
@@ -218,7 +265,8 @@ class SequenceSearcher:
             searcher = HmmSearcher(threads, cutoff)
         else:
             searcher = HmmSearcher(threads, '--domE %s' % cutoff)
-        searcher.hmmsearch(input_cmd, self.search_hmm, output_table_list)
+        searcher.hmmsearch(input_cmd, self.search_hmm, output_table_list,
+                           input_threads)
 
         hmmtables = [HMMSearchResult.import_from_hmmsearch_table(x) for x in output_table_list]
         return hmmtables
@@ -373,7 +421,8 @@ class SequenceSearcher:
         input_pipe = unpack.command_line()
 
         searcher = NhmmerSearcher(threads, extra_args='--incE %s -E %s' % (evalue, evalue))
-        searcher.hmmsearch(input_pipe, self.search_hmm, output_table_list)
+        searcher.hmmsearch(input_pipe, self.search_hmm, output_table_list,
+                           unpack.threads)
 
         hmmtables = [HMMSearchResult.import_from_nhmmer_table(x) for x in output_table_list]
 
@@ -487,7 +536,8 @@ deal with these, so please remove/rename sequences with duplicate keys.")
 
         return complement_information
 
-    def _extract_from_raw_reads(self, output_path, input_reads, raw_sequences_path, input_file_format, hits):
+    def _extract_from_raw_reads(self, output_path, input_reads, raw_sequences_path, input_file_format, hits,
+                                raw_sequences_threads=1):
         '''
         _extract_from_raw_reads - Extract hit sequences of the hmm/diamond
         search from a command which generates uncompressed FASTA sequences from
@@ -502,10 +552,13 @@ deal with these, so please remove/rename sequences with duplicate keys.")
         raw_sequences_path : str
             Path to the raw sequences
         input_file_format : var
-            Variable, either FORMAT_FASTA_GZ, FORMAT_FASTQ_GZ, FORMAT_FASTQ or
-            FORMAT_FASTA, denoting the format of the input sequence
+            Variable, one of the UnpackRawReads FORMAT_* formats, denoting the
+            format of the input sequence
         hits : dict
             A hash with the readnames as the keys and the spans as the values
+        raw_sequences_threads : int
+            Number of threads used to unpack raw_sequences_path (see
+            UnpackRawReads.threads)
 
         Returns
         -------
@@ -522,16 +575,20 @@ deal with these, so please remove/rename sequences with duplicate keys.")
             and False = Reverse direction
         '''
 
-        with tempfile.NamedTemporaryFile(prefix='_raw_extracted_reads.fa') as tmp:
+        with tempfile.NamedTemporaryFile(prefix='_raw_extracted_reads.fa',
+                                         dir=self.temporary_directory) as tmp:
             # Extract reads from original sequence file
             extract_cmd = "mfqe --output-uncompressed"
-            if input_file_format in (FORMAT_FASTA, FORMAT_FASTA_GZ, FORMAT_FASTQ, FORMAT_FASTQ_GZ):
+            # Reads of every format are unpacked to FASTA by
+            # raw_sequences_path, whatever their compression
+            if input_file_format in UnpackRawReads.FILE_TYPE_ENCODING:
                 extract_cmd += " --fasta-read-name-lists /dev/stdin --input-fasta {} --output-fasta-files '{}'".format(
                     raw_sequences_path, tmp.name)
             else:
                 raise Exception("Programming error: Unexpected input file format {}".format(input_file_format))
 
-            extern.run(extract_cmd, stdin='\n'.join(input_reads))
+            PROCESS_RUNNER.run_sync(extract_cmd, stdin='\n'.join(input_reads),
+                                    threads=1 + raw_sequences_threads)
             complement_info = self._extract_multiple_hits(hits, tmp.name, output_path)  # split them into multiple reads
 
         return output_path, complement_info
@@ -549,22 +606,27 @@ deal with these, so please remove/rename sequences with duplicate keys.")
         ----------
         alignment_file_list : array
             List of strings, each the path to different alignments from the
-            inputs provided to GraftM
+            inputs provided to GraftM, or lists of aligned SeqRecords
         output_file_name : str
-            The path and filename of the output file desired.
+            The path and filename of the output file desired, or None to
+            return the corrected sequences
         filter_minimum : int
             minimum number of positions that must be aligned for each sequence
         Returns
         -------
-        True or False, depending if reads were written to file
+        True or False, depending if reads were written to file, or if
+        output_file_name is None, a list of Sequence objects
 
         '''
 
         corrected_sequences = {}
         for alignment_file in alignment_file_list:
             insert_list = []  # Define list containing inserted positions to be removed (lower case characters)
-            with open(alignment_file) as f:
-                sequence_list = list(SeqIO.parse(f, 'fasta'))
+            if isinstance(alignment_file, str):
+                with open(alignment_file) as f:
+                    sequence_list = list(SeqIO.parse(f, 'fasta'))
+            else:
+                sequence_list = alignment_file
             for sequence in sequence_list:  # For each sequence in the alignment
                 for idx, nt in enumerate(list(sequence.seq)):  # For each nucleotide in the sequence
                     if nt.islower():  # Check for lower case character
@@ -589,7 +651,10 @@ deal with these, so please remove/rename sequences with duplicate keys.")
                     )
         logging.info("%i sequences remaining" % post_filter_count)
 
-        if len(corrected_sequences) >= 1:
+        if output_file_name is None:
+            return [Sequence(fasta_id[1:-1], fasta_seq[:-1])
+                    for fasta_id, fasta_seq in corrected_sequences.items()]
+        elif len(corrected_sequences) >= 1:
             with open(output_file_name, 'w') as output_file:  # Create an open file to write the new sequences to
                 for fasta_id, fasta_seq in corrected_sequences.items():
                     output_file.write(fasta_id)
@@ -627,7 +692,8 @@ deal with these, so please remove/rename sequences with duplicate keys.")
             orfm_cmd = orfm.command_line()
             cmd = "mfqe --output-uncompressed --fasta-read-name-lists /dev/stdin --input-fasta <({} {}) --output-fasta-files {}".format(
                 orfm_cmd, input_path, output_path)
-            extern.run(cmd, stdin='\n'.join(hit_readnames))
+            # mfqe and OrfM
+            PROCESS_RUNNER.run_sync(cmd, stdin='\n'.join(hit_readnames), threads=2)
 
         elif search_method == "diamond":
             sequence_frame_info_dict = {x[0]:[x[1], x[2], x[3]] for x in sequence_frame_info_list}
@@ -914,10 +980,12 @@ deal with these, so please remove/rename sequences with duplicate keys.")
                                      database=diamond_database,
                                      threads=threads,
                                      evalue=evalue,
+                                     temporary_directory=self.temporary_directory
                                      ).run(
                                            unpack.get_file_as_process(),
                                            unpack.sequence_type(),
-                                           daa_file_basename=output_search_file
+                                           daa_file_basename=output_search_file,
+                                           input_threads=unpack.threads
                                            )
             search_result = [search_result]
 
@@ -940,7 +1008,8 @@ deal with these, so please remove/rename sequences with duplicate keys.")
                                                        hit_readnames,
                                                        unpack.get_file_as_process(),
                                                        unpack.format(),
-                                                       hits
+                                                       hits,
+                                                       unpack.threads
                                                        )
 
 
@@ -1109,7 +1178,8 @@ deal with these, so please remove/rename sequences with duplicate keys.")
                                                        hit_readnames,
                                                        unpack.get_file_as_process(),
                                                        unpack.format(),
-                                                       hits
+                                                       hits,
+                                                       unpack.threads
                                                        )
 
         if not hit_readnames:
@@ -1142,6 +1212,7 @@ deal with these, so please remove/rename sequences with duplicate keys.")
         ----------
         input_path : str
         output_path : str
+            path to write the aligned reads to, or None to return them
         reverse_direction : dict
             A dictionary of read names, with the entries being the complement
             strand of the read (True = forward, False = reverse)
@@ -1152,13 +1223,20 @@ deal with these, so please remove/rename sequences with duplicate keys.")
 
         Returns
         -------
-        N/A - output alignment path known.
+        True or False, depending if reads were written to output_path, or if
+        output_path is None, a list of aligned Sequence objects
         '''
 
+        if output_path is None:
+            alignments = self._hmmalign(input_path, directions, pipeline, None, None)
+            return self.alignment_correcter(alignments, None, filter_minimum)
+
         # HMMalign the forward reads, and reverse complement reads.
-        with tempfile.NamedTemporaryFile(prefix='for_conv_file', suffix='.fa') as fwd_fh:
+        with tempfile.NamedTemporaryFile(prefix='for_conv_file', suffix='.fa',
+                                         dir=self.temporary_directory) as fwd_fh:
             fwd_conv_file = fwd_fh.name
-            with tempfile.NamedTemporaryFile(prefix='rev_conv_file', suffix='.fa') as rev_fh:
+            with tempfile.NamedTemporaryFile(prefix='rev_conv_file', suffix='.fa',
+                                             dir=self.temporary_directory) as rev_fh:
                 rev_conv_file = rev_fh.name
                 alignments = self._hmmalign(
                     input_path,
@@ -0,0 +1,236 @@
+import os
+import json
+import signal
+import socket
+import logging
+import argparse
+import traceback
+import threading
+import socketserver
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+from graftm.graftm_package import GraftMPackage
+from graftm.resident_cache import RESIDENT_CACHE
+
+class GraftServerException(Exception): pass
+
+def _run_graft_job(working_directory, arguments):
+    '''Run a graft job in a worker process, returning (exit status, error
+    message or None)'''
+    from graftm.run import Run
+    os.chdir(working_directory)
+    args = argparse.Namespace(**arguments)
+    handler = None
+    if args.log:
+        handler = logging.FileHandler(args.log)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s'))
+        logging.getLogger().addHandler(handler)
+    try:
+        Run(args).main()
+        return 0, None
+    except SystemExit as e:
+        # graft exits early in some cases e.g. when no reads are found
+        if e.code is None or isinstance(e.code, int):
+            return (e.code or 0), None
+        return 1, str(e.code)
+    except Exception:
+        logging.error("graft job failed:\n%s" % traceback.format_exc())
+        return 1, traceback.format_exc()
+    finally:
+        # Workers are reused, so the next job must not inherit a profiler
+        from graftm.profiler import Profiler
+        Profiler.reset()
+        if handler:
+            logging.getLogger().removeHandler(handler)
+            handler.close()
+
+
+class GraftServer:
+    '''Runs graft jobs submitted over a Unix socket, for when many small jobs
+    are run against the same few GraftM packages.
+
+    The packages, their taxonomies and the check for external programs are
+    loaded into the resident cache once, before the worker processes are
+    forked, so jobs do not pay for them (or for starting Python) each time.
+    Jobs are run by a pool of at most max_workers processes, and further jobs
+    wait for a free worker.
+
+    Each request is a single line of JSON, and is answered with a single line
+    of JSON before the connection is closed. Requests are either
+    {"request": "graft", "working_directory": <str>, "arguments": <dict>},
+    where arguments are the parsed graft command line arguments, answered
+    with {"exit_status": <int>, "error": <str or null>}, or
+    {"request": "status"}, answered with the preloaded packages and the
+    number of workers.
+    '''
+
+    GRAFT_REQUEST = 'graft'
+    STATUS_REQUEST = 'status'
+
+    def __init__(self, socket_path, graftm_packages, max_workers=1):
+        '''
+        Parameters
+        ----------
+        socket_path: str
+            path of the Unix socket to listen on
+        graftm_packages: list of str
+            paths to GraftM packages to preload. Jobs may use other packages,
+            which are cached when first used by each worker.
+        max_workers: int
+            maximum number of graft jobs run at once
+        '''
+        if os.path.exists(socket_path):
+            raise GraftServerException("Socket %s already exists. Is another graftM serve running?" % socket_path)
+        self._socket_path = socket_path
+        self._graftm_packages = [os.path.abspath(p) for p in graftm_packages]
+        self._max_workers = max_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+        RESIDENT_CACHE.enable()
+        self._preload()
+
+    def _preload(self):
+        from graftm.run import Run
+        from graftm.classify import Classify
+        from graftm.external_program_suite import ExternalProgramSuite
+        from graftm.getaxnseq import Getaxnseq
+
+        RESIDENT_CACHE.get('graft_programs', [],
+                           lambda: ExternalProgramSuite(Run.GRAFT_PROGRAMS))
+        for path in self._graftm_packages:
+            logging.info("Preloading GraftM package %s" % path)
+            gpkg = GraftMPackage.acquire(path)
+            taxonomy = gpkg.taxtastic_taxonomy_path()
+            seqinfo = gpkg.taxtastic_seqinfo_path()
+            RESIDENT_CACHE.get('classify', [taxonomy], lambda: Classify(taxonomy))
+            RESIDENT_CACHE.get('taxonomy_definition', [taxonomy, seqinfo],
+                               lambda: Getaxnseq().read_taxtastic_taxonomy_and_seqinfo(
+                                   open(taxonomy), open(seqinfo)))
+
+    def _start_executor(self):
+        self._executor = ProcessPoolExecutor(self._max_workers,
+                                             mp_context=multiprocessing.get_context('fork'))
+        for future in [self._executor.submit(os.getpid) for _ in range(self._max_workers)]:
+            future.result()
+
+    def _replace_broken_executor(self, executor):
+        '''Start a new pool of workers in place of one which is broken, e.g.
+        because a worker was killed, unless another thread already has'''
+        with self._executor_lock:
+            if self._executor is executor:
+                logging.warning("A graft worker process died, restarting the workers")
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._start_executor()
+
+    def _run_job(self, working_directory, arguments):
+        '''Run a graft job in a worker, returning (exit status, error message
+        or None)'''
+        executor = self._executor
+        try:
+            future = executor.submit(_run_graft_job, working_directory, arguments)
+        except BrokenProcessPool:
+            # Broken by an earlier job, so run this one in the new pool
+            self._replace_broken_executor(executor)
+            executor = self._executor
+            future = executor.submit(_run_graft_job, working_directory, arguments)
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            self._replace_broken_executor(executor)
+            return 1, "The worker process running the graft job died unexpectedly"
+
+    def _handle(self, request):
+        if request.get('request') == self.GRAFT_REQUEST:
+            exit_status, error = self._run_job(request['working_directory'],
+                                               request['arguments'])
+            return {'exit_status': exit_status, 'error': error}
+        elif request.get('request') == self.STATUS_REQUEST:
+            return {'graftm_packages': self._graftm_packages,
+                    'max_workers': self._max_workers}
+        else:
+            return {'exit_status': 1, 'error': "Unknown request: %s" % request.get('request')}
+
+    @staticmethod
+    def _terminate(signum, frame):
+        # Shut down as if interrupted, so the socket is removed
+        raise KeyboardInterrupt()
+
+    def serve_forever(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    request = json.loads(self.rfile.readline().decode())
+                    response = server._handle(request)
+                except Exception:
+                    logging.error("Failed to handle request:\n%s" % traceback.format_exc())
+                    response = {'exit_status': 1, 'error': traceback.format_exc()}
+                self.wfile.write((json.dumps(response) + '\n').encode())
+
+        class ThreadingUnixStreamServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        # Workers are forked so that they share the preloaded cache, and
+        # started before any threads are, since forking a threaded process is
+        # unsafe. They are only forked later if a worker dies.
+        self._start_executor()
+        signal.signal(signal.SIGTERM, self._terminate)
+        try:
+            with ThreadingUnixStreamServer(self._socket_path, Handler) as unix_server:
+                logging.info("Listening for graft jobs on %s with %i worker(s)" % (
+                    self._socket_path, self._max_workers))
+                try:
+                    unix_server.serve_forever()
+                except KeyboardInterrupt:
+                    logging.info("Shutting down")
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            if os.path.exists(self._socket_path):
+                os.remove(self._socket_path)
+
+
+class GraftClient:
+    '''Submits jobs to a graftM serve process'''
+
+    def __init__(self, socket_path):
+        self._socket_path = socket_path
+
+    def request(self, request):
+        '''Send a request to the server, returning its response'''
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self._socket_path)
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                raise GraftServerException("Could not connect to graftM serve at %s: %s" % (
+                    self._socket_path, e))
+            sock.sendall((json.dumps(request) + '\n').encode())
+            with sock.makefile('rb') as f:
+                line = f.readline()
+        if not line:
+            raise GraftServerException("graftM serve at %s closed the connection without responding" % \
+                                       self._socket_path)
+        return json.loads(line.decode())
+
+    def graft(self, arguments, working_directory=None):
+        '''Run graft on the server, returning its exit status
+
+        Parameters
+        ----------
+        arguments: dict
+            parsed graft command line arguments, i.e. vars(args)
+        working_directory: str
+            relative paths in the arguments are relative to this directory.
+            Default: the current directory.
+        '''
+        response = self.request({
+            'request': GraftServer.GRAFT_REQUEST,
+            'working_directory': working_directory or os.getcwd(),
+            'arguments': arguments})
+        if response['error']:
+            logging.error("graft job failed on the server: %s" % response['error'])
+        return response['exit_status']
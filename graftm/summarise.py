@@ -1,9 +1,51 @@
 import numpy as np
+import scipy.sparse
 from biom.table import Table
 import tempfile
 import extern
 import logging
 
+from graftm.taxonomy_registry import TaxonomyRegistry, SampleAssignments
+
+class OtuTable:
+    '''Counts of reads assigned to each lineage (rows) in each sample
+    (columns), as built by Stats_And_Summary.otu_table'''
+
+    def __init__(self, lineages, counts):
+        '''
+        Parameters
+        ----------
+        lineages: list of tuple of str
+            lineage of each row
+        counts: scipy.sparse.csr_matrix
+            integer counts, one row per lineage and one column per sample
+        '''
+        self.lineages = lineages
+        self.counts = counts
+
+    @staticmethod
+    def from_coordinates(taxonomy_registry, taxonomy_ids, sample_indices, counts, num_samples):
+        '''Build an OtuTable from parallel arrays of lineage ID (in
+        taxonomy_registry), sample index and count. Counts at the same
+        coordinates are summed, and only lineages with a count are kept, in
+        order of their IDs.'''
+        matrix = scipy.sparse.coo_matrix((np.asarray(counts, dtype=np.int64),
+                                          (np.asarray(taxonomy_ids, dtype=np.int64),
+                                           np.asarray(sample_indices, dtype=np.int64))),
+                                         shape=(len(taxonomy_registry), num_samples)).tocsr()
+        matrix.eliminate_zeros()
+        observed = np.flatnonzero(np.diff(matrix.indptr))
+        return OtuTable([taxonomy_registry.lineage(i) for i in observed],
+                        matrix[observed])
+
+    def scaled(self, scales):
+        '''Return an OtuTable with the counts of each sample multiplied by its
+        scale, rounded to the nearest integer, e.g. to estimate the counts of
+        all reads from those of a subsample'''
+        counts = self.counts.multiply(np.asarray(scales, dtype=np.float64)[np.newaxis, :]).tocsr()
+        counts.data = np.rint(counts.data)
+        return OtuTable(self.lineages, counts.astype(np.int64))
+
 class Stats_And_Summary:
 
     def __init__(self): pass
@@ -38,10 +80,15 @@ class Stats_And_Summary:
             for read, tax in placements.items():
                 out.write("%s\t%s\n" % (read, '; '.join(tax)))
 
-    def build_basic_statistics(self, times, hit_read_count_list, placed_reads, base_list, output):
+    def build_basic_statistics(self, times, hit_read_count_list, placed_reads, base_list, output,
+                               read_sampling=None):
 
         output_lines = ["Basic run statistics (count):"]
         output_lines.append("Files:\t%s" % '\t'.join(base_list))
+        if read_sampling:
+            output_lines.append("reads examined:\t%s" % '\t'.join([str(s.reads_seen) for s in read_sampling]))
+            output_lines.append("reads searched:\t%s" % '\t'.join([str(s.reads_kept) for s in read_sampling]))
+            output_lines.append("whole input examined:\t%s" % '\t'.join([str(s.complete) for s in read_sampling]))
         if any([x[0] for x in hit_read_count_list if x[0] > 0]):
             output_lines.append("18S reads filtered:\t%s" % '\t'.join([str(x[0]) for x in hit_read_count_list]))
         output_lines.append("reads detected:\t%s" % '\t'.join([str(x[1]) for x in hit_read_count_list]))
@@ -56,6 +103,32 @@ class Stats_And_Summary:
             for line in output_lines:
                 stats_file.write(line + '\n')
 
+    def otu_table(self, read_taxonomies):
+        '''Count the reads assigned to each lineage in each sample.
+
+        Parameters
+        ----------
+        read_taxonomies:
+            a list of hashes (or SampleAssignments), where the position in the
+            list corresponds to the sample list, the key is the read name, and
+            the value is an array of taxonomic info
+
+        Returns
+        -------
+        OtuTable
+        '''
+        if isinstance(read_taxonomies, OtuTable):
+            return read_taxonomies
+        taxonomy_registry, sample_taxonomy_ids = self._taxonomy_ids(read_taxonomies)
+        num_samples = len(sample_taxonomy_ids)
+        rows = np.concatenate([np.asarray(ids, dtype=np.int64) for ids in sample_taxonomy_ids] +
+                              [np.zeros(0, dtype=np.int64)])
+        columns = np.repeat(np.arange(num_samples, dtype=np.int64),
+                            [len(ids) for ids in sample_taxonomy_ids])
+        return OtuTable.from_coordinates(taxonomy_registry, rows, columns,
+                                         np.ones(len(rows), dtype=np.int64),
+                                         num_samples)
+
     def _iterate_otu_table_rows(self, read_taxonomies):
         '''yield that which is required for an OTU table: taxonomy, and
         count of that taxonomy in each sample as an array
@@ -63,9 +136,7 @@ class Stats_And_Summary:
         Parameters
         ---------
         read_taxonomies:
-            a list of hashes, where the position in the list corresponds to the
-            sample list, the key is the read name, and the value is an array
-            of taxonomic info
+            as per otu_table(), or an OtuTable
 
         Yield
         -----
@@ -76,39 +147,31 @@ class Stats_And_Summary:
         Return
         ------
         Nothing, use this as an iterator'''
+        table = self.otu_table(read_taxonomies)
+        num_samples = table.counts.shape[1]
+        indptr = table.counts.indptr
+        indices = table.counts.indices.tolist()
+        data = table.counts.data.tolist()
+        for i, lineage in enumerate(table.lineages):
+            counts_array = [0]*num_samples
+            for j in range(indptr[i], indptr[i+1]):
+                counts_array[indices[j]] = data[j]
+            yield i+1, list(lineage), counts_array
 
-        taxonomy_string_to_taxonomy_array = {}
-        taxonomy_string_to_counts = {}
-        sample_index = 0
-        num_samples = len(read_taxonomies)
-        for read_to_taxonomy in read_taxonomies: # For each sample
-            for taxonomy_array in read_to_taxonomy.values(): # For each read
-                taxonomy_string = '; '.join(taxonomy_array)
-                if taxonomy_string in taxonomy_string_to_taxonomy_array:
-                    if taxonomy_string_to_taxonomy_array[taxonomy_string] != taxonomy_array:
-                        raise Exception("Programming error: two different taxonomies had same taxonomy string")
-                    try:
-                        taxonomy_string_to_counts[taxonomy_string][sample_index] += 1
-                    except KeyError:
-                        taxonomy_string_to_counts[taxonomy_string][sample_index] = 1
-                else:
-                    taxonomy_string_to_taxonomy_array[taxonomy_string] = taxonomy_array
-                    taxonomy_string_to_counts[taxonomy_string] = [0]*num_samples
-                    taxonomy_string_to_counts[taxonomy_string][sample_index] = 1
-            sample_index += 1
-
-        otu_id = 1
-        for tax_string, counts_array in taxonomy_string_to_counts.items():
-            array = []
-            for i in range(num_samples):
-                try:
-                    array.append(counts_array[i])
-                except IndexError:
-                    array.append(0)
-            yield otu_id,\
-                taxonomy_string_to_taxonomy_array[tax_string],\
-                array
-            otu_id += 1
+    def _taxonomy_ids(self, read_taxonomies):
+        '''Return the TaxonomyRegistry and, for each sample, a list of the
+        lineage ID of each read. When every sample is a SampleAssignments of
+        one registry its IDs are used as they are, otherwise lineages are
+        interned into a new registry.'''
+        registries = set([id(r.taxonomy_registry) if isinstance(r, SampleAssignments) else None
+                          for r in read_taxonomies])
+        if len(registries) == 1 and None not in registries:
+            return read_taxonomies[0].taxonomy_registry, \
+                [r.taxonomy_ids() for r in read_taxonomies]
+        taxonomy_registry = TaxonomyRegistry()
+        return taxonomy_registry, \
+            [[taxonomy_registry.intern(lineage) for lineage in r.values()]
+             for r in read_taxonomies]
 
     def write_biom(self, sample_names, read_taxonomies, biom_file_io):
         '''Write the OTU info to a biom IO output stream
@@ -117,47 +180,80 @@ class Stats_And_Summary:
         ----------
         sample_names: String
             names of each sample (sample_ids for biom)
-        read_taxonomies: Array of hashes as per _iterate_otu_table_rows()
+        read_taxonomies: Array of hashes as per otu_table(), or an OtuTable
         biom_file_io: io
             open writeable stream to write biom contents to
 
         Returns True if successful, else False'''
-        counts = []
-        observ_metadata = []
-        otu_ids = []
-        for otu_id, tax, count in self._iterate_otu_table_rows(read_taxonomies):
-            if len(count) != len(sample_names):
-                raise Exception("Programming error: mismatched sample names and counts")
-            counts.append(count)
-            observ_metadata.append({'taxonomy': tax})
-            otu_ids.append(str(otu_id))
-        if len(counts) == 0:
+        table = self.otu_table(read_taxonomies)
+        if table.counts.shape[1] != len(sample_names):
+            raise Exception("Programming error: mismatched sample names and counts")
+        if len(table.lineages) == 0:
             logging.info("Not writing BIOM file since no sequences were assigned taxonomy")
             return True
-        table = Table(np.array(counts),
-                      otu_ids, sample_names, observ_metadata,
-                      [{}]*len(sample_names), table_id='GraftM Taxonomy Count Table')
+        biom_table = Table(table.counts,
+                           [str(i+1) for i in range(len(table.lineages))],
+                           sample_names,
+                           [{'taxonomy': list(lineage)} for lineage in table.lineages],
+                           [{}]*len(sample_names), table_id='GraftM Taxonomy Count Table')
         try:
-            table.to_hdf5(biom_file_io, 'GraftM graft')
+            biom_table.to_hdf5(biom_file_io, 'GraftM graft')
             return True
         except RuntimeError as e:
             logging.warn("Error writing BIOM output, file not written. The specific error was: %s" % e)
             return False
 
     def write_tabular_otu_table(self, sample_names, read_taxonomies, combined_output_otu_table_io):
-        '''A function that takes a hash of trusted placements, and compiles them
-        into an OTU-esque table.'''
+        '''A function that takes a hash of trusted placements (or an
+        OtuTable), and compiles them into an OTU-esque table.'''
         delim = '\t'
         combined_output_otu_table_io.write(delim.join(['#ID',
                                                        delim.join(sample_names),
                                                        'ConsensusLineage']))
         combined_output_otu_table_io.write("\n")
-        for otu_id, tax, counts in self._iterate_otu_table_rows(read_taxonomies):
+        table = self.otu_table(read_taxonomies)
+        num_samples = table.counts.shape[1]
+        indptr = table.counts.indptr
+        indices = table.counts.indices.tolist()
+        data = table.counts.data.tolist()
+        for i, tax in enumerate(table.lineages):
+            # Most counts are zero, so only convert the non-zero ones
+            counts = ['0']*num_samples
+            for j in range(indptr[i], indptr[i+1]):
+                counts[indices[j]] = str(data[j])
             combined_output_otu_table_io.write(delim.join(\
-                (str(otu_id),
-                 delim.join([str(c) for c in counts]),
+                (str(i+1),
+                 delim.join(counts),
                  '; '.join(tax)))+"\n")
 
+    def write_count_estimates(self, sample_names, read_taxonomies, read_sampling, output_io):
+        '''Write, for each lineage and sample with a count, the count of reads
+        searched, the estimated count of all reads examined, and the bounds of
+        its confidence interval. IDs are those of the OTU table.
+
+        Parameters
+        ----------
+        sample_names: list of str
+            names of each sample
+        read_taxonomies:
+            as per otu_table(), or an OtuTable
+        read_sampling: list of ReadSampling
+            sampling of each sample
+        output_io: io
+            open writeable stream
+        '''
+        delim = '\t'
+        output_io.write(delim.join(['#ID', 'sample', 'count', 'estimate',
+                                    'lower_95', 'upper_95', 'ConsensusLineage'])+"\n")
+        for otu_id, tax, counts in self._iterate_otu_table_rows(read_taxonomies):
+            for sample_name, sampling, count in zip(sample_names, read_sampling, counts):
+                if count == 0: continue
+                estimate, lower, upper = sampling.estimate(count)
+                output_io.write(delim.join(
+                    (str(otu_id), sample_name, str(count),
+                     '%.1f' % estimate, '%.1f' % lower, '%.1f' % upper,
+                     '; '.join(tax)))+"\n")
+
     def write_krona_plot(self, sample_names, read_taxonomies, output_krona_filename):
         '''Creates krona plot at the given location. Assumes the krona executable
         ktImportText is available on the shell PATH'''
@@ -170,12 +266,13 @@ class Stats_And_Summary:
                     mode='w'))
 
         delim='\t'
-        for _, tax, counts in self._iterate_otu_table_rows(read_taxonomies):
-            for i, c in enumerate(counts):
-                if c != 0:
-                    tempfiles[i].write(delim.join((str(c),
-                                                  delim.join(tax)
-                                                  ))+"\n")
+        table = self.otu_table(read_taxonomies)
+        counts = table.counts.tocsc()
+        for i, tmp in enumerate(tempfiles):
+            for j in range(counts.indptr[i], counts.indptr[i+1]):
+                tmp.write(delim.join((str(counts.data[j]),
+                                      delim.join(table.lineages[counts.indices[j]])
+                                      ))+"\n")
 
         for t in tempfiles:
             t.flush()
@@ -0,0 +1,118 @@
+from array import array
+from collections.abc import Mapping
+
+import numpy as np
+
+class TaxonomyRegistry:
+    '''Assigns integer IDs to taxonomic lineages, so that each distinct
+    lineage is stored once however many reads are assigned to it. Lineages
+    are interned as tuples of str.
+    '''
+
+    def __init__(self):
+        self._lineages = []
+        self._lineage_to_id = {}
+
+    def intern(self, lineage):
+        '''Return the integer ID of the lineage (a sequence of str), adding it
+        to the registry if it has not been seen before'''
+        lineage = tuple(lineage)
+        try:
+            return self._lineage_to_id[lineage]
+        except KeyError:
+            taxonomy_id = len(self._lineages)
+            self._lineages.append(lineage)
+            self._lineage_to_id[lineage] = taxonomy_id
+            return taxonomy_id
+
+    def lineage(self, taxonomy_id):
+        '''Return the lineage tuple with the given ID'''
+        return self._lineages[taxonomy_id]
+
+    def __len__(self):
+        return len(self._lineages)
+
+
+class SampleAssignments(Mapping):
+    '''The taxonomic assignments of the reads of one sample, as a read-only
+    mapping of read name to lineage tuple. Each read is stored as its name
+    and the integer ID of its lineage in a TaxonomyRegistry, so that lineages
+    are only materialised when they are looked up.
+    '''
+
+    def __init__(self, taxonomy_registry):
+        self.taxonomy_registry = taxonomy_registry
+        self._read_names = []
+        self._taxonomy_ids = array('l')
+        self._read_name_to_index = {}
+
+    @staticmethod
+    def from_dict(read_to_lineage, taxonomy_registry):
+        '''Return a SampleAssignments with the same contents as a dict of
+        read name to lineage'''
+        assignments = SampleAssignments(taxonomy_registry)
+        for read_name, lineage in read_to_lineage.items():
+            assignments.add(read_name, lineage)
+        return assignments
+
+    def add(self, read_name, lineage):
+        self.add_id(read_name, self.taxonomy_registry.intern(lineage))
+
+    def add_id(self, read_name, taxonomy_id):
+        '''Assign a read to a lineage ID. As for a dict, a read that was
+        already added is reassigned rather than counted twice.'''
+        index = self._read_name_to_index.get(read_name)
+        if index is None:
+            self._read_name_to_index[read_name] = len(self._read_names)
+            self._read_names.append(read_name)
+            self._taxonomy_ids.append(taxonomy_id)
+        else:
+            self._taxonomy_ids[index] = taxonomy_id
+
+    def add_ids(self, read_names, taxonomy_ids):
+        '''Add many reads at once, given an iterable of read names and a
+        numpy array of the lineage ID of each. Reads already added are
+        reassigned, as by add_id.'''
+        taxonomy_ids = np.asarray(taxonomy_ids, dtype=np.dtype('l'))
+        new_positions = []
+        reassigned = []
+        for position, read_name in enumerate(read_names):
+            index = self._read_name_to_index.get(read_name)
+            if index is None:
+                self._read_name_to_index[read_name] = len(self._read_names)
+                self._read_names.append(read_name)
+                new_positions.append(position)
+            else:
+                reassigned.append((index, position))
+        if len(new_positions) < len(taxonomy_ids):
+            new_ids = taxonomy_ids[np.array(new_positions, dtype=np.intp)]
+        else:
+            new_ids = taxonomy_ids
+        self._taxonomy_ids.frombytes(new_ids.tobytes())
+        # After the new reads, so that the last assignment of a read wins
+        for index, position in reassigned:
+            self._taxonomy_ids[index] = int(taxonomy_ids[position])
+
+    def taxonomy_ids(self):
+        '''Return a numpy array of the lineage ID of each read, in the same
+        order as iteration over the read names. The array is a copy, so reads
+        can still be added while it is in use.'''
+        return np.array(self._taxonomy_ids, dtype=np.dtype('l'))
+
+    def __getitem__(self, read_name):
+        return self.taxonomy_registry.lineage(
+            self._taxonomy_ids[self._read_name_to_index[read_name]])
+
+    def __iter__(self):
+        return iter(self._read_names)
+
+    def __len__(self):
+        return len(self._read_names)
+
+    def items(self):
+        lineage = self.taxonomy_registry.lineage
+        return ((name, lineage(i)) for name, i in zip(self._read_names, self._taxonomy_ids))
+
+    def values(self):
+        lineage = self.taxonomy_registry.lineage
+        return (lineage(i) for i in self._taxonomy_ids)
@@ -1,8 +1,12 @@
 import logging
 import subprocess
 import os
+import stat
+import shutil
+import tempfile
 import itertools
-import extern
+
+from graftm.process_runner import PROCESS_RUNNER
 
 class UnpackRawReads:
     class UnexpectedFileFormatException(Exception): pass
@@ -11,6 +15,12 @@ class UnpackRawReads:
     FORMAT_FASTQ    = "FORMAT_FASTQ"
     FORMAT_FASTQ_GZ = "FORMAT_FASTQ_GZ"
     FORMAT_FASTA_GZ = "FORMAT_FASTA_GZ"
+    FORMAT_FASTQ_ZST = "FORMAT_FASTQ_ZST"
+    FORMAT_FASTA_ZST = "FORMAT_FASTA_ZST"
+    FORMAT_FASTQ_BZ2 = "FORMAT_FASTQ_BZ2"
+    FORMAT_FASTA_BZ2 = "FORMAT_FASTA_BZ2"
+    FORMAT_FASTQ_XZ = "FORMAT_FASTQ_XZ"
+    FORMAT_FASTA_XZ = "FORMAT_FASTA_XZ"
 
     PROTEIN_SEQUENCE_TYPE = 'aminoacid'
     NUCLEOTIDE_SEQUENCE_TYPE = 'nucleotide'
@@ -30,9 +40,86 @@ class UnpackRawReads:
                                '.faa.gz': FORMAT_FASTA_GZ,
                                '.fna.gz': FORMAT_FASTA_GZ,
                                '.fasta.gz': FORMAT_FASTA_GZ,
+
+                               '.fq.zst': FORMAT_FASTQ_ZST,
+                               '.fastq.zst': FORMAT_FASTQ_ZST,
+
+                               '.fa.zst': FORMAT_FASTA_ZST,
+                               '.faa.zst': FORMAT_FASTA_ZST,
+                               '.fna.zst': FORMAT_FASTA_ZST,
+                               '.fasta.zst': FORMAT_FASTA_ZST,
+
+                               '.fq.bz2': FORMAT_FASTQ_BZ2,
+                               '.fastq.bz2': FORMAT_FASTQ_BZ2,
+
+                               '.fa.bz2': FORMAT_FASTA_BZ2,
+                               '.faa.bz2': FORMAT_FASTA_BZ2,
+                               '.fna.bz2': FORMAT_FASTA_BZ2,
+                               '.fasta.bz2': FORMAT_FASTA_BZ2,
+
+                               '.fq.xz': FORMAT_FASTQ_XZ,
+                               '.fastq.xz': FORMAT_FASTQ_XZ,
+
+                               '.fa.xz': FORMAT_FASTA_XZ,
+                               '.faa.xz': FORMAT_FASTA_XZ,
+                               '.fna.xz': FORMAT_FASTA_XZ,
+                               '.fasta.xz': FORMAT_FASTA_XZ,
                                }
 
-    def __init__(self, read_file, known_sequence_type=None, interleaved=False):
+    COMPRESSION_GZIP = 'gz'
+    COMPRESSION_ZSTD = 'zst'
+    COMPRESSION_BZIP2 = 'bz2'
+    COMPRESSION_XZ = 'xz'
+
+    # Whether each format is FASTQ, and how it is compressed
+    FILE_TYPE_ENCODING = {FORMAT_FASTA: (False, None),
+                           FORMAT_FASTQ: (True, None),
+                           FORMAT_FASTA_GZ: (False, COMPRESSION_GZIP),
+                           FORMAT_FASTQ_GZ: (True, COMPRESSION_GZIP),
+                           FORMAT_FASTA_ZST: (False, COMPRESSION_ZSTD),
+                           FORMAT_FASTQ_ZST: (True, COMPRESSION_ZSTD),
+                           FORMAT_FASTA_BZ2: (False, COMPRESSION_BZIP2),
+                           FORMAT_FASTQ_BZ2: (True, COMPRESSION_BZIP2),
+                           FORMAT_FASTA_XZ: (False, COMPRESSION_XZ),
+                           FORMAT_FASTQ_XZ: (True, COMPRESSION_XZ)}
+
+    # Commands which decompress to stdout, in order of preference. Each is
+    # used if its program is on the PATH, preferring multi-threaded decoders.
+    # The last is used otherwise.
+    _DECOMPRESSORS = {COMPRESSION_GZIP: [('pigz', "pigz -dc -p %(threads)i '%(path)s'"),
+                                         ('zcat', "zcat '%(path)s'")],
+                      COMPRESSION_ZSTD: [('zstd', "zstd -dcq '%(path)s'")],
+                      COMPRESSION_BZIP2: [('lbzip2', "lbzip2 -dc -n %(threads)i '%(path)s'"),
+                                          ('pbzip2', "pbzip2 -dc -p%(threads)i '%(path)s'"),
+                                          ('bzip2', "bzip2 -dc '%(path)s'")],
+                      COMPRESSION_XZ: [('xz', "xz -dc -T %(threads)i '%(path)s'")]}
+
+    # Commands which compress stdin to a file, in order of preference, used
+    # to spool a stream. Fast settings are used, as the spool is read back
+    # once or twice and then removed.
+    _SPOOL_COMPRESSORS = [(COMPRESSION_ZSTD, 'zstd', "zstd -1 -q -f -T%(threads)i -o '%(path)s'"),
+                          (COMPRESSION_GZIP, 'pigz', "pigz -1 -p %(threads)i > '%(path)s'"),
+                          (COMPRESSION_GZIP, 'gzip', "gzip -1 > '%(path)s'")]
+
+    # Formats which can be given explicitly, e.g. for streamed input
+    INPUT_FORMATS = {'fasta': FORMAT_FASTA,
+                     'fastq': FORMAT_FASTQ,
+                     'fasta.gz': FORMAT_FASTA_GZ,
+                     'fastq.gz': FORMAT_FASTQ_GZ,
+                     'fasta.zst': FORMAT_FASTA_ZST,
+                     'fastq.zst': FORMAT_FASTQ_ZST,
+                     'fasta.bz2': FORMAT_FASTA_BZ2,
+                     'fastq.bz2': FORMAT_FASTQ_BZ2,
+                     'fasta.xz': FORMAT_FASTA_XZ,
+                     'fastq.xz': FORMAT_FASTQ_XZ}
+
+    # Path which denotes reads are to be read from standard input
+    STDIN_PATH = '-'
+    STDIN_BASENAME = 'stdin'
+
+    def __init__(self, read_file, known_sequence_type=None, interleaved=False,
+                 max_reads=None, subsample_fraction=None, sampling_path=None,
+                 input_format=None, threads=1, temporary_directory=None):
         '''New object from a read file.
 
         read_file: str
@@ -41,6 +128,30 @@ class UnpackRawReads:
             PROTEIN_SEQUENCE_TYPE, NUCLEOTIDE_SEQUENCE_TYPE or None
             Whether input is nucleotide, amino acid, or should be guessed by
         peeking at the input sequence file.
+        max_reads: int
+            stop reading the input after this many reads, or None to read all
+            of it. For interleaved input, this is rounded up to an even
+            number so that pairs are not split.
+        subsample_fraction: float
+            keep only this fraction of the reads, chosen by a hash of their
+            name so that the same reads (and both reads of a pair) are chosen
+            each time, or None to keep all reads
+        sampling_path: str
+            when max_reads or subsample_fraction is given, the number of
+            reads examined and kept are written to this file each time the
+            reads are unpacked, to be read with sampling()
+        input_format: str
+            one of INPUT_FORMATS, or None to guess the format from the file
+            extension. Required when reading from a stream (standard input or
+            a named pipe), which is read only once: its reads are unpacked to
+            a compressed spool file when first used, which is removed by
+            remove_spool().
+        threads: int
+            number of threads for decompression, where the decompressor can
+            use more than one
+        temporary_directory: str
+            directory a stream is spooled to. Default: that of the tempfile
+            module.
 
         '''
         logging.debug("Loading %s, type %s, interleaved %s", read_file,
@@ -48,6 +159,16 @@ class UnpackRawReads:
         self.read_file = read_file
         self.known_sequence_type = known_sequence_type
         self.interleaved = interleaved
+        self.max_reads = max_reads
+        self.subsample_fraction = subsample_fraction
+        self.sampling_path = sampling_path
+        if self.is_sampled() and sampling_path is None:
+            raise Exception("Programming error: sampling_path is required when sampling reads")
+        self.input_format = input_format
+        self.threads = threads
+        self.temporary_directory = temporary_directory
+        self._spool_path = None
+        self._spool_compression = None
 
     def _guess_sequence_type_from_string(self, seq):
         '''Return 'protein' if there is >10% amino acid residues in the
@@ -96,8 +217,25 @@ class UnpackRawReads:
     def guess_sequence_input_file_format(self, sequence_file_path):
         '''Given a sequence file, guess the format and return. Raise an
         exception if it cannot be guessed'''
+        if self.input_format is not None:
+            return self.INPUT_FORMATS[self.input_format]
         return self._EXTENSION_TO_FILE_TYPE[self._get_extension(sequence_file_path)]
 
+    @staticmethod
+    def is_stream_path(path):
+        '''Return True if the path is standard input or a named pipe (e.g.
+        /dev/fd/63 from a shell process substitution), which can only be read
+        once'''
+        if path == UnpackRawReads.STDIN_PATH:
+            return True
+        try:
+            return stat.S_ISFIFO(os.stat(path).st_mode)
+        except OSError:
+            return False
+
+    def is_stream(self):
+        return self.is_stream_path(self.read_file)
+
     def format(self):
         return self.guess_sequence_input_file_format(self.read_file)
 
@@ -108,7 +246,14 @@ class UnpackRawReads:
     def basename(self):
         '''Return the name of the file with the '.fasta' or 'fq.gz' etc
         removed'''
-        return os.path.basename(self.read_file)[:-len(self._get_extension(self.read_file))]
+        if self.read_file == self.STDIN_PATH:
+            return self.STDIN_BASENAME
+        try:
+            return os.path.basename(self.read_file)[:-len(self._get_extension(self.read_file))]
+        except self.UnexpectedFileFormatException:
+            if self.input_format is None:
+                raise
+            return os.path.basename(self.read_file)
 
     def _get_extension(self, sequence_file_path):
         for ext in list(self._EXTENSION_TO_FILE_TYPE.keys()):
@@ -120,18 +265,104 @@ class UnpackRawReads:
         names """
         return r""" | perl -pe 'if (m/^>/) {$i++; if ($i % 2 == 1) { if (m/^(\S+)(?<!\/1)(\s+\S.*)?(\s*)$/) { $_ = "$1/1$2$3" }} elsif ($i % 2 == 0) { if (m/^(\S+)(?<!\/2)(\s+\S.*)?(\s*)$/) { $_ = "$1/2$2$3" }}}'"""
 
-    def command_line(self):
-        '''Return a string to open read files with'''
+    def is_sampled(self):
+        return self.max_reads is not None or self.subsample_fraction is not None
+
+    def get_sampling_cmd(self):
+        """ return cmd snippet to stop after max_reads reads and keep the
+        subsample_fraction of reads whose names hash lowest, writing the
+        number of reads examined and kept to sampling_path """
+        conditions = []
+        if self.max_reads is not None:
+            max_reads = self.max_reads + (self.max_reads % 2 if self.interleaved else 0)
+            conditions.append("if ($seen >= %i) { $complete = 0; last }" % max_reads)
+        conditions.append("$seen++;")
+        if self.subsample_fraction is not None:
+            # Mates are named the same but for a /1 or /2 suffix
+            threshold = int(self.subsample_fraction * 2**32)
+            conditions.append(r'($name) = /^>(\S+)/; $name =~ s/\/[12]$//; $keep = unpack("N", md5($name)) < %i;' % threshold)
+        else:
+            conditions.append("$keep = 1;")
+        conditions.append("$kept++ if $keep;")
+        return r""" | perl -ne 'use Digest::MD5 qw(md5); BEGIN { $seen = 0; $kept = 0; $complete = 1 } if (m/^>/) { %s } print if $keep; END { open(my $f, ">", q{%s}) or die $!; print $f "$seen\t$kept\t$complete\n"; close($f) }'""" % (
+            ' '.join(conditions), self.sampling_path)
+
+    def sampling(self):
+        '''Return a ReadSampling of the reads examined and kept when the reads
+        were last unpacked, or None if all reads are used'''
+        from graftm.read_sampling import ReadSampling
+        if not self.is_sampled():
+            return None
+        return ReadSampling.read(self.sampling_path, self.subsample_fraction)
+
+    def _unpack_command_line(self):
+        '''Return a string which writes the (sampled) reads as FASTA'''
         file_format=self.guess_sequence_input_file_format(self.read_file)
         logging.debug("Detected file format %s" % file_format)
-        if file_format == self.FORMAT_FASTA:
-            cmd="""cat '%s'""" % (self.read_file)
-        elif file_format == self.FORMAT_FASTQ_GZ:
-            cmd="""zcat '%s' | awk '{print ">" substr($0,2);getline;print;getline;getline}' -""" % (self.read_file)
-        elif file_format == self.FORMAT_FASTA_GZ:
-            cmd="""zcat '%s'""" % (self.read_file)
-        elif file_format == self.FORMAT_FASTQ:
-            cmd="""awk '{print ">" substr($0,2);getline;print;getline;getline}' '%s'""" % (self.read_file)
+        read_file = '/dev/stdin' if self.read_file == self.STDIN_PATH else self.read_file
+        is_fastq, compression = self.FILE_TYPE_ENCODING[file_format]
+        if compression is None:
+            if is_fastq:
+                cmd="""awk '{print ">" substr($0,2);getline;print;getline;getline}' '%s'""" % (read_file)
+            else:
+                cmd="""cat '%s'""" % (read_file)
+        else:
+            cmd=self._decompression_command(compression, read_file)
+            if is_fastq:
+                cmd+=""" | awk '{print ">" substr($0,2);getline;print;getline;getline}' -"""
+        if self.is_sampled():
+            if self.max_reads is not None:
+                # Reading stops early, so the unpacking is killed by SIGPIPE
+                cmd = "{ %s || [ $? -eq 141 ]; }" % cmd
+            cmd+=self.get_sampling_cmd()
+        return cmd
+
+    def _decompression_command(self, compression, path):
+        '''Return a command which decompresses the file to stdout'''
+        decompressors = self._DECOMPRESSORS[compression]
+        for program, command in decompressors:
+            if shutil.which(program):
+                break
+        return command % {'threads': self.threads, 'path': path}
+
+    def _spool(self):
+        '''Unpack a stream to a compressed FASTA file in the temporary
+        directory, once, returning its path. The spool holds the reads after
+        sampling, so compressing it keeps its size to that of a compressed
+        FASTA file of those reads.'''
+        if self._spool_path is None:
+            for compression, program, compress in self._SPOOL_COMPRESSORS:
+                if shutil.which(program):
+                    break
+            fd, path = tempfile.mkstemp(prefix='graftm_spool_',
+                                        suffix='.fa.%s' % compression,
+                                        dir=self.temporary_directory)
+            os.close(fd)
+            logging.info("Reading %s into %s" % (self.read_file, path))
+            # Decompressing and compressing each use up to self.threads
+            PROCESS_RUNNER.run_sync("%s | %s" % (self._unpack_command_line(),
+                                                 compress % {'threads': self.threads,
+                                                             'path': path}),
+                                    threads=2*self.threads)
+            logging.debug("Spooled %s to %i bytes" % (self.read_file,
+                                                      os.path.getsize(path)))
+            self._spool_path = path
+            self._spool_compression = compression
+        return self._spool_path
+
+    def remove_spool(self):
+        '''Remove the file a stream was unpacked to, if any. As the stream
+        has been read, the reads cannot be unpacked again.'''
+        if self._spool_path is not None and os.path.exists(self._spool_path):
+            os.remove(self._spool_path)
+
+    def command_line(self):
+        '''Return a string to open read files with'''
+        if self.is_stream():
+            path = self._spool()
+            cmd=self._decompression_command(self._spool_compression, path)
+        else:
+            cmd=self._unpack_command_line()
         if self.interleaved:
             cmd+=self.get_interleaved_cmd()
         logging.debug("raw read unpacking command chunk: %s" % cmd)
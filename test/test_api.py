@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os.path
+import sys
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+
+from graftm.api import graft, graft_arguments, GraftException
+from graftm.graft_result import GraftResult
+
+path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
+
+class Tests(unittest.TestCase):
+    def test_graft_arguments_defaults(self):
+        args = graft_arguments()
+        self.assertEqual('graft', args.subparser_name)
+        self.assertEqual(5, args.threads)
+        self.assertEqual('pplacer', args.assignment_method)
+        self.assertEqual(False, args.force)
+
+    def test_graft_arguments_override(self):
+        args = graft_arguments(threads=2, assignment_method='diamond')
+        self.assertEqual(2, args.threads)
+        self.assertEqual('diamond', args.assignment_method)
+
+    def test_graft_arguments_unknown_option(self):
+        with self.assertRaises(GraftException):
+            graft_arguments(not_an_option=1)
+
+    def test_graft_unsupported_option(self):
+        with self.assertRaises(GraftException):
+            graft(os.path.join(path_to_data, 'mcrA.gpkg'), os.path.join(path_to_data, 'mcrA.gpkg'),
+                  search_only=True)
+
+    def test_graft_result_counts(self):
+        result = GraftResult(['s1', 's2'],
+                             {'s1': {'r1': ['Root', 'a'], 'r2': ['Root', 'a'], 'r3': ['Root', 'b']},
+                              's2': {'r4': ['Root', 'b']}},
+                             {'s1': 3, 's2': 1},
+                             {}, {})
+        self.assertEqual({('Root', 'a'): 2, ('Root', 'b'): 1}, result.counts('s1'))
+        self.assertEqual({('Root', 'b'): 1}, result.counts('s2'))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+import tempdir
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.checkpoint import Checkpointer
+from graftm.housekeeping import HouseKeeping
+
+class Tests(unittest.TestCase):
+    parameters = {'evalue': '1e-5', 'threads': 1}
+
+    def write(self, path, contents):
+        with open(path, 'w') as f:
+            f.write(contents)
+
+    def test_save_and_load(self):
+        with tempdir.TempDir() as tmp:
+            reads = os.path.join(tmp, 'reads.fa')
+            hits = os.path.join(tmp, 'hits.fa')
+            self.write(reads, ">r1\nACGT\n")
+            self.write(hits, ">r1\nACGT\n")
+            checkpointer = Checkpointer(tmp, self.parameters)
+            fingerprint = checkpointer.fingerprint(Checkpointer.SEARCH_STAGE, [reads])
+            self.assertEqual(None, checkpointer.load('reads', Checkpointer.SEARCH_STAGE, fingerprint))
+            checkpointer.save('reads', Checkpointer.SEARCH_STAGE, fingerprint, (1.5, ['r1']), [hits])
+
+            # A new run reads the manifest, ignoring the thread count
+            resumed = Checkpointer(tmp, {'evalue': '1e-5', 'threads': 5})
+            self.assertEqual((1.5, ['r1']), resumed.load(
+                'reads', Checkpointer.SEARCH_STAGE,
+                resumed.fingerprint(Checkpointer.SEARCH_STAGE, [reads])))
+            self.assertEqual(None, resumed.load(
+                'reads', Checkpointer.ALIGNMENT_STAGE,
+                resumed.fingerprint(Checkpointer.ALIGNMENT_STAGE, [], fingerprint)))
+
+    def test_changed_parameters_or_inputs(self):
+        with tempdir.TempDir() as tmp:
+            reads = os.path.join(tmp, 'reads.fa')
+            self.write(reads, ">r1\nACGT\n")
+            checkpointer = Checkpointer(tmp, self.parameters)
+            fingerprint = checkpointer.fingerprint(Checkpointer.SEARCH_STAGE, [reads])
+            checkpointer.save('reads', Checkpointer.SEARCH_STAGE, fingerprint, 'result', [])
+
+            changed = Checkpointer(tmp, {'evalue': '1e-10', 'threads': 1})
+            self.assertNotEqual(fingerprint, changed.fingerprint(Checkpointer.SEARCH_STAGE, [reads]))
+
+            self.write(reads, ">r1\nACGTACGT\n")
+            self.assertNotEqual(fingerprint, Checkpointer(tmp, self.parameters).fingerprint(
+                Checkpointer.SEARCH_STAGE, [reads]))
+
+    def test_missing_output(self):
+        with tempdir.TempDir() as tmp:
+            reads = os.path.join(tmp, 'reads.fa')
+            hits = os.path.join(tmp, 'hits.fa')
+            self.write(reads, ">r1\nACGT\n")
+            self.write(hits, ">r1\nACGT\n")
+            checkpointer = Checkpointer(tmp, self.parameters)
+            fingerprint = checkpointer.fingerprint(Checkpointer.SEARCH_STAGE, [reads])
+            checkpointer.save('reads', Checkpointer.SEARCH_STAGE, fingerprint, 'result', [hits])
+            os.remove(hits)
+            self.assertEqual(None, Checkpointer(tmp, self.parameters).load(
+                'reads', Checkpointer.SEARCH_STAGE, fingerprint))
+
+    def test_concurrent_save(self):
+        with tempdir.TempDir() as tmp:
+            checkpointer = Checkpointer(tmp, self.parameters)
+            def save(direction):
+                for i in range(50):
+                    checkpointer.save('sample%i_%s' % (i, direction), Checkpointer.SEARCH_STAGE,
+                                      'fingerprint', list(range(100)), [])
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(save, ['forward', 'reverse']))
+
+            resumed = Checkpointer(tmp, self.parameters)
+            for i in range(50):
+                for direction in ['forward', 'reverse']:
+                    self.assertEqual(list(range(100)), resumed.load(
+                        'sample%i_%s' % (i, direction), Checkpointer.SEARCH_STAGE, 'fingerprint'))
+            self.assertEqual([], [f for f in os.listdir(tmp) if f.endswith('.tmp')])
+
+    def test_make_working_directory_resume(self):
+        with tempdir.TempDir() as tmp:
+            outdir = os.path.join(tmp, 'out')
+            os.mkdir(outdir)
+            self.write(os.path.join(outdir, 'kept'), '')
+            HouseKeeping().make_working_directory(outdir, True, True)
+            self.assertTrue(os.path.exists(os.path.join(outdir, 'kept')))
+            HouseKeeping().make_working_directory(outdir, True)
+            self.assertFalse(os.path.exists(os.path.join(outdir, 'kept')))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.classify import Classify
+
+path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
+
+class Tests(unittest.TestCase):
+    taxonomy = os.path.join(path_to_data, 'mcrA.gpkg', 'mcrA.refpkg', 'mcrA_taxonomy.csv')
+
+    def jplace(self, groups):
+        return {'fields': ['classification', 'like_weight_ratio'],
+                'placements': [{'p': p, 'nm': [[name, 1]]} for name, p in groups]}
+
+    def test_confident_single_placement(self):
+        observed = Classify(self.taxonomy).assignPlacement(
+            self.jplace([('read1_0', [['mcrA', 0.8], ['mcrA', 0.2]])]), 0.75, False)
+        self.assertEqual({'0': {'read1': {'placement': ['Root', 'mcrA'],
+                                          'confidence': [1.0, 1.0]}}},
+                         observed)
+
+    def test_memoised_groups_are_independent(self):
+        p = [['Euryarchaeota_mcrA', 0.6], ['mrtA', 0.4]]
+        classify = Classify(self.taxonomy)
+        observed = classify.assignPlacement(
+            self.jplace([('read1_0', p), ('read2_0', list(p)), ('read3_1', list(p)),
+                         ('read4_0', [['mcrA', 1.0]]), ('read5_0', [['mcrA', 1.0]])]),
+            0.5, False)
+        expected = observed['0']['read1']
+        self.assertEqual(['Root', 'mcrA', 'Euryarchaeota_mcrA'], expected['placement'])
+        self.assertEqual(expected, observed['0']['read2'])
+        self.assertEqual(expected, observed['1']['read3'])
+        # Changing the result of one read leaves the others as they were
+        expected['placement'].append('extra')
+        observed['0']['read4']['placement'].append('extra')
+        self.assertEqual(['Root', 'mcrA', 'Euryarchaeota_mcrA'], observed['0']['read2']['placement'])
+        self.assertEqual(['Root', 'mcrA'], observed['0']['read5']['placement'])
+        self.assertEqual(['Root', 'mcrA'], classify.taxonomy['mcrA'])
+
+    def test_memo_independent_of_placement_order(self):
+        classify = Classify(self.taxonomy)
+        reductions = []
+        reduce_tax_string = classify.reduceTaxString
+        def counting_reduce(*args):
+            reductions.append(args)
+            return reduce_tax_string(*args)
+        classify.reduceTaxString = counting_reduce
+        observed = classify.assignPlacement(
+            self.jplace([('read1_0', [['Euryarchaeota_mcrA', 0.6], ['mrtA', 0.4]]),
+                         ('read2_0', [['mrtA', 0.4], ['Euryarchaeota_mcrA', 0.6]])]),
+            0.5, False)
+        self.assertEqual(1, len(reductions))
+        self.assertEqual(observed['0']['read1'], observed['0']['read2'])
+
+    def test_resolve_placements(self):
+        observed = Classify(self.taxonomy).assignPlacement(
+            self.jplace([('read1_0', [['Euryarchaeota_mcrA', 0.3],
+                                      ['mrtA', 0.35],
+                                      ['mcrA', 0.35]])]),
+            0.75, True)
+        self.assertEqual(['Root', 'mcrA', 'Euryarchaeota_mcrA'],
+                         observed['0']['read1']['placement'])
+        for expected, confidence in zip([1.0, 0.65, 0.3], observed['0']['read1']['confidence']):
+            self.assertAlmostEqual(expected, confidence)
+
+if __name__ == "__main__":
+    unittest.main()
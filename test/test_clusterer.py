@@ -31,6 +31,8 @@ import extern
 from test_running_utils import T
 
 sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.clusterer import Clusterer, ClusterIndex
+from graftm.sequence_io import Sequence
 path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
 path_to_script = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'bin', 'graftM')
 
@@ -56,7 +58,7 @@ CGGGGTATCTAATCCCGTTCGCTCCCCTAGCTTTCGTGCCTCAGCGTCAGAAAAGACCCAGTGAGCCGCTTTCGCCCCCG
             tf.flush()
 
             with tempdir.TempDir() as tmp:
-                cmd = "%s graft --forward %s --graftm_package %s --output_directory %s --force" % (path_to_script,
+                cmd = "%s graft --forward %s --graftm_package %s --output_directory %s --force --keep_intermediates" % (path_to_script,
                                                                                                    tf.name,
                                                                                                    gpkg,
                                                                                                    tmp)
@@ -67,6 +69,39 @@ CGGGGTATCTAATCCCGTTCGCTCCCCTAGCTTTCGTGCCTCAGCGTCAGAAAAGACCCAGTGAGCCGCTTTCGCCCCCG
                     expected_rereplicated_alignment,
                     os.path.join(tmp, filename, "%s_hits.aln.fa" % filename))
 
+    def test_cluster_index_expand(self):
+        index = ClusterIndex([[Sequence('a', 'AC'), Sequence('b', 'AC')],
+                              [Sequence('c', 'GG')],
+                              [Sequence('d', 'TT'), Sequence('e', 'TT'), Sequence('f', 'TT')]])
+        self.assertEqual(3, len(index))
+        self.assertEqual(['d', 'e', 'f'], list(index.members('d')))
+        names, positions = index.expand([2, 0])
+        self.assertEqual(['d', 'e', 'f', 'a', 'b'], list(names))
+        self.assertEqual([0, 0, 0, 1, 1], list(positions))
+        names, positions = index.expand([])
+        self.assertEqual([], list(names))
+
+    def test_uncluster_annotations(self):
+        clusterer = Clusterer()
+        aligned = {'s/s_hits.aln.fa': [Sequence('r1', 'AC-T'), Sequence('r2', 'GG-T'),
+                                       Sequence('r3', 'AC-T')]}
+        clusterer.cluster(['s/s_hits.aln.fa'], False, aligned)
+        assignments = clusterer.uncluster_annotations(
+            {'s_clustered.fa': {'r1': ['Root', 'k__A'], 'r2': ['Root']}}, False)
+        self.assertEqual({'r1': ('Root', 'k__A'), 'r3': ('Root', 'k__A'), 'r2': ('Root',)},
+                         dict(assignments['s'].items()))
+
+    def test_uncluster_annotations_reverse_pipe(self):
+        clusterer = Clusterer()
+        aligned = {'s/s_forward_hits.aln.fa': [Sequence('r_1/1_1_1_1', 'MK-L'),
+                                               Sequence('r_2/1_4_2_1', 'MK-L')],
+                   's/s_reverse_hits.aln.fa': [Sequence('r_1/2_1_1_1', 'WW-L')]}
+        clusterer.cluster(['s/s_forward_hits.aln.fa', 's/s_reverse_hits.aln.fa'], True, aligned)
+        assignments = clusterer.uncluster_annotations(
+            {'s_forward_clustered.fa': {'r_1': ['Root', 'k__A']}}, True, True)
+        self.assertEqual(['s'], list(assignments.keys()))
+        self.assertEqual({'r_1/1_1_1_1': ('Root', 'k__A'), 'r_2/1_4_2_1': ('Root', 'k__A')},
+                         dict(assignments['s'].items()))
 
 if __name__ == "__main__":
     unittest.main()
@@ -284,7 +284,7 @@ GCTGTAGCATACTGTGTGAATCCGACACCACC
             package = os.path.join(path_to_data,'mcrA.gpkg')
 
             with tempdir.TempDir() as tmp:
-                cmd = '%s graft --verbosity 2 --forward %s --graftm_package %s --output_directory %s --force' % (path_to_script,
+                cmd = '%s graft --verbosity 2 --forward %s --graftm_package %s --output_directory %s --force --keep_intermediates' % (path_to_script,
                                                                                                    data,
                                                                                                    package,
                                                                                                    tmp)
@@ -368,7 +368,7 @@ TGCTTTTACCTTGTTG'''
             package = os.path.join(path_to_data,'mcrA.gpkg')
 
             with tempdir.TempDir() as tmp:
-                cmd = '%s graft --verbosity 2 --forward %s --graftm_package %s --output_directory %s --force' % (path_to_script,
+                cmd = '%s graft --verbosity 2 --forward %s --graftm_package %s --output_directory %s --force --keep_intermediates' % (path_to_script,
                                                                                                    data,
                                                                                                    package,
                                                                                                    tmp)
@@ -912,7 +912,7 @@ CCGACTGCCCTTGAAGACCACTTCG
             package = os.path.join(path_to_data,'mcrA.gpkg')
 
             with tempdir.TempDir() as tmp:
-                cmd = '%s graft --verbosity 2 --min_orf_length 300 --forward %s --graftm_package %s --output_directory %s --force' % (path_to_script,
+                cmd = '%s graft --verbosity 2 --min_orf_length 300 --forward %s --graftm_package %s --output_directory %s --force --keep_intermediates' % (path_to_script,
                                                                                                    data,
                                                                                                    package,
                                                                                                    tmp)
@@ -966,7 +966,7 @@ CCGACTGCCCTTGAAGACCACTTCG
             package = os.path.join(path_to_data,'mcrA.gpkg')
 
             with tempdir.TempDir() as tmp:
-                cmd = '%s graft --verbosity 2  --restrict_read_length 102 --forward %s --graftm_package %s --output_directory %s --force' % (path_to_script,
+                cmd = '%s graft --verbosity 2  --restrict_read_length 102 --forward %s --graftm_package %s --output_directory %s --force --keep_intermediates' % (path_to_script,
                                                                                                    data,
                                                                                                    package,
                                                                                                    tmp)
@@ -1536,6 +1536,68 @@ FADPHLVFDFREPKMCIAKATLRQFMPAGERDPTLPPH
         # clean up
         os.remove(f.name+".dmnd")
 
+    def test_decoy_final_sample(self):
+        # All hits of the last sample are decoys, but those of the first
+        # sample are still placed
+        decoy_sequence = '''>bathyarchaeota ba1 mcrA not in test gpkg
+AMAEEERKRKAPREGQITAREREYVRELYAVSERFLEVERKRPMY
+AAMERTFGSDPFQRIDPKMYKRGGFRQSKRKQEFVRLGRQVAIERGLPAYNRAMGIPL
+GQRQLEPFSVGKTGILAEQDDLHHVNNPAIQQMVDDIKRTTIVNLDIAHRMLQVRAGK
+EVTPETINLYLETLNHTMCGGAVAQEHMSEINPLLVKDAYAKVITGSDEIKDALDRRF
+VIDLDKQFHPTRAKKLKEAIGNTIWVVLRAPTIAIRMADGEEAGRWSAMQNTMAFIGS
+YGLSGEQVVSDLAYSFKHARVIRMGNKFWFQRMRGRNEPGGMPEGYLCDCAQSCSHLP
+AKPFLKAAQESIEEAKKYVHAMSEGICIPAIIDSAYWFGFYMSGGIGFTNTTAGAALG
+EASETFQEELAELSNKYAADIDRVPPRWDVVRFIVDMIIQYAMETYEKIPALTEFHWG
+GAHRISLIGSLGAGTAALLTGDSTMGLWGSHYAIALAMKEGWLRTGWAGQEVQDHIGL
+PYLCSYRPEEGNFAELRGYNTPYASFTAGHGVIREVAGYAAMVGRGDAWVASPVVKAA
+FADPHLVFDFREPKMCIAKATLRQFMPAGERDPTLPPH
+'''
+        fna_file = os.path.join(path_to_data, 'mcrA.gpkg/mcrA_1.1.fna')
+        gpkg=os.path.join(path_to_data, "mcrA.gpkg")
+        with tempfile.NamedTemporaryFile(prefix='graftmdec', suffix='.fa',mode='w') as f:
+            f.write(decoy_sequence)
+            f.flush()
+            extern.run("diamond makedb --in %s --db %s.dmnd" %\
+                       (f.name, f.name))
+
+            with tempdir.TempDir() as tmp:
+                cmd = '%s graft --verbosity 5 --forward %s %s --graftm_package '\
+                      '%s --output_directory %s --force --decoy_database %s' %\
+                      (path_to_script,
+                       fna_file,
+                       f.name,
+                       gpkg,
+                       tmp,
+                       f.name+".dmnd")
+                extern.run(cmd)
+                subdir = os.path.splitext(os.path.basename(f.name))[0]
+                self.assertFalse(os.path.exists(
+                    os.path.join(tmp, subdir, "%s_hits.fa" % subdir)))
+                with open(os.path.join(tmp, 'combined_count_table.txt')) as table:
+                    self.assertTrue('mcrA_1.1' in table.readline())
+        # clean up
+        os.remove(f.name+".dmnd")
+
+    def test_resume_with_tmpdir(self):
+        fna_file = os.path.join(path_to_data, 'mcrA.gpkg/mcrA_1.1.fna')
+        gpkg=os.path.join(path_to_data, "mcrA.gpkg")
+        with tempdir.TempDir() as tmp:
+            with tempdir.TempDir() as scratch:
+                cmd = '%s graft --verbosity 5 --forward %s --graftm_package '\
+                      '%s --output_directory %s --force --resume --tmpdir %s' %\
+                      (path_to_script,
+                       fna_file,
+                       gpkg,
+                       tmp,
+                       scratch)
+                subprocess.check_output(cmd, shell=True)
+                # The hits are kept in the output directory for resuming
+                self.assertTrue(os.path.exists(
+                    os.path.join(tmp, 'mcrA_1.1', 'mcrA_1.1_hits.fa')))
+                output = subprocess.run(cmd, shell=True, check=True,
+                                        stderr=subprocess.PIPE).stderr.decode()
+                self.assertTrue('Skipping completed search stage' in output)
+
     def test_too_short_orfs(self):
         fna_file = os.path.join(path_to_data, 'mcrA.gpkg/mcrA_1.1.fna')
         gpkg=os.path.join(path_to_data, "mcrA.gpkg")
@@ -24,10 +24,14 @@
 import unittest
 import os
 import sys
+import tempfile
+import json
 
 sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
 from graftm.pplacer import Pplacer
 from graftm.sequence_io import Sequence
+from graftm.clusterer import Clusterer, ClusterIndex
+from graftm.read_id_table import ReadIdTable
 
 class Tests(unittest.TestCase):
     path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
@@ -35,8 +39,8 @@ class Tests(unittest.TestCase):
     def test_basic_split(self):
         input_alias_hash = {'0':{'place':[]}, '1':{'place':[]}}
         expected_placement=['p__Proteobacteria', 'k__Bacteria', 'p__Proteobacteria']
-        mock_cluster_hash = {'0':  {"test_read1": [Sequence("test_read1", "SEQUENCE")]},
-                             '1':  {"test_read2": [Sequence("test_read2", "SEQUENCE")]}}
+        mock_cluster_hash = {'0':  ClusterIndex([[Sequence("test_read1", "SEQUENCE")]]),
+                             '1':  ClusterIndex([[Sequence("test_read2", "SEQUENCE")]])}
         test_json = {
                      "fields":["classification", "distal_length", "edge_num", "like_weight_ratio", "likelihood", "pendant_length"], 
                      "tree":"((696036:0.2205{0},229854:0.20827{1})1.000:0.14379{2},3190878:0.23845{3},2107103:0.32104{4}){5};",
@@ -67,10 +71,10 @@ class Tests(unittest.TestCase):
     def test_basic_split_with_different_placements(self):
         input_alias_hash = {'0':{'place':[]}, '1':{'place':[]}}
         mock_cluster_hash = {
-                             '0':  {"test_read1": [Sequence("test_read1", "SEQUENCE")],
-                                    "test_read3": [Sequence("test_read3", "SEQUENCE")]},
-                             '1':  {"test_read2": [Sequence("test_read2", "SEQUENCE")],
-                                    "test_read4": [Sequence("test_read4", "SEQUENCE")]}
+                             '0':  ClusterIndex([[Sequence("test_read1", "SEQUENCE")],
+                                                 [Sequence("test_read3", "SEQUENCE")]]),
+                             '1':  ClusterIndex([[Sequence("test_read2", "SEQUENCE")],
+                                                 [Sequence("test_read4", "SEQUENCE")]])
                              }
         
         test_json = {"fields":
@@ -164,8 +168,8 @@ class Tests(unittest.TestCase):
     def test_rereplicating_json_file(self):
         input_alias_hash = {'0':{'place':[]}}
         mock_cluster_hash = {
-                             '0':  {"test_read1": [Sequence("test_read1", "SEQUENCE"),
-                                                   Sequence("test_read2", "SEQUENCES")]}
+                             '0':  ClusterIndex([[Sequence("test_read1", "SEQUENCE"),
+                                                  Sequence("test_read2", "SEQUENCES")]])
                              }
         test_json = {"fields":
                       ["classification", "distal_length", "edge_num", "like_weight_ratio",
@@ -208,5 +212,136 @@ class Tests(unittest.TestCase):
         self.assertEqual(expected_placement_results,
                         observed_placement_results)
 
+    def test_split_with_placed_members(self):
+        mock_cluster_hash = {
+                             '0':  ClusterIndex([[Sequence("test_read1", "SEQUENCE"),
+                                                  Sequence("test_read3", "SEQUENCE")]]),
+                             '1':  ClusterIndex([[Sequence("test_read2", "SEQUENCE")]])
+                             }
+        read_ids = ReadIdTable()
+        placed_members = {0: [read_ids.add(0, 'test_read1'), read_ids.add(1, 'test_read2')]}
+        p = [["p__Proteobacteria", 0.107586583111, 1, 0.970420466541, -614.032176075, 0.22226616471]]
+        test_json = {"fields":
+                      ["classification", "distal_length", "edge_num", "like_weight_ratio",
+                        "likelihood", "pendant_length"],
+                     "placements": [{"p": p, "nm": [["graftm_q0", 1]]}]}
+
+        pplacer = Pplacer("refpkg_decoy")
+        observed_placement_results = pplacer.jplace_split(test_json,
+                                                          mock_cluster_hash,
+                                                          placed_members,
+                                                          read_ids)
+
+        self.assertEqual({'0': [{"p": p, "nm": [["test_read1", 1], ["test_read3", 1]]}],
+                          '1': [{"p": p, "nm": [["test_read2", 1]]}]},
+                         observed_placement_results)
+
+    def test_alignment_merger_dereplicates_across_files(self):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.aln.fa') as f1:
+            f1.write(">r1\nAC-T\n>r2\nGG-T\n")
+            f1.flush()
+            with tempfile.NamedTemporaryFile(mode='w', suffix='.aln.fa') as f2:
+                f2.write(">r3\nAC-T\n>r_4\nTT-A\n")
+                f2.flush()
+                with tempfile.NamedTemporaryFile(mode='r', suffix='.aln.fa') as out:
+                    pplacer = Pplacer("refpkg_decoy")
+                    alias_hash = pplacer.alignment_merger([f1.name, None, f2.name],
+                                                          out.name)
+                    self.assertEqual(">graftm_q0\nAC-T\n>graftm_q1\nGG-T\n>graftm_q3\nTT-A\n",
+                                     out.read())
+        self.assertEqual(['0','2'], sorted(alias_hash.keys()))
+        self.assertEqual({0: [0, 2],
+                          1: [1],
+                          3: [3]},
+                         pplacer.placed_members)
+        self.assertEqual([('0','r1'), ('2','r3')],
+                         Pplacer.placed_name_members('graftm_q0', pplacer.placed_members,
+                                                     pplacer.read_ids))
+        self.assertEqual([('2','r_4')],
+                         Pplacer.placed_name_members('graftm_q3', pplacer.placed_members,
+                                                     pplacer.read_ids))
+
+    def test_alignment_merger_clustered_in_memory(self):
+        aligned = {'a/a_hits.aln.fa': [Sequence('r1', 'AC-T'), Sequence('r2', 'GG-T'),
+                                       Sequence('r5', 'AC-T')],
+                   'b/b_hits.aln.fa': [Sequence('r3', 'AC-T')]}
+        clusterer = Clusterer()
+        clustered = clusterer.cluster(['a/a_hits.aln.fa', 'b/b_hits.aln.fa'], False, aligned)
+        self.assertEqual(['a/a_clustered.fa', 'b/b_clustered.fa'], clustered)
+        self.assertFalse(os.path.exists('a/a_clustered.fa'))
+        self.assertEqual(['r1', 'r2'], [s.name for s in clusterer.representatives['a/a_clustered.fa']])
+
+        with tempfile.NamedTemporaryFile(mode='r', suffix='.aln.fa') as out:
+            pplacer = Pplacer("refpkg_decoy")
+            alias_hash = pplacer.alignment_merger(clustered, out.name,
+                                                  clusterer.representatives)
+            self.assertEqual(">graftm_q0\nAC-T\n>graftm_q1\nGG-T\n", out.read())
+        self.assertEqual(os.path.join('b', 'placements.jplace'), alias_hash['1']['output_path'])
+        self.assertEqual({0: [0, 2],
+                          1: [1]},
+                         pplacer.placed_members)
+        self.assertEqual([('1','r3')], [pplacer.read_ids.resolve(2)])
+
+    def test_split_alignment_into_chunks(self):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.aln.fa') as f:
+            f.write(">a\nAC-T\n>b\nACGT\n>c\nA--T\n")
+            f.flush()
+            pplacer = Pplacer("refpkg_decoy", chunk_size=2)
+            with tempfile.TemporaryDirectory() as d:
+                chunks = pplacer._split_alignment(f.name, 2, d)
+                self.assertEqual([os.path.join(d, 'chunk0.aln.fa'),
+                                  os.path.join(d, 'chunk1.aln.fa')], chunks)
+                self.assertEqual(">a\nAC-T\n>b\nACGT\n", open(chunks[0]).read())
+                self.assertEqual(">c\nA--T\n", open(chunks[1]).read())
+
+    def test_merge_jplaces(self):
+        header = {"fields": ["classification", "edge_num"],
+                  "tree": "(a:1{0},b:1{1}){2};", "version": 3}
+        with tempfile.TemporaryDirectory() as d:
+            paths = []
+            for i in range(2):
+                jplace = dict(header)
+                jplace['placements'] = [{"p": [["k__Bacteria", i]], "nm": [["read%i" % i, 1]]}]
+                paths.append(os.path.join(d, "chunk%i.jplace" % i))
+                with open(paths[-1], 'w') as f:
+                    json.dump(jplace, f)
+            output = os.path.join(d, "merged.jplace")
+            Pplacer("refpkg_decoy")._merge_jplaces(paths, output)
+            merged = json.load(open(output))
+            self.assertEqual(header['tree'], merged['tree'])
+            self.assertEqual([{"p": [["k__Bacteria", 0]], "nm": [["read0", 1]]},
+                              {"p": [["k__Bacteria", 1]], "nm": [["read1", 1]]}],
+                             merged['placements'])
+
+    def test_read_jplace_normalises_names(self):
+        jplace = {"fields": ["classification", "like_weight_ratio"],
+                  "tree": "(a:1{0},b:1{1}){2};", "version": 3, "metadata": {},
+                  "placements": [{"p": [["k__Bacteria", 1.0]], "n": ["read1_0", "read2_0"]},
+                                 {"p": [["k__Archaea", 1.0]], "nm": [["read3_0", 2]]}]}
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.jplace') as f:
+            json.dump(jplace, f)
+            f.flush()
+            observed = Pplacer.read_jplace(f.name)
+        self.assertEqual([{"p": [["k__Bacteria", 1.0]], "nm": [["read1_0", 1], ["read2_0", 1]]},
+                          {"p": [["k__Archaea", 1.0]], "nm": [["read3_0", 2]]}],
+                         observed['placements'])
+
+    def test_write_jplace_compact_and_pretty(self):
+        jplace = {"fields": ["classification"], "tree": "(a:1{0},b:1{1}){2};",
+                  "version": 3, "metadata": {}}
+        placements = [{"p": [["k__Bacteria"]], "nm": [["read1", 1]]}]
+        with tempfile.TemporaryDirectory() as d:
+            alias_hash = {'0': {'output_path': os.path.join(d, 'placements.jplace'),
+                                'place': placements}}
+            pplacer = Pplacer("refpkg_decoy")
+            pplacer.write_jplace(jplace, alias_hash)
+            compact = open(alias_hash['0']['output_path']).read()
+            self.assertNotIn("\n", compact)
+            self.assertEqual(placements, json.loads(compact)['placements'])
+            pplacer.write_jplace(jplace, alias_hash, pretty=True)
+            pretty = open(alias_hash['0']['output_path']).read()
+            self.assertIn("\n", pretty)
+            self.assertEqual(json.loads(compact), json.loads(pretty))
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+import tempdir
+import extern
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.merge import Merger, DuplicateSampleException
+
+path_to_script = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'bin', 'graftM')
+
+class Tests(unittest.TestCase):
+    def write_graft_output(self, directory, count_table, search_table):
+        os.mkdir(directory)
+        with open(os.path.join(directory, 'combined_count_table.txt'), 'w') as f:
+            f.write(count_table)
+        with open(os.path.join(directory, 'search_otu_table.txt'), 'w') as f:
+            f.write(search_table)
+
+    def test_merge(self):
+        with tempdir.TempDir() as tmp:
+            shard1 = os.path.join(tmp, 'shard1')
+            shard2 = os.path.join(tmp, 'shard2')
+            self.write_graft_output(shard1,
+                                    "#ID\tsample1\tsample2\tConsensusLineage\n"
+                                    "1\t2\t0\tRoot; k__Bacteria\n"
+                                    "2\t1\t3\tRoot\n",
+                                    "#ID\tsample1\tsample2\n"
+                                    "16S\t3\t3\n")
+            self.write_graft_output(shard2,
+                                    "#ID\tsample3\tConsensusLineage\n"
+                                    "1\t4\tRoot; k__Archaea\n"
+                                    "2\t1\tRoot\n",
+                                    "#ID\tsample3\n"
+                                    "16S\t5\n")
+            output = os.path.join(tmp, 'merged')
+            extern.run("%s merge --graft_output_directories %s %s --output_directory %s --verbosity 2" % (
+                path_to_script, shard1, shard2, output))
+            self.assertEqual("#ID\tsample1\tsample2\tsample3\tConsensusLineage\n"
+                             "1\t2\t0\t0\tRoot; k__Bacteria\n"
+                             "2\t1\t3\t1\tRoot\n"
+                             "3\t0\t0\t4\tRoot; k__Archaea\n",
+                             open(os.path.join(output, 'combined_count_table.txt')).read())
+            self.assertEqual("#ID\tsample1\tsample2\tsample3\n"
+                             "16S\t3\t3\t5\n",
+                             open(os.path.join(output, 'search_otu_table.txt')).read())
+            self.assertTrue(os.path.exists(os.path.join(output, 'graftm.biom')))
+
+    def test_duplicate_samples(self):
+        with tempdir.TempDir() as tmp:
+            shard1 = os.path.join(tmp, 'shard1')
+            shard2 = os.path.join(tmp, 'shard2')
+            for shard in (shard1, shard2):
+                self.write_graft_output(shard,
+                                        "#ID\tsample1\tConsensusLineage\n"
+                                        "1\t1\tRoot\n",
+                                        "#ID\tsample1\n"
+                                        "16S\t1\n")
+            with self.assertRaises(DuplicateSampleException):
+                Merger().merge([shard1, shard2], os.path.join(tmp, 'merged'))
+
+if __name__ == "__main__":
+    unittest.main()
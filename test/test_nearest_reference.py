@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.nearest_reference import NearestReferenceClassifier
+from graftm.graftm_package import GraftMPackage
+from graftm.sequence_io import SequenceIO
+
+path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
+
+class Tests(unittest.TestCase):
+    gpkg = GraftMPackage.acquire(os.path.join(path_to_data, '61_otus.gpkg'))
+
+    def classifier(self):
+        return NearestReferenceClassifier(self.gpkg.alignment_fasta_path(),
+                                          self.gpkg.taxtastic_taxonomy_path(),
+                                          self.gpkg.taxtastic_seqinfo_path())
+
+    def test_reference_fragments_assigned_to_their_taxonomy(self):
+        classifier = self.classifier()
+        refs = SequenceIO().read_fasta_file(self.gpkg.alignment_fasta_path())
+        reads = {"read_%s" % s.name: s.seq[:700]+'-'*(len(s.seq)-700) for s in refs[:3]}
+        observed = classifier.classify(reads)
+        self.assertEqual(['Root', 'k__Bacteria', 'p__Proteobacteria',
+                          'c__Alphaproteobacteria', 'o__Rickettsiales',
+                          'f__mitochondria', 'g__Lardizabala'],
+                         observed['read_4251079'])
+        self.assertEqual(['Root', 'k__Archaea', 'p__[Parvarchaeota]',
+                          'c__[Parvarchaea]', 'o__YLA114'],
+                         observed['read_426860'])
+
+    def test_ties_assigned_to_lowest_common_ancestor(self):
+        self.assertEqual(['k__Archaea', 'p__[Parvarchaeota]', 'c__[Parvarchaea]'],
+                         NearestReferenceClassifier._lowest_common_ancestor(
+                             [['k__Archaea', 'p__[Parvarchaeota]', 'c__[Parvarchaea]', 'o__YLA114'],
+                              ['k__Archaea', 'p__[Parvarchaeota]', 'c__[Parvarchaea]', 'o__WCHD3-30']]))
+
+    def test_read_without_aligned_positions(self):
+        classifier = self.classifier()
+        length = len(SequenceIO().read_fasta_file(self.gpkg.alignment_fasta_path())[0].seq)
+        self.assertEqual({'empty': ['Root']}, classifier.classify({'empty': '-'*length}))
+
+    def test_wrong_alignment_length(self):
+        with self.assertRaises(Exception):
+            self.classifier().classify({'short': 'ACGT'})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+import json
+import tempdir
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.placement_cache import PlacementCache
+from graftm.pplacer import Pplacer
+
+path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
+
+class Tests(unittest.TestCase):
+    refpkg = os.path.join(path_to_data, '61_otus.gpkg', '61_otus.refpkg')
+    jplace = {'fields': ['classification', 'like_weight_ratio'],
+              'tree': '(a:1{0},b:1{1}){2};',
+              'version': 3,
+              'metadata': {'invocation': 'pplacer'},
+              'placements': []}
+
+    def test_round_trip(self):
+        with tempdir.TempDir() as tmp:
+            cache = PlacementCache(os.path.join(tmp, 'cache.db'), self.refpkg)
+            self.assertEqual({}, cache.lookup(['AC-T']))
+            cache.store({'AC-T': [['a', 1.0]]}, self.jplace)
+            cache.close()
+
+            cache = PlacementCache(os.path.join(tmp, 'cache.db'), self.refpkg)
+            self.assertEqual({'AC-T': [['a', 1.0]]}, cache.lookup(['AC-T', 'GG-T']))
+            header = cache.jplace_header()
+            self.assertEqual(self.jplace['tree'], header['tree'])
+            self.assertFalse('placements' in header)
+
+    def test_different_refpkg(self):
+        with tempdir.TempDir() as tmp:
+            cache = PlacementCache(os.path.join(tmp, 'cache.db'), self.refpkg)
+            cache.store({'AC-T': [['a', 1.0]]}, self.jplace)
+            cache.close()
+            other_refpkg = os.path.join(path_to_data, 'mcrA.gpkg', 'mcrA.refpkg')
+            cache = PlacementCache(os.path.join(tmp, 'cache.db'), other_refpkg)
+            self.assertEqual({}, cache.lookup(['AC-T']))
+
+    def test_eviction(self):
+        with tempdir.TempDir() as tmp:
+            cache = PlacementCache(os.path.join(tmp, 'cache.db'), self.refpkg,
+                                   max_entries=2)
+            cache.store({'A': [['a', 1.0]]}, self.jplace)
+            cache.store({'B': [['b', 1.0]]}, self.jplace)
+            cache.lookup(['A'])
+            cache.store({'C': [['a', 1.0]]}, self.jplace)
+            self.assertEqual(2, len(cache))
+            self.assertEqual(['A','C'], sorted(cache.lookup(['A','B','C']).keys()))
+
+    def test_changed_fields_discards_placements(self):
+        with tempdir.TempDir() as tmp:
+            cache = PlacementCache(os.path.join(tmp, 'cache.db'), self.refpkg)
+            cache.store({'A': [['a', 1.0]]}, self.jplace)
+            new_jplace = dict(self.jplace)
+            new_jplace['fields'] = ['classification', 'likelihood']
+            cache.store({'B': [['b', -3.0]]}, new_jplace)
+            self.assertEqual(['B'], list(cache.lookup(['A','B']).keys()))
+
+    def test_pplacer_with_cache_keeps_input(self):
+        with tempdir.TempDir() as tmp:
+            cache = PlacementCache(os.path.join(tmp, 'cache.db'), self.refpkg)
+            cache.store({'AC-T': [['a', 1.0]]}, self.jplace)
+            pplacer = Pplacer(self.refpkg, placement_cache=cache,
+                              temporary_directory=tmp)
+            placed = []
+            def place(output_file, output_path, input_path, threads):
+                # Stands in for pplacer, placing each sequence on edge b
+                with open(input_path) as f:
+                    names = [line[1:].strip() for line in f if line.startswith('>')]
+                placed.extend(names)
+                jplace = dict(self.jplace)
+                jplace['placements'] = [{'p': [['b', 1.0]], 'nm': [[n, 1]]} for n in names]
+                jplace_path = '.'.join(input_path.split('.')[:-1]) + '.jplace'
+                with open(jplace_path, 'w') as f:
+                    json.dump(jplace, f)
+                return jplace_path
+            pplacer.pplacer = place
+
+            alignment = os.path.join(tmp, 'combined_alignment.aln.fa')
+            contents = ">q0\nAC-T\n>q1\nGG-T\n"
+            with open(alignment, 'w') as f:
+                f.write(contents)
+            jplace_path = pplacer.pplacer_with_cache(None, tmp, alignment, 1)
+
+            self.assertEqual(['q1'], placed)
+            with open(alignment) as f:
+                self.assertEqual(contents, f.read())
+            with open(jplace_path) as f:
+                placements = {p['nm'][0][0]: p['p'] for p in json.load(f)['placements']}
+            self.assertEqual({'q0': [['a', 1.0]], 'q1': [['b', 1.0]]}, placements)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+import time
+import asyncio
+import extern
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.process_runner import ProcessRunner
+from graftm.profiler import Profiler
+
+class Tests(unittest.TestCase):
+    def test_run_all_concurrently(self):
+        runner = ProcessRunner(2)
+        start = time.time()
+        self.assertEqual(["a\n", "b\n"], runner.run_all([runner.run("sleep 0.5; echo a"),
+                                                         runner.run("sleep 0.5; echo b")]))
+        self.assertTrue(time.time() - start < 0.9)
+
+    def test_max_processes(self):
+        runner = ProcessRunner(1)
+        start = time.time()
+        runner.run_all([runner.run("sleep 0.3"), runner.run("sleep 0.3")])
+        self.assertTrue(time.time() - start >= 0.6)
+
+    def test_threads_weighted(self):
+        runner = ProcessRunner(3)
+        start = time.time()
+        # The two commands using 2 threads each cannot run at the same time
+        runner.run_all([runner.run("sleep 0.3", threads=2), runner.run("sleep 0.3", threads=2)])
+        self.assertTrue(time.time() - start >= 0.6)
+        start = time.time()
+        # A command using more than the maximum is still run
+        runner.run_all([runner.run("sleep 0.3", threads=1), runner.run("sleep 0.3", threads=2)])
+        runner.run_all([runner.run("true", threads=10)])
+        self.assertTrue(time.time() - start < 0.55)
+
+    def test_set_max_threads_keeps_running_commands(self):
+        runner = ProcessRunner(2)
+        async def resize_while_running():
+            running = asyncio.ensure_future(runner.run("sleep 0.3", threads=2))
+            await asyncio.sleep(0.1)
+            # The running command is still counted against the new limit
+            runner.set_max_threads(2)
+            start = time.time()
+            await runner.run("true")
+            waited = time.time() - start
+            await running
+            return waited
+        self.assertTrue(asyncio.run(resize_while_running()) >= 0.15)
+        self.assertEqual(2, runner.max_threads)
+
+    def test_cancelled_waiter_releases_nothing(self):
+        runner = ProcessRunner(1)
+        async def cancel_waiting():
+            running = asyncio.ensure_future(runner.run("sleep 0.3"))
+            await asyncio.sleep(0.1)
+            waiting = asyncio.ensure_future(runner.run("echo waiting"))
+            await asyncio.sleep(0.05)
+            waiting.cancel()
+            await asyncio.gather(running, waiting, return_exceptions=True)
+        asyncio.run(cancel_waiting())
+        # All of the budget is free again
+        start = time.time()
+        self.assertEqual(["a\n"], runner.run_all([runner.run("echo a")]))
+        self.assertTrue(time.time() - start < 1)
+
+    def test_run_all_within_event_loop(self):
+        runner = ProcessRunner()
+        async def in_loop():
+            return runner.run_all([runner.run("echo a")])
+        self.assertEqual(["a\n"], asyncio.run(in_loop()))
+
+    def test_run_sync_shares_budget(self):
+        runner = ProcessRunner(2)
+        start = time.time()
+        # Blocking commands run from two threads wait for each other
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            outputs = list(executor.map(
+                lambda name: runner.run_sync("sleep 0.3; cat", stdin=name, threads=2),
+                ["a", "b"]))
+        self.assertEqual(["a", "b"], outputs)
+        self.assertTrue(time.time() - start >= 0.6)
+
+    def test_line_handler_and_stdin(self):
+        runner = ProcessRunner()
+        lines = []
+        self.assertEqual(None, runner.run_all([runner.run("cat", stdin="x\ny\n",
+                                                          line_handler=lines.append)])[0])
+        self.assertEqual(["x\n", "y\n"], lines)
+
+    def test_failure_cancels_others(self):
+        runner = ProcessRunner(2)
+        start = time.time()
+        with self.assertRaises(extern.ExternCalledProcessError) as context:
+            runner.run_all([runner.run("sleep 10"),
+                            runner.run("echo oops >&2; exit 3")])
+        self.assertEqual(3, context.exception.returncode)
+        self.assertTrue('oops' in str(context.exception))
+        self.assertTrue(time.time() - start < 5)
+
+    def test_recorded_by_profiler(self):
+        runner = ProcessRunner()
+        profiler = Profiler()
+        profiler.install()
+        try:
+            runner.run_all([runner.run("echo hello")])
+        finally:
+            profiler.uninstall()
+        self.assertEqual(None, Profiler.installed())
+        self.assertEqual(['echo hello'], [c['command'] for c in profiler.report()['commands']])
+        command = profiler.report()['commands'][0]
+        self.assertEqual(0, command['exit_status'])
+        # Resources are collected when the command is reaped
+        self.assertTrue(command['peak_rss_kb'] > 0)
+        self.assertTrue(command['user_seconds'] is not None)
+        self.assertTrue(command['system_seconds'] is not None)
+        if os.path.exists('/proc/self/io'):
+            self.assertTrue(command['bytes_written'] > 0)
+
+if __name__ == "__main__":
+    unittest.main()
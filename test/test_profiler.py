@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import tempdir
+import extern
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.profiler import Profiler
+
+class Tests(unittest.TestCase):
+    def test_command_profile(self):
+        profiler = Profiler()
+        profiler.install()
+        try:
+            stage = profiler.start_stage('search', 'sample1')
+            self.assertEqual("3\n", extern.run("wc -l", stdin="a\nb\nc\n"))
+            self.assertEqual("hello\n", extern.run("echo hello"))
+            profiler.end_stage(stage, 3)
+            with self.assertRaises(extern.ExternCalledProcessError) as context:
+                extern.run("echo oops >&2; exit 3")
+            self.assertEqual(3, context.exception.returncode)
+            self.assertTrue('oops' in str(context.exception))
+        finally:
+            profiler.uninstall()
+        self.assertNotEqual(profiler.run, extern.run)
+
+        report = profiler.report()
+        self.assertEqual(1, len(report['stages']))
+        stage = report['stages'][0]
+        self.assertEqual('search', stage['stage'])
+        self.assertEqual('sample1', stage['sample'])
+        self.assertEqual(3, stage['reads'])
+        self.assertTrue(stage['wall_seconds'] >= 0)
+        self.assertTrue(stage['peak_rss_kb'] > 0)
+
+        self.assertEqual(['wc -l', 'echo hello', 'echo oops >&2; exit 3'],
+                         [c['command'] for c in report['commands']])
+        self.assertEqual(['search', 'search', None],
+                         [c['stage'] for c in report['commands']])
+        self.assertEqual([0, 0, 3], [c['exit_status'] for c in report['commands']])
+        self.assertEqual(0, report['commands'][0]['stage_index'])
+        self.assertTrue(report['commands'][0]['peak_rss_kb'] > 0)
+
+    def test_run_measured(self):
+        allocate = "%s -c 'x = bytearray(%%i * 1024 * 1024); print(len(x))'" % sys.executable
+        # An earlier, larger child does not count towards the command measured
+        extern.run(allocate % 200)
+        stdout, usage = Profiler.run_measured(allocate % 20)
+        self.assertEqual(str(20 * 1024 * 1024) + "\n", stdout)
+        self.assertTrue(20 * 1024 <= usage['peak_rss_kb'] < 200 * 1024)
+        with self.assertRaises(extern.ExternCalledProcessError):
+            Profiler.run_measured("exit 2")
+
+    def test_reset(self):
+        profiler = Profiler()
+        profiler.install()
+        # As left by a job which failed without uninstalling its profiler
+        Profiler.reset()
+        self.assertIsNone(Profiler.installed())
+        extern.run("true")
+        self.assertEqual([], profiler.commands)
+
+    def test_concurrent_profilers(self):
+        # As for graft runs in separate threads of one process
+        profilers = {}
+        def graft(name, installed, finish):
+            profiler = Profiler()
+            profilers[name] = profiler
+            profiler.install()
+            try:
+                installed.wait()
+                extern.run("echo %s" % name)
+                # A thread started within the run records into its profiler
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    executor.submit(Profiler.copy_context().run, extern.run,
+                                    "echo %s_child" % name).result()
+                finish.wait()
+            finally:
+                profiler.uninstall()
+        installed = threading.Barrier(2)
+        finish = threading.Barrier(2)
+        threads = [threading.Thread(target=graft, args=(name, installed, finish))
+                   for name in ('first', 'second')]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        for name in ('first', 'second'):
+            self.assertEqual(['echo %s' % name, 'echo %s_child' % name],
+                             [c['command'] for c in profilers[name].commands])
+        self.assertIsNone(Profiler.installed())
+
+    def test_concurrent_stages(self):
+        profiler = Profiler()
+        stages = {}
+        def search(direction, started, finish):
+            stages[direction] = profiler.start_stage('search', direction)
+            started.set()
+            finish.wait()
+            profiler.run("echo %s" % direction)
+            profiler.end_stage(stages[direction])
+        forward_started = threading.Event()
+        reverse_started = threading.Event()
+        finish = threading.Event()
+        threads = [threading.Thread(target=search, args=('forward', forward_started, finish)),
+                   threading.Thread(target=search, args=('reverse', reverse_started, finish))]
+        threads[0].start()
+        forward_started.wait()
+        threads[1].start()
+        reverse_started.wait()
+        finish.set()
+        for thread in threads:
+            thread.join()
+
+        report = profiler.report()
+        self.assertEqual(sorted(['forward', 'reverse']),
+                         sorted([s['sample'] for s in report['stages']]))
+        self.assertEqual(dict([('echo forward', 'forward'), ('echo reverse', 'reverse')]),
+                         dict([(c['command'], c['sample']) for c in report['commands']]))
+
+    def test_bytes_written(self):
+        if not os.path.exists('/proc/self/io'):
+            self.skipTest("Bytes read and written are only recorded on Linux")
+        profiler = Profiler()
+        with tempdir.TempDir() as tmp:
+            profiler.run("head -c 100000 /dev/zero > %s" % os.path.join(tmp, 'zeros'))
+            self.assertTrue(profiler.commands[0]['bytes_written'] >= 100000)
+
+            path = os.path.join(tmp, 'profile.json')
+            profiler.write(path)
+            with open(path) as f:
+                self.assertEqual(1, len(json.load(f)['commands']))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.read_id_table import ReadIdTable
+from graftm.pplacer import Compare
+
+class Tests(unittest.TestCase):
+    def test_parse_name(self):
+        self.assertEqual(('read_1', None, None), ReadIdTable.parse_name('read_1'))
+        self.assertEqual(('read_1/1', (3, 2, 1), None),
+                         ReadIdTable.parse_name('read_1/1_3_2_1'))
+        self.assertEqual(('read_1', (10, 1, 2), 3),
+                         ReadIdTable.parse_name('read_1_split_3_10_1_2'))
+        self.assertEqual(('read', None, 2), ReadIdTable.parse_name('read_split_2'))
+
+    def test_add(self):
+        table = ReadIdTable()
+        self.assertEqual(0, table.add(0, 'a_b_12_3_1'))
+        self.assertEqual(1, table.add(2, 'c'))
+        self.assertEqual(2, len(table))
+        self.assertEqual(0, table.sample(0))
+        self.assertEqual('a_b_12_3_1', table.name(0))
+        self.assertEqual('a_b', table.read_name(0))
+        self.assertEqual((12, 3, 1), table.orf(0))
+        self.assertEqual(None, table.orf(1))
+        self.assertEqual(None, table.split(1))
+        self.assertEqual(('2', 'c'), table.resolve(1))
+
+    def test_placed_name(self):
+        self.assertEqual('graftm_q12', ReadIdTable.placed_name(12))
+        self.assertEqual(12, ReadIdTable.placed_name_id('graftm_q12'))
+
+    def test_pair_names(self):
+        table = ReadIdTable()
+        table.add(0, 'r_1/1_1_1_1')
+        table.add(0, 'r_2/1')
+        table.add(1, 'r_1/2_4_2_1')
+        self.assertEqual({'r_1/1_1_1_1': 'r_1', 'r_2/1': 'r_2'},
+                         table.pair_names(0, True))
+        self.assertEqual({'r_1/2_4_2_1': 'r_1/2'}, table.pair_names(1, False))
+
+    def test_compare_placements_with_pair_names(self):
+        table = ReadIdTable()
+        table.add(0, 'r_1/1_1_1_1')
+        table.add(1, 'r_1/2_4_2_1')
+        forward = {'r_1/1_1_1_1': {'placement': ['Root', 'k__A'], 'confidence': [1.0, 1.0]}}
+        reverse = {'r_1/2_4_2_1': {'placement': ['Root', 'k__A', 'p__B'], 'confidence': [1.0, 1.0, 0.9]}}
+        result = Compare().compare_placements(forward, reverse, 0.75, True, 'base',
+                                              table.pair_names(0, True),
+                                              table.pair_names(1, True))
+        self.assertEqual({'r_1': ['Root', 'k__A', 'p__B']}, result['trusted_placements'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.read_sampling import ReadSampling, AdaptiveSampling
+
+class Tests(unittest.TestCase):
+    def search(self, adaptive, hit_rates, total_reads):
+        '''Search a file as _search_and_align does, with the given rate of
+        hits for each round, returning the max_reads of each round'''
+        rounds = []
+        max_reads = adaptive.max_reads
+        while True:
+            rounds.append(max_reads)
+            seen = min(max_reads, total_reads)
+            hits = int(hit_rates[len(rounds)-1] * seen)
+            if adaptive.stop(max_reads, hits,
+                             ReadSampling(seen, seen, seen == total_reads)):
+                return rounds
+            max_reads = adaptive.max_reads
+
+    def test_paired_files_stop_together(self):
+        adaptive = AdaptiveSampling(2, 100, 0.1)
+        # The forward reads alone would stop after the second round, but the
+        # rate of the sample changes until the third
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            forward = executor.submit(self.search, adaptive, [0.1, 0.1, 0.1, 0.1], 10000)
+            reverse = executor.submit(self.search, adaptive, [0.1, 0.3, 0.3, 0.3], 10000)
+            self.assertEqual([100, 200, 400], forward.result(timeout=10))
+            self.assertEqual([100, 200, 400], reverse.result(timeout=10))
+
+    def test_stop_at_end_of_input(self):
+        adaptive = AdaptiveSampling(1, 100, 0.1)
+        self.assertEqual([100, 200], self.search(adaptive, [0.1, 0.5], 150))
+
+    def test_withdraw(self):
+        adaptive = AdaptiveSampling(2, 100, 0.1)
+        # The reverse reads were searched to 400 reads before resuming
+        adaptive.withdraw(ReadSampling(400, 400, False))
+        self.assertEqual([400], self.search(adaptive, [0.1], 10000))
+
+    def test_abort(self):
+        adaptive = AdaptiveSampling(2, 100, 0.1)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            forward = executor.submit(self.search, adaptive, [0.1], 10000)
+            adaptive.abort()
+            self.assertEqual([100], forward.result(timeout=10))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+import tempfile
+import tempdir
+import extern
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.scratch import ScratchDirectory
+from graftm.profiler import Profiler
+from graftm.graftm_output_paths import GraftMFiles
+
+class Tests(unittest.TestCase):
+    def test_scratch_directory(self):
+        with tempdir.TempDir() as parent:
+            previous = tempfile.tempdir
+            scratch = ScratchDirectory(parent)
+            self.assertEqual(parent, os.path.dirname(scratch.path))
+            try:
+                # The default directory of the tempfile module is unchanged
+                self.assertEqual(previous, tempfile.tempdir)
+                with tempfile.NamedTemporaryFile(dir=scratch.path) as f:
+                    f.write(b'a' * 100)
+                    f.flush()
+                    self.assertEqual(100, scratch.measure())
+                with open(os.path.join(scratch.path, 'b'), 'w') as f:
+                    f.write('b' * 10)
+                self.assertEqual(10, scratch.measure())
+            finally:
+                scratch.cleanup()
+            self.assertEqual(previous, tempfile.tempdir)
+            self.assertFalse(os.path.exists(scratch.path))
+            self.assertEqual({'directory': scratch.path,
+                              'peak_bytes': 100,
+                              'bytes_written': 110}, scratch.report())
+
+    def test_profiler_measures_scratch(self):
+        with tempdir.TempDir() as parent:
+            scratch = ScratchDirectory(parent)
+            profiler = Profiler(scratch)
+            profiler.install()
+            try:
+                stage = profiler.start_stage('search')
+                extern.run("head -c 1000 /dev/zero > %s/x" % scratch.path)
+                os.remove(os.path.join(scratch.path, 'x'))
+                profiler.end_stage(stage)
+            finally:
+                profiler.uninstall()
+                scratch.cleanup()
+            report = profiler.report()
+            self.assertEqual(1000, report['commands'][0]['scratch_bytes'])
+            self.assertEqual(0, report['stages'][0]['scratch_bytes'])
+            self.assertEqual(1000, report['scratch']['peak_bytes'])
+
+    def test_graftm_files_scratch_paths(self):
+        files = GraftMFiles('sample', 'out', False, 'scratch')
+        self.assertEqual(os.path.join('scratch', 'sample', 'sample_hits.fa'),
+                         files.fa_output_path('sample'))
+        self.assertEqual(os.path.join('scratch', 'sample', 'sample_hits.aln.fa'),
+                         files.aligned_fasta_output_path('sample'))
+        self.assertEqual(os.path.join('out', 'sample', 'sample_read_tax.tsv'),
+                         files.read_tax_output_path('sample'))
+        with tempdir.TempDir() as tmp:
+            forward_files = GraftMFiles('sample', os.path.join(tmp, 'out'), 'forward',
+                                        os.path.join(tmp, 'scratch'))
+            forward_files.make_scratch_directory('sample')
+            self.assertTrue(os.path.isdir(os.path.join(tmp, 'scratch', 'sample', 'forward')))
+        self.assertEqual(os.path.join('scratch', 'combined_alignment.aln.fa'),
+                         files.comb_aln_fa())
+        self.assertEqual(os.path.join('out', 'combined_alignment.aln.fa'),
+                         GraftMFiles('sample', 'out', False).comb_aln_fa())
+
+if __name__ == "__main__":
+    unittest.main()
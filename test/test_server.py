@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+import tempdir
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.run import Run
+from graftm.server import GraftClient, GraftServer, GraftServerException
+from graftm.resident_cache import ResidentCache
+
+path_to_script = os.path.join(os.path.dirname(os.path.realpath(__file__)),'..','bin','graftM')
+path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
+
+class Tests(unittest.TestCase):
+    def test_resident_cache(self):
+        with tempdir.TempDir() as tmp:
+            path = os.path.join(tmp, 'taxonomy')
+            with open(path, 'w') as f: f.write('a')
+            loads = []
+            def loader():
+                loads.append(1)
+                return len(loads)
+            cache = ResidentCache()
+            self.assertEqual(1, cache.get('kind', [path], loader))
+            self.assertEqual(2, cache.get('kind', [path], loader))
+            cache.enable()
+            self.assertEqual(3, cache.get('kind', [path], loader))
+            self.assertEqual(3, cache.get('kind', [path], loader))
+            self.assertEqual(4, cache.get('other', [path], loader))
+            with open(path, 'w') as f: f.write('changed')
+            self.assertEqual(5, cache.get('kind', [path], loader))
+
+    def test_client_without_server(self):
+        with tempdir.TempDir() as tmp:
+            with self.assertRaises(GraftServerException):
+                GraftClient(os.path.join(tmp, 'graftm.sock')).request({'request': 'status'})
+
+    def test_replace_broken_workers(self):
+        # Without preloading, which requires the graft programs
+        server = GraftServer.__new__(GraftServer)
+        server._max_workers = 1
+        server._executor_lock = threading.Lock()
+        server._start_executor()
+        try:
+            with tempdir.TempDir() as tmp:
+                for pid in list(server._executor._processes):
+                    os.kill(pid, signal.SIGKILL)
+                exit_status, _ = server._run_job(tmp, {'log': None})
+                self.assertEqual(1, exit_status)
+                # The arguments are incomplete, so the job fails in the worker
+                exit_status, error = server._run_job(tmp, {'log': None})
+                self.assertEqual(1, exit_status)
+                self.assertIn('AttributeError', error)
+        finally:
+            server._executor.shutdown()
+
+    def test_serve_and_client(self):
+        with tempdir.TempDir() as tmp:
+            # The programs graft requires need only be on the PATH, since the
+            # job submitted fails before they are run
+            bin_directory = os.path.join(tmp, 'bin')
+            os.mkdir(bin_directory)
+            for program in Run.GRAFT_PROGRAMS:
+                path = os.path.join(bin_directory, program)
+                with open(path, 'w') as f: f.write("#!/bin/sh\nexit 1\n")
+                os.chmod(path, 0o755)
+            env = dict(os.environ)
+            env['PATH'] = bin_directory + os.pathsep + env['PATH']
+
+            socket_path = os.path.join(tmp, 'graftm.sock')
+            gpkg = os.path.join(path_to_data, 'mcrA.gpkg')
+            server = subprocess.Popen([sys.executable, path_to_script, 'serve',
+                                       '--socket', socket_path, '--graftm_packages', gpkg,
+                                       '--verbosity', '2'],
+                                      env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                for _ in range(100):
+                    if os.path.exists(socket_path): break
+                    time.sleep(0.1)
+                status = GraftClient(socket_path).request({'request': 'status'})
+                self.assertEqual([os.path.abspath(gpkg)], status['graftm_packages'])
+                self.assertEqual(1, status['max_workers'])
+
+                process = subprocess.run([sys.executable, path_to_script, 'client',
+                                          '--socket', socket_path, 'graft',
+                                          '--graftm_package', gpkg,
+                                          '--forward', 'nonexistent.fa',
+                                          '--output_directory', os.path.join(tmp, 'out'),
+                                          '--verbosity', '2'],
+                                         cwd=tmp, env=env,
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                self.assertNotEqual(0, process.returncode)
+            finally:
+                server.terminate()
+                server.wait()
+            self.assertFalse(os.path.exists(socket_path))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+import json
+import tempdir
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.run import Run
+from graftm.merge import Merger, IncompleteShardsException
+
+class Tests(unittest.TestCase):
+    pairs = [['c.fa', 'c.2.fa'], ['a.fa', 'a.2.fa'], ['d.fq.gz', None], ['b.fa', 'b.2.fa']]
+
+    def test_shard_sequence_pairs(self):
+        self.assertEqual([['a.fa', 'a.2.fa'], ['c.fa', 'c.2.fa']],
+                         sorted(Run._shard_sequence_pairs(self.pairs, 0, 2, False)))
+        self.assertEqual([['b.fa', 'b.2.fa'], ['d.fq.gz', None]],
+                         sorted(Run._shard_sequence_pairs(self.pairs, 1, 2, False)))
+        # Independent of the order samples are given
+        self.assertEqual([['a.fa', 'a.2.fa'], ['c.fa', 'c.2.fa']],
+                         sorted(Run._shard_sequence_pairs(list(reversed(self.pairs)), 0, 2, False)))
+        self.assertEqual([], Run._shard_sequence_pairs(self.pairs, 4, 5, False))
+        with self.assertRaises(Exception):
+            Run._shard_sequence_pairs(self.pairs, 2, 2, False)
+
+    def write_shard(self, directory, index, count, samples, count_table=None, search_table=None):
+        os.mkdir(directory)
+        outputs = {}
+        if count_table:
+            with open(os.path.join(directory, 'combined_count_table.txt'), 'w') as f:
+                f.write(count_table)
+            outputs['combined_count_table'] = 'combined_count_table.txt'
+        if search_table:
+            with open(os.path.join(directory, 'search_otu_table.txt'), 'w') as f:
+                f.write(search_table)
+            outputs['search_otu_table'] = 'search_otu_table.txt'
+        with open(os.path.join(directory, 'shard_manifest.json'), 'w') as f:
+            json.dump({'shard_index': index, 'shard_count': count,
+                       'samples': samples, 'outputs': outputs}, f)
+
+    def test_merge_shards(self):
+        with tempdir.TempDir() as tmp:
+            shards = [os.path.join(tmp, 'shard%i' % i) for i in range(3)]
+            self.write_shard(shards[0], 0, 3, ['a'],
+                             "#ID\ta\tConsensusLineage\n1\t2\tRoot\n",
+                             "#ID\ta\n16S\t2\n")
+            self.write_shard(shards[1], 1, 3, ['b'],
+                             "#ID\tb\tConsensusLineage\n1\t1\tRoot; k__Archaea\n",
+                             "#ID\tb\n16S\t1\n")
+            self.write_shard(shards[2], 2, 3, [])
+            output = os.path.join(tmp, 'merged')
+            Merger().merge([shards[2], shards[1], shards[0]], output)
+            self.assertEqual("#ID\ta\tb\tConsensusLineage\n"
+                             "1\t2\t0\tRoot\n"
+                             "2\t0\t1\tRoot; k__Archaea\n",
+                             open(os.path.join(output, 'combined_count_table.txt')).read())
+            self.assertEqual("#ID\ta\tb\n16S\t2\t1\n",
+                             open(os.path.join(output, 'search_otu_table.txt')).read())
+
+    def test_merge_missing_shard(self):
+        with tempdir.TempDir() as tmp:
+            shard = os.path.join(tmp, 'shard0')
+            self.write_shard(shard, 0, 2, [])
+            with self.assertRaises(IncompleteShardsException):
+                Merger().merge([shard], os.path.join(tmp, 'merged'))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+import subprocess
+
+path_to_script = os.path.join(os.path.dirname(os.path.realpath(__file__)),'..','bin','graftM')
+
+class Tests(unittest.TestCase):
+    def imported_modules(self, arguments):
+        process = subprocess.run([sys.executable, '-X', 'importtime', path_to_script] + arguments,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        return set([line.split('|')[-1].strip().split('.')[0]
+                    for line in process.stderr.decode().splitlines()
+                    if line.startswith('import time:')])
+
+    def test_version_does_not_import_heavy_modules(self):
+        imported = self.imported_modules(['--version'])
+        for module in ['Bio', 'biom', 'dendropy', 'numpy', 'scipy']:
+            self.assertFalse(module in imported, module)
+
+    def test_archive_help_does_not_import_heavy_modules(self):
+        imported = self.imported_modules(['archive', '--help'])
+        for module in ['Bio', 'biom', 'dendropy', 'numpy', 'scipy']:
+            self.assertFalse(module in imported, module)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -31,6 +31,8 @@ import subprocess
 
 sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
 from graftm.summarise import Stats_And_Summary
+from graftm.taxonomy_registry import TaxonomyRegistry, SampleAssignments
+from graftm.read_sampling import ReadSampling
 
 class Tests(unittest.TestCase):
     def test_iterate_otu_table_rows_hello_world(self):
@@ -82,6 +84,24 @@ class Tests(unittest.TestCase):
             )
         )
 
+    def test_iterate_otu_table_rows_sample_assignments(self):
+        s = Stats_And_Summary()
+        registry = TaxonomyRegistry()
+        registry.intern(['unused'])
+        samples = [SampleAssignments.from_dict({'readname': ['ab','c'], 'readname23': ['ab','c']}, registry),
+                   SampleAssignments.from_dict({'readname2': ['ab','e']}, registry)]
+        self.assertEqual([(1, ['ab','c'], [2,0]), (2, ['ab','e'], [0,1])],
+                         list(s._iterate_otu_table_rows(samples)))
+
+    def test_otu_table(self):
+        s = Stats_And_Summary()
+        table = s.otu_table([{'readname': ['ab','c'], 'readname23': ['ab','c']},
+                             {},
+                             {'readname2': ['ab','e'], 'readname3': ['ab','c']}])
+        self.assertEqual([('ab','c'), ('ab','e')], table.lineages)
+        self.assertEqual([[2,0,1],[0,0,1]], table.counts.toarray().tolist())
+        self.assertIs(table, s.otu_table(table))
+
     def test_write_otu_table(self):
         string = io.StringIO()
         s = Stats_And_Summary()
@@ -93,6 +113,20 @@ class Tests(unittest.TestCase):
                                   string)
         self.assertEqual('#ID\tsample1\tsample2\tConsensusLineage\n1\t1\t1\tab; c\n', string.getvalue())
 
+    def test_write_count_estimates(self):
+        string = io.StringIO()
+        s = Stats_And_Summary()
+        table = s.otu_table([{'readname': ['ab','c'], 'readname2': ['ab','c']},
+                             {'readname3': ['ab','e']}])
+        s.write_count_estimates(('sample1','sample2'), table,
+                                [ReadSampling(100, 25, True, 0.25),
+                                 ReadSampling(10, 10, False)],
+                                string)
+        self.assertEqual('#ID\tsample\tcount\testimate\tlower_95\tupper_95\tConsensusLineage\n'
+                         '1\tsample1\t2\t8.0\t2.0\t17.6\tab; c\n'
+                         '2\tsample2\t1\t1.0\t1.0\t1.0\tab; e\n', string.getvalue())
+        self.assertEqual([[8,0],[0,1]], table.scaled([4.0, 1.0]).counts.toarray().tolist())
+
     def test_write_biom(self):
         with tempfile.NamedTemporaryFile(suffix='biom') as biom:
             with biom_open(biom.name,'w') as f:
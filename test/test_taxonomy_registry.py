@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+import numpy as np
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.taxonomy_registry import TaxonomyRegistry, SampleAssignments
+
+class Tests(unittest.TestCase):
+    def test_intern(self):
+        registry = TaxonomyRegistry()
+        self.assertEqual(0, registry.intern(['Root', 'k__Bacteria']))
+        self.assertEqual(1, registry.intern(['Root']))
+        self.assertEqual(0, registry.intern(('Root', 'k__Bacteria')))
+        self.assertEqual(('Root', 'k__Bacteria'), registry.lineage(0))
+        self.assertEqual(2, len(registry))
+
+    def test_sample_assignments(self):
+        registry = TaxonomyRegistry()
+        assignments = SampleAssignments.from_dict({'read1': ['Root', 'k__Archaea'],
+                                                   'read2': ['Root'],
+                                                   'read3': ['Root', 'k__Archaea']},
+                                                  registry)
+        self.assertEqual(3, len(assignments))
+        self.assertEqual(2, len(registry))
+        self.assertEqual(('Root', 'k__Archaea'), assignments['read3'])
+        self.assertEqual({'read1': ('Root', 'k__Archaea'),
+                          'read2': ('Root',),
+                          'read3': ('Root', 'k__Archaea')},
+                         dict(assignments.items()))
+        self.assertEqual([0, 1, 0], list(assignments.taxonomy_ids()))
+        with self.assertRaises(KeyError):
+            assignments['read4']
+
+    def test_empty_sample_assignments(self):
+        assignments = SampleAssignments(TaxonomyRegistry())
+        self.assertEqual(0, len(assignments))
+        self.assertEqual([], list(assignments.taxonomy_ids()))
+
+    def test_duplicate_read_names(self):
+        registry = TaxonomyRegistry()
+        assignments = SampleAssignments(registry)
+        assignments.add('read1', ['Root'])
+        assignments.add('read1', ['Root', 'k__Archaea'])
+        assignments.add_ids(['read2', 'read1', 'read2'], np.array([1, 0, 0]))
+        self.assertEqual(2, len(assignments))
+        self.assertEqual(['read1', 'read2'], list(assignments))
+        self.assertEqual([0, 0], list(assignments.taxonomy_ids()))
+        self.assertEqual(('Root',), assignments['read2'])
+
+    def test_add_while_taxonomy_ids_in_use(self):
+        assignments = SampleAssignments(TaxonomyRegistry())
+        assignments.add('read1', ['Root'])
+        taxonomy_ids = assignments.taxonomy_ids()
+        assignments.add('read2', ['Root'])
+        assignments.add_ids(['read3'], np.array([0]))
+        self.assertEqual([0], list(taxonomy_ids))
+        self.assertEqual(3, len(assignments.taxonomy_ids()))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -24,6 +24,9 @@
 import unittest
 import os
 import sys
+import extern
+import threading
+import tempdir
 
 sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
 from graftm.unpack_sequences import UnpackRawReads
@@ -41,6 +44,86 @@ class Tests(unittest.TestCase):
         urr = UnpackRawReads(None)
         self.assertEqual('aminoacid', urr._guess_sequence_type_from_string('P'*10+"*"))
 
+    def test_max_reads(self):
+        with tempdir.TempDir() as tmp:
+            reads = os.path.join(tmp, 'reads.fq')
+            with open(reads, 'w') as f:
+                for i in range(10):
+                    f.write("@read%i\nACGT\n+\nIIII\n" % i)
+            urr = UnpackRawReads(reads, max_reads=3,
+                                 sampling_path=os.path.join(tmp, 'sampling'))
+            self.assertEqual(">read0\nACGT\n>read1\nACGT\n>read2\nACGT\n",
+                             extern.run(urr.command_line()))
+            sampling = urr.sampling()
+            self.assertEqual([3, 3, False], [sampling.reads_seen, sampling.reads_kept, sampling.complete])
+
+            urr = UnpackRawReads(reads, max_reads=10,
+                                 sampling_path=os.path.join(tmp, 'sampling'))
+            self.assertEqual(10, extern.run(urr.command_line()).count('>'))
+            self.assertTrue(urr.sampling().complete)
+
+    def test_subsample_fraction(self):
+        with tempdir.TempDir() as tmp:
+            reads = os.path.join(tmp, 'reads.fa')
+            with open(reads, 'w') as f:
+                for i in range(1000):
+                    f.write(">read%i/1\nACGT\n>read%i/2\nACGT\n" % (i, i))
+            urr = UnpackRawReads(reads, None, True, subsample_fraction=0.2,
+                                 sampling_path=os.path.join(tmp, 'sampling'))
+            output = extern.run(urr.command_line())
+            names = [line[1:] for line in output.split("\n") if line.startswith('>')]
+            # Pairs are kept together, and the same reads are kept each time
+            self.assertEqual([n.replace('/1','/2') for n in names[0::2]], names[1::2])
+            self.assertEqual(output, extern.run(urr.command_line()))
+            sampling = urr.sampling()
+            self.assertEqual(2000, sampling.reads_seen)
+            self.assertEqual(len(names), sampling.reads_kept)
+            self.assertTrue(300 < sampling.reads_kept < 500)
+            self.assertEqual(5.0, sampling.scale())
+
+    def test_compressed_formats(self):
+        with tempdir.TempDir() as tmp:
+            fastq = os.path.join(tmp, 'reads.fq')
+            with open(fastq, 'w') as f:
+                f.write("@read1\nACGT\n+\nIIII\n@read2\nTTTT\n+\nIIII\n")
+            for extension, compressor in (('.gz', 'gzip'), ('.zst', 'zstd -q'),
+                                          ('.bz2', 'bzip2'), ('.xz', 'xz')):
+                program = compressor.split()[0]
+                if not extern.which(program): continue
+                extern.run("%s -c '%s' > '%s'" % (compressor, fastq, fastq+extension))
+                urr = UnpackRawReads(fastq+extension, threads=2)
+                self.assertEqual('reads', urr.basename())
+                self.assertEqual(">read1\nACGT\n>read2\nTTTT\n",
+                                 extern.run(urr.command_line()))
+
+    def test_named_pipe(self):
+        with tempdir.TempDir() as tmp:
+            fifo = os.path.join(tmp, 'reads')
+            os.mkfifo(fifo)
+            def write():
+                with open(fifo, 'w') as f:
+                    for i in range(3):
+                        f.write("@read%i\nACGT\n+\nIIII\n" % i)
+            writer = threading.Thread(target=write)
+            writer.start()
+
+            urr = UnpackRawReads(fifo, input_format='fastq')
+            self.assertTrue(urr.is_stream())
+            self.assertEqual('reads', urr.basename())
+            # The pipe is read once, and the reads unpacked each time after
+            self.assertEqual('nucleotide', urr.sequence_type())
+            expected = ">read0\nACGT\n>read1\nACGT\n>read2\nACGT\n"
+            self.assertEqual(expected, extern.run(urr.command_line()))
+            self.assertEqual(expected, extern.run(urr.command_line()))
+            writer.join()
+            # The spool is compressed
+            with open(urr._spool_path, 'rb') as f:
+                self.assertNotEqual(b'>', f.read(1))
+            urr.remove_spool()
+            self.assertFalse(os.path.exists(urr._spool_path))
+        self.assertFalse(UnpackRawReads.is_stream_path(__file__))
+        self.assertEqual('stdin', UnpackRawReads('-', input_format='fasta').basename())
+
 
 if __name__ == "__main__":
     unittest.main()